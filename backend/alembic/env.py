@@ -11,7 +11,7 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from database import Base
-from models import User, Conversation, Message, Response
+from models import User, Conversation, Message, Response, UserSession
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,31 @@
+"""Add messages.status for checkpointed streaming responses
+
+Revision ID: 002_message_status
+Revises: 001_initial
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '002_message_status'
+down_revision: Union[str, None] = '001_initial'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 'partial' while an assistant answer is still streaming, then 'complete'
+    op.add_column(
+        'messages',
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='complete')
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('messages') as batch_op:
+        batch_op.drop_column('status')
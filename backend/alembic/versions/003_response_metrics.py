@@ -0,0 +1,47 @@
+"""Add latency metrics to responses
+
+Revision ID: 003_response_metrics
+Revises: 002_message_status
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '003_response_metrics'
+down_revision: Union[str, None] = '002_message_status'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # batch mode so SQLite can relax message_id to nullable
+    with op.batch_alter_table('responses') as batch_op:
+        batch_op.alter_column('message_id', existing_type=sa.Integer(), nullable=True)
+        batch_op.add_column(sa.Column('usage_estimated', sa.Boolean(), nullable=False, server_default=sa.false()))
+        batch_op.add_column(sa.Column('ttft_ms', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('chunk_count', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('inter_chunk_p50_ms', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('inter_chunk_p95_ms', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('inter_chunk_p99_ms', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('streamed', sa.Boolean(), nullable=False, server_default=sa.true()))
+    op.create_index(op.f('ix_responses_model_used'), 'responses', ['model_used'], unique=False)
+    op.create_index(op.f('ix_responses_created_at'), 'responses', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_responses_created_at'), table_name='responses')
+    op.drop_index(op.f('ix_responses_model_used'), table_name='responses')
+    with op.batch_alter_table('responses') as batch_op:
+        batch_op.drop_column('streamed')
+        batch_op.drop_column('inter_chunk_p99_ms')
+        batch_op.drop_column('inter_chunk_p95_ms')
+        batch_op.drop_column('inter_chunk_p50_ms')
+        batch_op.drop_column('chunk_count')
+        batch_op.drop_column('ttft_ms')
+        batch_op.drop_column('usage_estimated')
+        batch_op.alter_column('message_id', existing_type=sa.Integer(), nullable=False)
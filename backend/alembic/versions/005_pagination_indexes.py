@@ -0,0 +1,31 @@
+"""Add composite indexes for keyset pagination
+
+Revision ID: 005_pagination_indexes
+Revises: 004_sessions
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '005_pagination_indexes'
+down_revision: Union[str, None] = '004_sessions'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_messages_conversation_id_created_at', 'messages', ['conversation_id', 'created_at'], unique=False
+    )
+    op.create_index(
+        'ix_conversations_user_id_updated_at', 'conversations', ['user_id', 'updated_at'], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_conversations_user_id_updated_at', table_name='conversations')
+    op.drop_index('ix_messages_conversation_id_created_at', table_name='messages')
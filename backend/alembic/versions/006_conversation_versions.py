@@ -0,0 +1,34 @@
+"""Add conversation version counters for conditional GETs
+
+Revision ID: 006_conversation_versions
+Revises: 005_pagination_indexes
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '006_conversation_versions'
+down_revision: Union[str, None] = '005_pagination_indexes'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Bumped by every write to the conversation or its messages (ETags, Last-Modified)
+    op.add_column(
+        'conversations',
+        sa.Column('version', sa.Integer(), nullable=False, server_default='1')
+    )
+    op.add_column('conversations', sa.Column('modified_at', sa.DateTime(), nullable=True))
+    op.execute('UPDATE conversations SET modified_at = updated_at')
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('conversations') as batch_op:
+        batch_op.drop_column('modified_at')
+        batch_op.drop_column('version')
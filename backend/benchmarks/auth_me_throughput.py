@@ -0,0 +1,91 @@
+"""
+Benchmark: GET /auth/me throughput with and without the user cache
+Runs entirely in-process against a throwaway SQLite database.
+
+Without the cache every request opens an async database session and loads
+the user row; with it, only the first request per user does.
+
+Usage (from the backend directory):
+    python benchmarks/auth_me_throughput.py --clients 50 --requests 5000
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+# Point both engines at a scratch database before the app modules load
+_db_path = os.path.join(tempfile.mkdtemp(), "bench_auth_me.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_path}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ["SESSION_BACKEND"] = "memory"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+import main
+from services.users import user_cache
+
+EMAIL = "bench@example.com"
+PASSWORD = "benchmark-password"
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run(client: httpx.AsyncClient, clients: int, requests: int):
+    """Issue `requests` GET /auth/me calls from `clients` concurrent workers."""
+    latencies = []
+    failures = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, failures
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            response = await client.get("/auth/me")
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(clients)))
+    return latencies, failures, time.perf_counter() - started
+
+
+def report(label, latencies, failures, elapsed):
+    print(
+        f"{label:<9} n={len(latencies):<6} errors={failures:<4} "
+        f"p50={percentile(latencies, 50):6.2f}ms "
+        f"p99={percentile(latencies, 99):6.2f}ms "
+        f"throughput={len(latencies) / elapsed:8.1f} req/s"
+    )
+
+
+async def main_async(clients: int, requests: int):
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await client.post("/auth/register", json={"name": "Bench", "email": EMAIL, "password": PASSWORD})
+            await client.get("/auth/me")  # warm-up
+
+            print(f"{clients} concurrent clients, {requests} requests each run\n")
+            user_cache.enabled = False
+            report("no cache", *await run(client, clients, requests))
+            user_cache.enabled = True
+            user_cache.clear()
+            await client.get("/auth/me")  # fill the cache
+            report("cache", *await run(client, clients, requests))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(main_async(args.clients, args.requests))
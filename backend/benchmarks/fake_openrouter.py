@@ -0,0 +1,173 @@
+"""
+Fake OpenRouter server for load tests
+Implements GET /models and POST /chat/completions (streaming and not) with
+the same response shapes as OpenRouter, so the backend can be driven without
+spending quota. Latency, output rate, chunk size and injected errors are
+configurable.
+
+Usage (from the backend directory):
+    python benchmarks/fake_openrouter.py --port 9001 --ttft-ms 300 --tokens-per-sec 80
+
+Then start the backend against it:
+    OPENROUTER_BASE_URL=http://127.0.0.1:9001 OPENROUTER_API_KEY=fake uvicorn main:app
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from typing import Any, AsyncIterator, Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Models listed by /models (all free, so the backend's model list shows them)
+MODELS = [
+    {"id": "fake/model-a", "name": "Fake Model A", "context_length": 8192},
+    {"id": "fake/model-b", "name": "Fake Model B", "context_length": 32768},
+]
+
+WORDS = (
+    "the quick brown fox jumps over a lazy dog while streaming tokens arrive "
+    "at a steady pace from the fake upstream model server"
+).split()
+
+# Defaults for every request; set from the command line or FAKE_* variables
+config: Dict[str, Any] = {
+    "ttft_ms": float(os.getenv("FAKE_TTFT_MS", 200)),
+    "ttft_jitter_ms": float(os.getenv("FAKE_TTFT_JITTER_MS", 50)),
+    "tokens_per_sec": float(os.getenv("FAKE_TOKENS_PER_SEC", 100)),
+    "chunk_tokens": int(os.getenv("FAKE_CHUNK_TOKENS", 1)),
+    "response_tokens": int(os.getenv("FAKE_RESPONSE_TOKENS", 200)),
+    "error_rate": float(os.getenv("FAKE_ERROR_RATE", 0)),
+    "rate_limit_rate": float(os.getenv("FAKE_RATE_LIMIT_RATE", 0)),
+    "retry_after": int(os.getenv("FAKE_RETRY_AFTER", 1)),
+}
+
+app = FastAPI(title="Fake OpenRouter")
+stats = {"requests": 0, "streams_active": 0, "errors": 0, "rate_limited": 0}
+
+
+def _chunk(content: str = "", **extra: Any) -> bytes:
+    payload = {"choices": [{"delta": {"content": content} if content else {}}], **extra}
+    return f"data: {json.dumps(payload)}\n\n".encode()
+
+
+def _usage(messages: list, completion_tokens: int) -> Dict[str, int]:
+    prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def _injected_error():
+    """429 or 500 response, at the configured rates."""
+    roll = random.random()
+    if roll < config["rate_limit_rate"]:
+        stats["rate_limited"] += 1
+        return JSONResponse(
+            status_code=429,
+            content={"error": {"message": "Rate limit exceeded", "code": 429}},
+            headers={"Retry-After": str(config["retry_after"])},
+        )
+    if roll < config["rate_limit_rate"] + config["error_rate"]:
+        stats["errors"] += 1
+        return JSONResponse(status_code=500, content={"error": {"message": "Injected failure", "code": 500}})
+    return None
+
+
+async def _first_token_delay() -> None:
+    jitter = random.uniform(-config["ttft_jitter_ms"], config["ttft_jitter_ms"])
+    await asyncio.sleep(max(0.0, config["ttft_ms"] + jitter) / 1000)
+
+
+async def _stream(messages: list, model: str) -> AsyncIterator[bytes]:
+    stats["streams_active"] += 1
+    try:
+        await _first_token_delay()
+        total = config["response_tokens"]
+        per_chunk = max(1, config["chunk_tokens"])
+        interval = per_chunk / config["tokens_per_sec"] if config["tokens_per_sec"] > 0 else 0
+        sent = 0
+        while sent < total:
+            count = min(per_chunk, total - sent)
+            text = "".join(f"{WORDS[(sent + i) % len(WORDS)]} " for i in range(count))
+            yield _chunk(text, model=model)
+            sent += count
+            if sent < total and interval:
+                await asyncio.sleep(interval)
+        yield _chunk(model=model, usage=_usage(messages, total))
+        yield b"data: [DONE]\n\n"
+    finally:
+        stats["streams_active"] -= 1
+
+
+@app.get("/models")
+async def list_models():
+    return {
+        "data": [
+            {**model, "pricing": {"prompt": "0", "completion": "0"}}
+            for model in MODELS
+        ]
+    }
+
+
+@app.post("/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    error = _injected_error()
+    if error is not None:
+        return error
+
+    messages = body.get("messages", [])
+    model = body.get("model", MODELS[0]["id"])
+    if body.get("stream"):
+        return StreamingResponse(_stream(messages, model), media_type="text/event-stream")
+
+    await _first_token_delay()
+    total = config["response_tokens"]
+    if config["tokens_per_sec"] > 0:
+        await asyncio.sleep(total / config["tokens_per_sec"])
+    content = "".join(f"{WORDS[i % len(WORDS)]} " for i in range(total))
+    return {
+        "id": f"gen-{time.time_ns()}",
+        "model": model,
+        "choices": [{"message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": _usage(messages, total),
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    """Requests served and injected failures (not part of the OpenRouter API)."""
+    return stats
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Command line options for every ``config`` key."""
+    parser.add_argument("--ttft-ms", type=float, default=config["ttft_ms"], help="delay before the first chunk")
+    parser.add_argument("--ttft-jitter-ms", type=float, default=config["ttft_jitter_ms"])
+    parser.add_argument("--tokens-per-sec", type=float, default=config["tokens_per_sec"], help="0 = no delay")
+    parser.add_argument("--chunk-tokens", type=int, default=config["chunk_tokens"], help="tokens per SSE chunk")
+    parser.add_argument("--response-tokens", type=int, default=config["response_tokens"])
+    parser.add_argument("--error-rate", type=float, default=config["error_rate"], help="fraction answered 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=config["rate_limit_rate"], help="fraction answered 429")
+    parser.add_argument("--retry-after", type=int, default=config["retry_after"], help="Retry-After of 429s")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    add_arguments(parser)
+    args = parser.parse_args()
+    config.update({key: getattr(args, key) for key in config})
+    print(f"Fake OpenRouter on http://{args.host}:{args.port} {json.dumps(config)}", file=sys.stderr)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
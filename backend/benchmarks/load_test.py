@@ -0,0 +1,355 @@
+"""
+Benchmark: end-to-end load test of the streaming chat path
+Starts benchmarks/fake_openrouter.py and the backend (uvicorn main:app) in
+subprocesses, then runs N conversations at once, each sending a message
+and streaming the answer ``--rounds`` times. Reports throughput, TTFT and
+end-to-end latency percentiles as the client sees them, and the backend's
+memory per concurrent stream (RSS from /proc, Linux). Results are saved as
+JSON; ``--compare`` prints the change against an earlier run.
+
+Usage (from the backend directory):
+    python benchmarks/load_test.py --conversations 100 --rounds 3 --output before.json
+    python benchmarks/load_test.py --conversations 100 --rounds 3 --output after.json --compare before.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from typing import Any, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import httpx
+
+from benchmarks import fake_openrouter
+from services.telemetry import percentile
+
+# Metrics shown by --compare: (path in the results, lower is better)
+COMPARED = [
+    ("throughput.streams_per_sec", False),
+    ("throughput.chars_per_sec", False),
+    ("ttft_ms.p50", True),
+    ("ttft_ms.p95", True),
+    ("ttft_ms.p99", True),
+    ("e2e_ms.p50", True),
+    ("e2e_ms.p95", True),
+    ("e2e_ms.p99", True),
+    ("memory.per_stream_kb", True),
+    ("errors.total", True),
+]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_kb(pid: int) -> int:
+    """Resident set size of a process, from /proc/<pid>/status."""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    rounded = lambda value: None if value is None else round(value, 1)
+    return {
+        "count": len(values),
+        "p50": rounded(percentile(values, 50)),
+        "p95": rounded(percentile(values, 95)),
+        "p99": rounded(percentile(values, 99)),
+        "max": rounded(max(values)) if values else None,
+    }
+
+
+async def wait_until_up(url: str, process: subprocess.Popen, log_path: str) -> None:
+    async with httpx.AsyncClient() as client:
+        for _ in range(200):
+            if process.poll() is not None:
+                raise RuntimeError(f"{url} exited during startup, see {log_path}")
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not start, see {log_path}")
+
+
+def start_process(args: List[str], env: Dict[str, str], log_path: str) -> subprocess.Popen:
+    log = open(log_path, "w")
+    return subprocess.Popen(args, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+class LoadRun:
+    """Client side of one run: drives the conversations and records timings."""
+
+    def __init__(self, model: str, rounds: int, ramp_seconds: float):
+        self.model = model
+        self.rounds = rounds
+        self.ramp_seconds = ramp_seconds
+        self.ttft_ms: List[float] = []
+        self.e2e_ms: List[float] = []
+        self.chars = 0
+        self.completed = 0
+        self.queued = 0
+        self.errors: Dict[str, int] = {}
+        self.active = 0
+        self.peak_active = 0
+
+    def error(self, kind: str) -> None:
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    async def conversation(self, client: httpx.AsyncClient, index: int, total: int) -> None:
+        if self.ramp_seconds:
+            await asyncio.sleep(self.ramp_seconds * index / total)
+        response = await client.post("/conversations", json={"default_model": self.model})
+        if response.status_code != 200:
+            self.error(f"create_{response.status_code}")
+            return
+        conversation_id = response.json()["id"]
+
+        for round_number in range(self.rounds):
+            response = await client.post(
+                f"/conversations/{conversation_id}/messages",
+                json={"message": f"Load test message {round_number} for {conversation_id}"},
+            )
+            if response.status_code != 200:
+                self.error(f"message_{response.status_code}")
+                continue
+            await self.stream(client, conversation_id)
+
+    async def stream(self, client: httpx.AsyncClient, conversation_id: str) -> None:
+        started = time.perf_counter()
+        first_token = None
+        finished = False
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+        try:
+            async with client.stream("GET", f"/conversations/{conversation_id}/stream") as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    self.error(f"stream_{response.status_code}")
+                    return
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    event = json.loads(line[6:])
+                    if "content" in event:
+                        if first_token is None:
+                            first_token = time.perf_counter()
+                        self.chars += len(event["content"])
+                    elif "queue_position" in event:
+                        self.queued += 1
+                    elif "error" in event:
+                        self.error("stream_error_event")
+                        return
+                    elif event.get("done"):
+                        finished = True
+        except httpx.HTTPError as e:
+            self.error(type(e).__name__)
+            return
+        finally:
+            self.active -= 1
+
+        if not finished:
+            self.error("stream_incomplete")
+            return
+        self.completed += 1
+        self.e2e_ms.append((time.perf_counter() - started) * 1000)
+        if first_token is not None:
+            self.ttft_ms.append((first_token - started) * 1000)
+
+
+async def sample_memory(pid: int, samples: List[int], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        samples.append(rss_kb(pid))
+        try:
+            await asyncio.wait_for(stop.wait(), 0.1)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_load(args, backend_url: str, backend_pid: int, upstream_url: str) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=args.conversations * 2 + 10)
+    async with httpx.AsyncClient(base_url=backend_url, limits=limits, timeout=args.timeout) as client:
+        # Warm up: model catalog, database, lazy imports
+        warmup = LoadRun(args.model, 1, 0)
+        await warmup.conversation(client, 0, 1)
+        baseline_kb = rss_kb(backend_pid)
+
+        run = LoadRun(args.model, args.rounds, args.ramp_seconds)
+        samples: List[int] = []
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_memory(backend_pid, samples, stop))
+        wall_start = time.perf_counter()
+        await asyncio.gather(*(run.conversation(client, i, args.conversations) for i in range(args.conversations)))
+        wall = time.perf_counter() - wall_start
+        stop.set()
+        await sampler
+
+    upstream_stats = None
+    async with httpx.AsyncClient() as client:
+        try:
+            upstream_stats = (await client.get(f"{upstream_url}/stats")).json()
+        except (httpx.HTTPError, ValueError):
+            pass
+
+    peak_kb = max(samples, default=baseline_kb)
+    return {
+        "throughput": {
+            "wall_seconds": round(wall, 2),
+            "streams_completed": run.completed,
+            "streams_per_sec": round(run.completed / wall, 2),
+            "chars_per_sec": round(run.chars / wall, 1),
+        },
+        "ttft_ms": summarize(run.ttft_ms),
+        "e2e_ms": summarize(run.e2e_ms),
+        "memory": {
+            "baseline_rss_mb": round(baseline_kb / 1024, 1),
+            "peak_rss_mb": round(peak_kb / 1024, 1),
+            "peak_concurrent_streams": run.peak_active,
+            "per_stream_kb": round((peak_kb - baseline_kb) / max(run.peak_active, 1), 1),
+        },
+        "errors": {"total": sum(run.errors.values()), **run.errors},
+        "queue_position_events": run.queued,
+        "upstream": upstream_stats,
+    }
+
+
+def lookup(results: Dict[str, Any], path: str) -> Optional[float]:
+    value: Any = results
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def print_results(results: Dict[str, Any]) -> None:
+    throughput, ttft, e2e, memory = results["throughput"], results["ttft_ms"], results["e2e_ms"], results["memory"]
+    print(
+        f"streams={throughput['streams_completed']:<6} errors={results['errors']['total']:<4} "
+        f"wall={throughput['wall_seconds']:6.2f}s streams/s={throughput['streams_per_sec']:7.2f} "
+        f"chars/s={throughput['chars_per_sec']:9.1f}"
+    )
+    print(f"ttft  p50={ttft['p50']}ms p95={ttft['p95']}ms p99={ttft['p99']}ms")
+    print(f"e2e   p50={e2e['p50']}ms p95={e2e['p95']}ms p99={e2e['p99']}ms")
+    print(
+        f"rss   baseline={memory['baseline_rss_mb']}MB peak={memory['peak_rss_mb']}MB "
+        f"per stream={memory['per_stream_kb']}KB ({memory['peak_concurrent_streams']} concurrent)"
+    )
+    if results["errors"]["total"]:
+        print(f"errors {json.dumps(results['errors'])}")
+
+
+def print_comparison(previous: Dict[str, Any], current: Dict[str, Any]) -> None:
+    print(f"\ncompared with {previous.get('label') or previous.get('started_at')}:")
+    for path, lower_is_better in COMPARED:
+        old, new = lookup(previous["results"], path), lookup(current["results"], path)
+        if old is None or new is None:
+            continue
+        change = f"{(new - old) / old * 100:+7.1f}%" if old else "      -"
+        better = (new < old) if lower_is_better else (new > old)
+        mark = "" if new == old else ("better" if better else "worse")
+        print(f"  {path:<28} {old:>10} -> {new:<10} {change} {mark}")
+
+
+async def main_async(args) -> None:
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    env = dict(os.environ)
+
+    upstream_url = args.upstream_url
+    processes = []
+    try:
+        if upstream_url is None:
+            port = free_port()
+            upstream_url = f"http://127.0.0.1:{port}"
+            fake_args = [
+                sys.executable, "benchmarks/fake_openrouter.py", "--port", str(port),
+                "--ttft-ms", str(args.ttft_ms), "--ttft-jitter-ms", str(args.ttft_jitter_ms),
+                "--tokens-per-sec", str(args.tokens_per_sec), "--chunk-tokens", str(args.chunk_tokens),
+                "--response-tokens", str(args.response_tokens), "--error-rate", str(args.error_rate),
+                "--rate-limit-rate", str(args.rate_limit_rate), "--retry-after", str(args.retry_after),
+            ]
+            log_path = os.path.join(workdir, "fake_openrouter.log")
+            processes.append(start_process(fake_args, env, log_path))
+            await wait_until_up(f"{upstream_url}/models", processes[-1], log_path)
+
+        backend_port = free_port()
+        backend_url = f"http://127.0.0.1:{backend_port}"
+        backend_env = {
+            **env,
+            "OPENROUTER_BASE_URL": upstream_url,
+            "OPENROUTER_API_KEY": env.get("OPENROUTER_API_KEY") if args.upstream_url else "fake",
+            "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'load_test.db')}",
+        }
+        backend_env.pop("ASYNC_DATABASE_URL", None)
+        for item in args.app_env:
+            key, _, value = item.partition("=")
+            backend_env[key] = value
+        log_path = os.path.join(workdir, "backend.log")
+        processes.append(start_process(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(backend_port), "--log-level", "warning"],
+            backend_env, log_path,
+        ))
+        await wait_until_up(f"{backend_url}/health", processes[-1], log_path)
+
+        print(
+            f"{args.conversations} conversations x {args.rounds} rounds, model {args.model}, "
+            f"upstream {upstream_url} (logs in {workdir})\n"
+        )
+        started_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+        results = await run_load(args, backend_url, processes[-1].pid, upstream_url)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+
+    report = {
+        "label": args.label,
+        "started_at": started_at,
+        "python": platform.python_version(),
+        "settings": {
+            "conversations": args.conversations,
+            "rounds": args.rounds,
+            "model": args.model,
+            "ramp_seconds": args.ramp_seconds,
+            "upstream": args.upstream_url or {key: getattr(args, key) for key in fake_openrouter.config},
+            "app_env": args.app_env,
+        },
+        "results": results,
+    }
+    print_results(results)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nsaved {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), report)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--conversations", type=int, default=50, help="conversations running at once")
+    parser.add_argument("--rounds", type=int, default=3, help="messages streamed per conversation")
+    parser.add_argument("--model", default=fake_openrouter.MODELS[0]["id"])
+    parser.add_argument("--ramp-seconds", type=float, default=0.0, help="spread conversation starts over this long")
+    parser.add_argument("--timeout", type=float, default=120.0, help="client timeout per request")
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra backend environment, e.g. ADMISSION_MODEL_CONCURRENCY=0")
+    parser.add_argument("--upstream-url", help="use a running upstream instead of starting the fake one")
+    parser.add_argument("--label", help="name stored with the results")
+    parser.add_argument("--output", default="load_test.json", help="where to save the results")
+    parser.add_argument("--compare", help="results of an earlier run to compare with")
+    fake_openrouter.add_arguments(parser)
+    asyncio.run(main_async(parser.parse_args()))
@@ -0,0 +1,120 @@
+"""
+Benchmark: p99 login latency at high concurrency, sync vs async handlers
+Runs entirely in-process against a throwaway SQLite database.
+
+With sync handlers every request holds an AnyIO worker thread while it waits
+for a pooled connection, and the session teardown that would return that
+connection also needs a worker thread. Past ~40 concurrent requests this can
+stall until SQLAlchemy's 30s pool timeout, which shows up as errors here.
+
+Usage (from the backend directory):
+    python benchmarks/login_latency.py --clients 200 --rounds 2
+"""
+import os
+import sys
+import time
+import asyncio
+import secrets
+import argparse
+import tempfile
+
+# Point both engines at a scratch database before the app modules load
+_db_path = os.path.join(tempfile.mkdtemp(), "bench_login.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_path}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import Depends, FastAPI, HTTPException, Response
+from sqlalchemy.orm import Session
+
+import main
+from database import get_db, init_db
+from models import User
+
+EMAIL = "bench@example.com"
+PASSWORD = "benchmark-password"
+
+
+def build_sync_app() -> FastAPI:
+    """The login handler as it was before the async port: sync def + SessionLocal."""
+    app = FastAPI()
+
+    @app.post("/auth/login", response_model=main.UserRead)
+    def login_user(payload: main.UserLogin, response: Response, db: Session = Depends(get_db)):
+        user = db.query(User).filter(User.email == payload.email).first()
+        if not user or not main.verify_password(payload.password, user.hashed_password):
+            raise HTTPException(status_code=401, detail="Invalid email or password")
+        # Session storage is not what is measured here (and is async now)
+        token = secrets.token_urlsafe(32)
+        response.set_cookie(key=main.SESSION_COOKIE_NAME, value=token, httponly=True)
+        return user
+
+    return app
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run(app, clients: int, rounds: int):
+    """
+    Fire `clients` concurrent logins, `rounds` times.
+
+    Returns latencies in ms (failed requests count with the time they took to
+    fail), the number of failures and the wall-clock time.
+    """
+    latencies = []
+    failures = 0
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+        async def login():
+            nonlocal failures
+            started = time.perf_counter()
+            try:
+                response = await client.post("/auth/login", json={"email": EMAIL, "password": PASSWORD})
+                ok = response.status_code == 200
+            except Exception:
+                ok = False
+            latencies.append((time.perf_counter() - started) * 1000)
+            if not ok:
+                failures += 1
+
+        await login()  # warm-up
+        latencies.clear()
+        started = time.perf_counter()
+        for _ in range(rounds):
+            await asyncio.gather(*(login() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+    return latencies, failures, elapsed
+
+
+def report(label, latencies, failures, elapsed):
+    print(
+        f"{label:<8} n={len(latencies):<5} errors={failures:<4} "
+        f"p50={percentile(latencies, 50):7.1f}ms "
+        f"p95={percentile(latencies, 95):7.1f}ms "
+        f"p99={percentile(latencies, 99):7.1f}ms "
+        f"throughput={len(latencies) / elapsed:7.1f} req/s"
+    )
+
+
+async def main_async(clients: int, rounds: int):
+    init_db()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as client:
+        await client.post("/auth/register", json={"name": "Bench", "email": EMAIL, "password": PASSWORD})
+
+    print(f"{clients} concurrent clients x {rounds} rounds\n")
+    report("before", *await run(build_sync_app(), clients, rounds))
+    report("after", *await run(main.app, clients, rounds))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=2)
+    args = parser.parse_args()
+    asyncio.run(main_async(args.clients, args.rounds))
@@ -0,0 +1,175 @@
+"""
+Benchmark: read throughput during sustained writes, stock SQLite vs the production profile
+Each run uses a fresh SQLite file. Background writers keep the database busy
+the way streaming completions (checkpoint updates through ChatStore) and
+logins (session inserts on their own connection) do, while reader tasks page
+through conversation lists and message histories.
+
+- default:    one engine, stock settings (rollback journal), as before
+- production: WAL + pragmas, single writer connection, read-only reader pool
+
+Usage (from the backend directory):
+    python benchmarks/sqlite_concurrency.py --seconds 10 --streams 20 --readers 8
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, make_engine, SQLITE_READER_POOL_SIZE
+from models import User, UserSession
+from services.storage import ChatStore
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def build_store(url: str, profile: str) -> tuple:
+    """Engines and a ChatStore wired the way each profile runs in the app."""
+    if profile == "default":
+        engine = make_engine(url, profile="default")
+        factory = sessionmaker(autoflush=False, bind=engine)
+        return engine, ChatStore(session_factory=factory, read_session_factory=factory)
+    engine = make_engine(url, profile="production")
+    writer = make_engine(url, profile="production", pool_size=1, max_overflow=0)
+    reader = make_engine(
+        url, profile="production", read_only=True, pool_size=SQLITE_READER_POOL_SIZE, max_overflow=0
+    )
+    return engine, ChatStore(
+        session_factory=sessionmaker(autoflush=False, bind=writer),
+        read_session_factory=sessionmaker(autoflush=False, bind=reader),
+    )
+
+
+def login_writer(engine, stop: threading.Event, counters: dict) -> None:
+    """Session inserts on a separate connection, like concurrent logins."""
+    while not stop.is_set():
+        try:
+            with engine.begin() as connection:
+                connection.execute(insert(UserSession).values(
+                    token_hash=uuid4().hex + uuid4().hex,
+                    user_id=1,
+                    expires_at=datetime.utcnow() + timedelta(days=1),
+                ))
+            counters["logins"] += 1
+        except OperationalError:
+            counters["login_errors"] += 1
+        time.sleep(0.002)
+
+
+async def run(profile: str, args) -> None:
+    path = os.path.join(tempfile.mkdtemp(), f"bench_{profile}.db")
+    url = f"sqlite:///{path}"
+    engine, store = build_store(url, profile)
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(User).values(id=1, name="Bench", email="bench@example.com", hashed_password="x"))
+    await store.start()
+
+    # Seed history to read
+    conversation_ids = []
+    now = datetime.now()
+    for i in range(args.conversations):
+        conversation_id = str(uuid4())
+        conversation_ids.append(conversation_id)
+        await store.create_conversation({
+            "id": conversation_id, "default_model": "bench/model", "created_at": now, "updated_at": now,
+        })
+        for j in range(args.messages):
+            await store.add_message(conversation_id, {
+                "id": str(uuid4()), "role": "user" if j % 2 == 0 else "assistant",
+                "content": "lorem ipsum " * 40, "model": None, "status": "complete",
+                "timestamp": datetime.now(),
+            })
+    await store.flush()
+
+    stop = asyncio.Event()
+    counters = {"reads": 0, "read_errors": 0, "writes": 0, "logins": 0, "login_errors": 0}
+    latencies = []
+
+    async def stream_writer():
+        """A streaming answer: add the message, then checkpoint it every few ms."""
+        while not stop.is_set():
+            conversation_id = random.choice(conversation_ids)
+            message_id = str(uuid4())
+            await store.add_message(conversation_id, {
+                "id": message_id, "role": "assistant", "content": "", "model": "bench/model",
+                "status": "partial", "timestamp": datetime.now(),
+            })
+            content = ""
+            for _ in range(20):
+                if stop.is_set():
+                    break
+                content += "token " * 10
+                await store.update_message(conversation_id, message_id, content=content, status="partial")
+                counters["writes"] += 1
+                await asyncio.sleep(0.01)
+
+    async def reader():
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                if random.random() < 0.5:
+                    await store.list_conversations(50)
+                else:
+                    await store.get_message_page(random.choice(conversation_ids), 100)
+                counters["reads"] += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+            except OperationalError:
+                counters["read_errors"] += 1
+
+    login_stop = threading.Event()
+    login_thread = threading.Thread(target=login_writer, args=(engine, login_stop, counters))
+    login_thread.start()
+    tasks = [asyncio.create_task(stream_writer()) for _ in range(args.streams)]
+    tasks += [asyncio.create_task(reader()) for _ in range(args.readers)]
+    await asyncio.sleep(args.seconds)
+    stop.set()
+    login_stop.set()
+    await asyncio.gather(*tasks)
+    login_thread.join()
+    await store.stop()
+
+    print(
+        f"{profile:<11} reads/s={counters['reads'] / args.seconds:8.1f} "
+        f"read p50={percentile(latencies, 50):7.1f}ms p99={percentile(latencies, 99):7.1f}ms "
+        f"read errors={counters['read_errors']:<4} "
+        f"checkpoint writes/s={counters['writes'] / args.seconds:7.1f} "
+        f"logins/s={counters['logins'] / args.seconds:6.1f} login errors={counters['login_errors']}"
+    )
+
+
+async def main_async(args):
+    print(
+        f"{args.seconds}s, {args.streams} streaming writers, 1 login writer, {args.readers} readers, "
+        f"{args.conversations} conversations x {args.messages} messages\n"
+    )
+    for profile in ("default", "production"):
+        await run(profile, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--streams", type=int, default=20)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=50)
+    asyncio.run(main_async(parser.parse_args()))
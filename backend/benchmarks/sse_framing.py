@@ -0,0 +1,131 @@
+"""
+Benchmark: SSE framing cost per stream, per-delta json.dumps vs coalesced frames
+Starts a uvicorn server in a subprocess whose endpoints emit the same fake
+upstream deltas, framed either the old way (one json.dumps frame per delta)
+or through services.sse (coalesced, orjson). Reports frames/sec and the
+server's CPU time per stream, read from /proc (Linux).
+
+Usage (from the backend directory):
+    python benchmarks/sse_framing.py --streams 200 --deltas 400 --interval-ms 2
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+from services.sse import coalesce, sse_event, orjson
+
+app = FastAPI()
+
+
+async def upstream(deltas: int, interval: float):
+    """Fake model output: 1-2 character deltas at a steady rate."""
+    for i in range(deltas):
+        await asyncio.sleep(interval)
+        yield "a" if i % 2 else "bc"
+
+
+@app.get("/legacy")
+async def legacy(deltas: int, interval: float):
+    async def events():
+        async for chunk in upstream(deltas, interval):
+            yield f"data: {json.dumps({'content': chunk})}\n\n"
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/coalesced")
+async def coalesced(deltas: int, interval: float, max_bytes: int, max_ms: float):
+    async def events():
+        async for chunk in coalesce(upstream(deltas, interval), max_bytes, max_ms):
+            yield sse_event({"content": chunk})
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def process_cpu_seconds(pid: int) -> float:
+    """utime + stime of a process, from /proc/<pid>/stat."""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run(label: str, url: str, params: dict, streams: int, server_pid: int):
+    counters = {"frames": 0, "bytes": 0}
+    limits = httpx.Limits(max_connections=streams)
+    async with httpx.AsyncClient(limits=limits, timeout=None) as client:
+
+        async def consume():
+            async with client.stream("GET", url, params=params) as response:
+                async for raw in response.aiter_raw():
+                    counters["frames"] += raw.count(b"data: ")
+                    counters["bytes"] += len(raw)
+
+        cpu_start = process_cpu_seconds(server_pid)
+        wall_start = time.perf_counter()
+        await asyncio.gather(*(consume() for _ in range(streams)))
+        wall = time.perf_counter() - wall_start
+        cpu = process_cpu_seconds(server_pid) - cpu_start
+
+    print(
+        f"{label:<10} frames={counters['frames']:<7} "
+        f"frames/sec={counters['frames'] / wall:9.0f} "
+        f"bytes={counters['bytes']:<8} "
+        f"server cpu/stream={cpu / streams * 1000:7.2f}ms "
+        f"wall={wall:5.2f}s"
+    )
+
+
+async def main_async(args):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.sse_framing:app",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        async with httpx.AsyncClient() as client:
+            for _ in range(100):
+                try:
+                    await client.get(f"{base}/docs")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+
+        interval = args.interval_ms / 1000
+        print(
+            f"{args.streams} streams x {args.deltas} deltas every {args.interval_ms}ms "
+            f"(window: {args.max_bytes} chars / {args.max_ms}ms, orjson={'yes' if orjson else 'no'})\n"
+        )
+        params = {"deltas": args.deltas, "interval": interval}
+        await run("per-delta", f"{base}/legacy", params, args.streams, server.pid)
+        params.update({"max_bytes": args.max_bytes, "max_ms": args.max_ms})
+        await run("coalesced", f"{base}/coalesced", params, args.streams, server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--streams", type=int, default=200)
+    parser.add_argument("--deltas", type=int, default=400)
+    parser.add_argument("--interval-ms", type=float, default=2.0)
+    parser.add_argument("--max-bytes", type=int, default=512)
+    parser.add_argument("--max-ms", type=float, default=30.0)
+    asyncio.run(main_async(parser.parse_args()))
@@ -0,0 +1,140 @@
+"""
+Benchmark: upstream SSE parsing, aiter_lines + json.loads vs the byte-level parser
+Replays recorded OpenRouter streams (benchmarks/fixtures/*.sse) through an
+httpx response and times the loop of ``_stream_completion`` as it was
+(text lines, ``json.loads`` of every chunk, an unguarded ``logger.debug``)
+against ``services.sse_parser``. The stream is cut into pieces the way
+network reads would deliver it: one event per read, or larger reads.
+
+Usage (from the backend directory):
+    python benchmarks/sse_parsing.py --repeat 200
+"""
+import os
+import sys
+import glob
+import json
+import time
+import asyncio
+import logging
+import argparse
+from typing import AsyncIterator, Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from services.sse_parser import SSEParser, is_done, parse_completion_chunk, orjson
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+logger = logging.getLogger("bench")
+logger.setLevel(logging.INFO)
+
+
+class ReplayStream(httpx.AsyncByteStream):
+    def __init__(self, pieces: List[bytes]):
+        self.pieces = pieces
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for piece in self.pieces:
+            yield piece
+
+
+def split_events(raw: bytes) -> List[bytes]:
+    """One piece per event, as a slow upstream delivers them."""
+    return [part + b"\n\n" for part in raw.split(b"\n\n") if part]
+
+
+def split_fixed(raw: bytes, size: int) -> List[bytes]:
+    return [raw[i:i + size] for i in range(0, len(raw), size)]
+
+
+def response_for(pieces: List[bytes]) -> httpx.Response:
+    return httpx.Response(200, stream=ReplayStream(pieces), headers={"content-type": "text/event-stream"})
+
+
+async def legacy(response: httpx.Response) -> List[str]:
+    """The parsing loop of _stream_completion before services.sse_parser."""
+    out = []
+    chunk_count = 0
+    async for line in response.aiter_lines():
+        if not line.strip():
+            continue
+        if line.startswith("data: "):
+            data = line[6:]
+            if data == "[DONE]":
+                break
+            try:
+                chunk_data = json.loads(data)
+                if chunk_data.get("usage"):
+                    pass
+                if not chunk_data.get("choices"):
+                    continue
+                delta = chunk_data.get("choices", [{}])[0].get("delta", {})
+                content = delta.get("content", "")
+                if content:
+                    chunk_count += 1
+                    logger.debug(f"Yielding chunk {chunk_count}: {len(content)} chars")
+                    out.append(content)
+            except json.JSONDecodeError:
+                continue
+    return out
+
+
+async def byte_parser(response: httpx.Response) -> List[str]:
+    """The parsing loop of _stream_completion with services.sse_parser."""
+    out = []
+    chunk_count = 0
+    debug = logger.isEnabledFor(logging.DEBUG)
+    parser = SSEParser()
+    async for raw in response.aiter_bytes():
+        for event in parser.feed(raw):
+            if is_done(event.data):
+                return out
+            try:
+                content, usage = parse_completion_chunk(event.data)
+            except ValueError:
+                continue
+            if content:
+                chunk_count += 1
+                if debug:
+                    logger.debug(f"Yielding chunk {chunk_count}: {len(content)} chars")
+                out.append(content)
+    return out
+
+
+async def measure(parse: Callable, pieces: List[bytes], repeat: int) -> float:
+    """CPU seconds per stream (best of 3 rounds)."""
+    best = float("inf")
+    for _ in range(3):
+        start = time.process_time()
+        for _ in range(repeat):
+            await parse(response_for(pieces))
+        best = min(best, (time.process_time() - start) / repeat)
+    return best
+
+
+async def main_async(args) -> None:
+    print(f"json backend for the byte parser: {'orjson' if orjson else 'json'}\n")
+    for path in sorted(glob.glob(os.path.join(FIXTURES, "*.sse"))):
+        with open(path, "rb") as f:
+            raw = f.read()
+        splits = {"per event": split_events(raw), f"{args.read_size}B reads": split_fixed(raw, args.read_size)}
+        for label, pieces in splits.items():
+            expected = await legacy(response_for(pieces))
+            assert await byte_parser(response_for(pieces)) == expected, "parsers disagree"
+            before = await measure(legacy, pieces, args.repeat)
+            after = await measure(byte_parser, pieces, args.repeat)
+            print(
+                f"{os.path.basename(path)} ({len(expected)} chunks, {label:<12}) "
+                f"aiter_lines+json={before * 1e6:8.0f}us  byte parser={after * 1e6:8.0f}us  "
+                f"speedup={before / after:4.2f}x  per chunk {before / len(expected) * 1e6:5.1f}us -> "
+                f"{after / len(expected) * 1e6:5.1f}us"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=200, help="streams parsed per round")
+    parser.add_argument("--read-size", type=int, default=16384, help="bytes per read for the second split")
+    asyncio.run(main_async(parser.parse_args()))
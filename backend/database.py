@@ -2,7 +2,13 @@
 Database configuration and session management
 """
 import os
-from sqlalchemy import create_engine
+import time
+from typing import List, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
@@ -16,19 +22,134 @@ DATABASE_URL = os.getenv(
     "sqlite:///./chat_app.db"
 )
 
-# Create SQLAlchemy engine
-# For SQLite, we need check_same_thread=False to allow multiple threads
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+# SQLite tuning. "production" turns on WAL, relaxed fsync, a busy timeout,
+# memory-mapped I/O and a larger page cache on every connection; "default"
+# leaves SQLite's stock settings.
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "production")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", 64 * 1024))
+# Read-only connections used for list/history queries
+SQLITE_READER_POOL_SIZE = int(os.getenv("SQLITE_READER_POOL_SIZE", 4))
+
+
+def sqlite_pragmas(read_only: bool = False) -> List[str]:
+    """PRAGMA statements of the production SQLite profile for one connection."""
+    pragmas = [
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only=ON")
+    else:
+        # Persistent in the database file; readers inherit it
+        pragmas.insert(0, "PRAGMA journal_mode=WAL")
+    return pragmas
+
+
+def apply_sqlite_profile(engine: Engine, read_only: bool = False) -> None:
+    """Run the profile's PRAGMAs on every new connection of an engine."""
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in sqlite_pragmas(read_only):
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def _is_memory_database(url: str) -> bool:
+    return url in ("sqlite://", "sqlite:///") or ":memory:" in url or "mode=memory" in url
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args=connect_args,
-    echo=False  # Set to True to see SQL queries in logs
-)
+
+def make_engine(
+    url: str,
+    read_only: bool = False,
+    profile: Optional[str] = None,
+    **kwargs,
+) -> Engine:
+    """
+    Create a sync engine, applying the SQLite profile when the URL is SQLite.
+
+    Args:
+        url: Database URL
+        read_only: Make every connection read-only (SQLite query_only)
+        profile: 'production' or 'default' (defaults to SQLITE_PROFILE)
+        **kwargs: Passed on to create_engine (pool settings, ...)
+
+    Returns:
+        Engine: The configured engine
+    """
+    if url.startswith("sqlite"):
+        # For SQLite, we need check_same_thread=False to allow multiple threads
+        kwargs.setdefault("connect_args", {"check_same_thread": False})
+    new_engine = create_engine(url, echo=False, **kwargs)  # echo=True to see SQL queries in logs
+    if url.startswith("sqlite") and (profile or SQLITE_PROFILE) == "production":
+        apply_sqlite_profile(new_engine, read_only=read_only)
+    return new_engine
+
+
+# Create SQLAlchemy engine
+engine = make_engine(DATABASE_URL)
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# SQLite allows one writer at a time. Background writes (services/storage.py)
+# go through a single dedicated connection, and history/list reads through a
+# pool of read-only connections that WAL lets run alongside the writer.
+# Other databases (and in-memory SQLite) use the main engine for both.
+if IS_SQLITE and not _is_memory_database(DATABASE_URL):
+    writer_engine = make_engine(DATABASE_URL, pool_size=1, max_overflow=0)
+    reader_engine = make_engine(
+        DATABASE_URL, read_only=True, pool_size=SQLITE_READER_POOL_SIZE, max_overflow=0
+    )
+else:
+    writer_engine = reader_engine = engine
+
+WriterSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=writer_engine)
+ReaderSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=reader_engine)
+
+
+def to_async_url(url: str) -> str:
+    """
+    Map a sync database URL to its asyncio driver.
+
+    sqlite:// -> sqlite+aiosqlite://, postgresql:// -> postgresql+asyncpg://,
+    mysql:// -> mysql+aiomysql://. URLs that already name a driver are kept.
+    """
+    drivers = {
+        "sqlite://": "sqlite+aiosqlite://",
+        "postgresql://": "postgresql+asyncpg://",
+        "mysql://": "mysql+aiomysql://",
+    }
+    for prefix, async_prefix in drivers.items():
+        if url.startswith(prefix):
+            return async_prefix + url[len(prefix):]
+    return url
+
+
+# Async engine for request handlers that should not hold a threadpool slot
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", to_async_url(DATABASE_URL))
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    echo=False
+)
+if ASYNC_DATABASE_URL.startswith("sqlite") and SQLITE_PROFILE == "production":
+    apply_sqlite_profile(async_engine.sync_engine)
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
 # Create Base class for models
 Base = declarative_base()
 
@@ -51,11 +172,41 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """
+    Async dependency function to get a database session.
+    Runs on the event loop instead of taking an AnyIO threadpool slot.
+    
+    Usage in FastAPI:
+        @app.get("/items")
+        async def read_items(db: AsyncSession = Depends(get_async_db)):
+            result = await db.execute(select(Item))
+            return result.scalars().all()
+    """
+    # Imported here because the services package imports this module
+    from services.metrics import DB_SESSION_WAIT
+
+    async with AsyncSessionLocal() as db:
+        start = time.perf_counter()
+        await db.connection()
+        DB_SESSION_WAIT.observe(time.perf_counter() - start, engine="async")
+        yield db
+
+
 def init_db():
     """
     Initialize the database by creating all tables.
     This is useful for development and testing.
     In production, use Alembic migrations instead.
+    
+    Several worker processes may start at once; if another one creates a
+    table between our existence check and CREATE TABLE, try again.
     """
-    from models import User, Conversation, Message, Response
-    Base.metadata.create_all(bind=engine)
+    from models import User, Conversation, Message, Response, UserSession
+    for attempt in range(3):
+        try:
+            Base.metadata.create_all(bind=engine)
+            return
+        except OperationalError as e:
+            if "already exists" not in str(e) or attempt == 2:
+                raise
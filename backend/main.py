@@ -3,26 +3,58 @@ FastAPI backend for Open Chat with API Integration
 Advanced conversation management with OpenRouter streaming support
 """
 import os
+import time
 import logging
-from datetime import datetime
-from typing import Dict, List, Optional
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
 from uuid import uuid4
 
-from fastapi import FastAPI, HTTPException, Request, Depends, Response, Cookie
+from fastapi import FastAPI, HTTPException, Request, Depends, Response, Cookie, Query, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel, Field, EmailStr
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field, EmailStr, TypeAdapter, ValidationError
 from dotenv import load_dotenv
 import httpx
-import json
 import hashlib
+import json
 
-from sqlalchemy.orm import Session
-from database import get_db, init_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import async_engine, get_async_db, init_db
 from models import User
 
 # Import OpenRouter service
-from services.openrouter import send_to_openrouter, get_available_models
+from services.openrouter import send_to_openrouter
+from services.http_client import start_http_client, close_http_client, get_pool_stats
+from services.storage import chat_store
+from services.context import context_builder
+from services.cache import completion_cache
+from services.catalog import SORT_KEYS as CATALOG_SORT_KEYS, CatalogQuery, model_catalog
+from services.http_cache import (
+    CompressionMiddleware,
+    cached_response,
+    is_not_modified,
+    make_etag,
+    not_modified,
+    validator_headers,
+)
+from services.sse import coalesce
+from services.generations import Generation, generation_registry, parse_event_id
+from services.admission import AdmissionRejected, admission_controller
+from services.compare import COMPARE_MAX_MODELS, stream_comparison
+from services.batches import BATCH_MAX_JOBS, BatchJob, batch_runner, ndjson_results
+from services.telemetry import GenerationStats, aggregate_generations, completion_lengths
+from services.metrics import (
+    registry,
+    CONTENT_TYPE,
+    HTTPMetricsMiddleware,
+    SSE_ACTIVE_STREAMS,
+    GENERATIONS_CANCELLED,
+    GENERATION_TOKENS_SAVED,
+)
+from services.sessions import session_backend
+from services.users import user_cache
 
 # Configure logging
 logging.basicConfig(
@@ -50,10 +82,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip/brotli for non-streamed responses above COMPRESSION_MIN_SIZE
+app.add_middleware(CompressionMiddleware)
+
+# Request latency by route template, exported on /metrics
+app.add_middleware(HTTPMetricsMiddleware)
+
 @app.on_event("startup")
-def on_startup() -> None:
-    """Ensure database tables exist when the app starts."""
+async def on_startup() -> None:
+    """Ensure database tables exist and start the HTTP client and storage flusher."""
     init_db()
+    await start_http_client()
+    await chat_store.start()
+    await session_backend.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    """Stop running generations and batches, flush buffered writes and close pooled upstream connections."""
+    await generation_registry.stop()
+    await batch_runner.stop()
+    await chat_store.stop()
+    await session_backend.stop()
+    await close_http_client()
+    completion_cache.close()
+    await async_engine.dispose()
 
 # Environment variables
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
@@ -62,15 +115,28 @@ PORT = int(os.getenv("PORT", 8001))
 DEFAULT_MODEL = os.getenv("MODEL_NAME", "openai/gpt-3.5-turbo")
 APP_TITLE = os.getenv("APP_TITLE", "Open Chat API")
 APP_URL = os.getenv("APP_URL", "http://localhost:8001")
+# Streaming answers are checkpointed to storage every N characters or T seconds
+STREAM_CHECKPOINT_CHARS = int(os.getenv("STREAM_CHECKPOINT_CHARS", 800))
+STREAM_CHECKPOINT_SECONDS = float(os.getenv("STREAM_CHECKPOINT_SECONDS", 2.0))
+# What happens to the text of an answer cancelled because every client left:
+# "partial" keeps it (status partial), "discard" deletes the message
+STREAM_CANCEL_SAVE = os.getenv("STREAM_CANCEL_SAVE", "partial")
+# Default and maximum page sizes for conversation/message listings
+CONVERSATIONS_PAGE_SIZE = int(os.getenv("CONVERSATIONS_PAGE_SIZE", 50))
+MESSAGES_PAGE_SIZE = int(os.getenv("MESSAGES_PAGE_SIZE", 200))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 1000))
+
+# Response headers of the Server-Sent Event endpoints
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+}
 
 SESSION_COOKIE_NAME = "session_token"
-session_store: Dict[str, int] = {}
+# Sessions live in session_backend (services/sessions.py, SESSION_BACKEND=memory|sql|signed)
 
-# In-memory storage
-conversations: Dict[str, dict] = {}
-messages_store: Dict[str, List[dict]] = {}
-models_cache: Optional[List[dict]] = None
-models_cache_time: Optional[datetime] = None
+# Conversations and messages live in chat_store (services/storage.py)
 
 
 # ===== Pydantic Models =====
@@ -80,6 +146,7 @@ class Message(BaseModel):
     role: str  # "user" or "assistant"
     content: str
     model: Optional[str] = None
+    status: str = "complete"  # "partial" while an assistant answer is still streaming
     timestamp: datetime
 
 
@@ -88,6 +155,7 @@ class Conversation(BaseModel):
     default_model: str
     created_at: datetime
     updated_at: datetime
+    version: int = 1  # Bumped by every change to the conversation or its messages
 
 
 class CreateConversationRequest(BaseModel):
@@ -103,6 +171,30 @@ class SendMessageRequest(BaseModel):
     model: Optional[str] = Field(default=None, description="Override model for this message")
 
 
+class ChatMessage(BaseModel):
+    role: str = Field(..., description="system, user or assistant")
+    content: str
+
+
+class CompareRequest(BaseModel):
+    models: List[str] = Field(..., min_length=1, description="Models to compare")
+    conversation_id: Optional[str] = Field(default=None, description="Use this conversation's history as the prompt")
+    messages: Optional[List[ChatMessage]] = Field(default=None, description="Prompt messages, instead of a conversation")
+
+
+class BatchJobRequest(BaseModel):
+    id: Optional[str] = Field(default=None, description="Caller's id for the job, echoed in its result")
+    model: Optional[str] = Field(default=None, description="Defaults to the batch's model")
+    messages: Optional[List[ChatMessage]] = Field(default=None, description="Prompt messages")
+    prompt: Optional[str] = Field(default=None, description="Shorthand for a single user message")
+    params: Optional[Dict[str, Any]] = Field(default=None, description="Sampling parameters, e.g. temperature")
+
+
+class BatchRequest(BaseModel):
+    jobs: List[BatchJobRequest]
+    model: Optional[str] = Field(default=None, description="Model for jobs that do not name one")
+
+
 class UserCreate(BaseModel):
     name: str = Field(..., min_length=1)
     email: EmailStr
@@ -126,6 +218,16 @@ class UserRead(BaseModel):
 
 # ===== Helper Functions =====
 
+def conversation_validators(conversation: Dict[str, Any], *view: str) -> Dict[str, str]:
+    """
+    ETag and Last-Modified for a view of a conversation (the conversation
+    itself, or a page of its messages), derived from its version counter.
+    """
+    parts = [conversation["id"], str(conversation["version"]), *view]
+    etag = make_etag(*(part.encode("utf-8") for part in parts), weak=False)
+    return validator_headers(etag, conversation["modified_at"])
+
+
 def get_openrouter_headers() -> dict:
     """Build headers for OpenRouter API requests with attribution"""
     return {
@@ -155,10 +257,8 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return hash_password(plain_password) == hashed_password
 
 
-def create_session_token(user_id: int) -> str:
-    token = str(uuid4())
-    session_store[token] = user_id
-    return token
+async def create_session_token(user_id: int) -> str:
+    return await session_backend.create(user_id)
 
 
 # ===== API Endpoints =====
@@ -166,12 +266,13 @@ def create_session_token(user_id: int) -> str:
 @app.get("/")
 async def root():
     """Health check endpoint"""
+    stats = await chat_store.get_stats()
     return {
         "status": "online",
         "service": "Open Chat API",
         "version": "2.0.0",
-        "conversations": len(conversations),
-        "total_messages": sum(len(msgs) for msgs in messages_store.values())
+        "conversations": stats["conversations"],
+        "total_messages": stats["total_messages"]
     }
 
 
@@ -181,12 +282,53 @@ async def health_check():
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics in the text exposition format"""
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/stats/http-pool")
+async def http_pool_stats():
+    """Upstream connection pool usage, for sizing HTTP_MAX_CONNECTIONS"""
+    return get_pool_stats()
+
+
+@app.get("/stats/admission")
+async def admission_stats():
+    """Upstream slots in use and requests waiting for one"""
+    return admission_controller.get_stats()
+
+
+@app.get("/stats/cache")
+async def completion_cache_stats():
+    """Completion cache hit/miss counters and size"""
+    return completion_cache.stats()
+
+
+@app.get("/stats/generations")
+async def generation_stats(
+    window_minutes: int = Query(default=60, ge=1, description="Look back this many minutes"),
+    model: Optional[str] = Query(default=None, description="Only include this model"),
+    bucket_minutes: Optional[int] = Query(default=None, ge=1, description="Also group into time buckets of this width"),
+):
+    """Latency and token usage of recent generations, aggregated by model"""
+    since = datetime.utcnow() - timedelta(minutes=window_minutes)
+    rows = await chat_store.get_generations(since, model)
+    return {
+        "window_minutes": window_minutes,
+        "since": since,
+        "models": aggregate_generations(rows, bucket_minutes),
+    }
+
+
 # ---- AUTH ENDPOINTS (DB-backed users) ----
 
 @app.post("/auth/register", response_model=UserRead)
-def register_user(payload: UserCreate, response: Response, db: Session = Depends(get_db)):
+async def register_user(payload: UserCreate, response: Response, db: AsyncSession = Depends(get_async_db)):
     """Create a new user and set an httpOnly session cookie."""
-    existing = db.query(User).filter(User.email == payload.email).first()
+    result = await db.execute(select(User).where(User.email == payload.email))
+    existing = result.scalars().first()
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
 
@@ -196,10 +338,10 @@ def register_user(payload: UserCreate, response: Response, db: Session = Depends
         hashed_password=hash_password(payload.password),
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
 
-    token = create_session_token(user.id)
+    token = await create_session_token(user.id)
     response.set_cookie(
         key=SESSION_COOKIE_NAME,
         value=token,
@@ -212,13 +354,14 @@ def register_user(payload: UserCreate, response: Response, db: Session = Depends
 
 
 @app.post("/auth/login", response_model=UserRead)
-def login_user(payload: UserLogin, response: Response, db: Session = Depends(get_db)):
+async def login_user(payload: UserLogin, response: Response, db: AsyncSession = Depends(get_async_db)):
     """Log in an existing user and set session cookie."""
-    user = db.query(User).filter(User.email == payload.email).first()
+    result = await db.execute(select(User).where(User.email == payload.email))
+    user = result.scalars().first()
     if not user or not verify_password(payload.password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
-    token = create_session_token(user.id)
+    token = await create_session_token(user.id)
     response.set_cookie(
         key=SESSION_COOKIE_NAME,
         value=token,
@@ -231,60 +374,39 @@ def login_user(payload: UserLogin, response: Response, db: Session = Depends(get
 
 
 @app.get("/auth/me", response_model=UserRead)
-def get_current_user(
-    db: Session = Depends(get_db),
+async def get_current_user(
     session_token: Optional[str] = Cookie(default=None, alias=SESSION_COOKIE_NAME),
 ):
     """Return the currently logged-in user based on the session cookie."""
-    if not session_token or session_token not in session_store:
+    user_id = await session_backend.get(session_token) if session_token else None
+    if user_id is None:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    user_id = session_store[session_token]
-    user = db.get(User, user_id)
+    # Cached; only opens a database session on a miss
+    user = await user_cache.get(user_id)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     return user
 
 
 @app.post("/auth/logout")
-def logout_user(
+async def logout_user(
     response: Response,
     session_token: Optional[str] = Cookie(default=None, alias=SESSION_COOKIE_NAME),
 ):
-    """Clear the session cookie and remove the session from memory."""
-    if session_token and session_token in session_store:
-        del session_store[session_token]
+    """Clear the session cookie and end the session."""
+    if session_token:
+        await session_backend.delete(session_token)
     response.delete_cookie(SESSION_COOKIE_NAME, path="/")
     return {"status": "ok"}
 
 
 # ---- Existing model + conversation endpoints ----
 
-@app.get("/models")
-async def get_models():
-    """
-    Fetch and cache the list of available models from OpenRouter.
-    Cache is refreshed if older than 1 hour.
-    """
-    global models_cache, models_cache_time
-    
-    validate_api_key()
-    
-    # Check cache validity (1 hour)
-    if models_cache and models_cache_time:
-        cache_age = (datetime.now() - models_cache_time).total_seconds()
-        if cache_age < 3600:
-            logger.info(f"Returning cached models (age: {cache_age:.0f}s)")
-            return {"models": models_cache, "cached": True}
-    
-    # Fetch fresh models list using the service
+async def get_catalog_index():
+    """Catalog index for the /models endpoints, with upstream failures mapped to HTTP errors"""
     try:
-        models_cache = await get_available_models()
-        models_cache_time = datetime.now()
-        
-        logger.info(f"Fetched {len(models_cache)} models from OpenRouter")
-        return {"models": models_cache, "cached": False}
-        
+        return await model_catalog.get_index()
     except ValueError as e:
         logger.error(f"Configuration error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -296,6 +418,46 @@ async def get_models():
         )
 
 
+@app.get("/models")
+async def get_models(
+    request: Request,
+    provider: Optional[str] = Query(default=None, description="Providers, the id prefix before '/' (e.g. openai,meta-llama)"),
+    modality: Optional[str] = Query(default=None, description="Input or output modality (e.g. image)"),
+    min_context: Optional[int] = Query(default=None, ge=0, description="Minimum context length in tokens"),
+    q: Optional[str] = Query(default=None, description="Search terms, matched against id, name and description"),
+    sort: Optional[str] = Query(default=None, description=f"One of: {', '.join(CATALOG_SORT_KEYS)}"),
+    order: str = Query(default="asc", pattern="^(asc|desc)$"),
+):
+    """
+    Fetch and cache the list of available models from OpenRouter.
+    Cache is refreshed if older than MODELS_CACHE_TTL (1 hour by default).
+    Concurrent refreshes are coalesced into one upstream call, and a stale list
+    is served while a background refresh runs.
+    
+    Filtering, search and sorting run on an index built once per refresh.
+    Responses carry an ETag (If-None-Match returns 304) and are served
+    gzip or brotli encoded when the client accepts it.
+    """
+    validate_api_key()
+    if sort is not None and sort not in CATALOG_SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(CATALOG_SORT_KEYS)}")
+    
+    index, cached = await get_catalog_index()
+    query = CatalogQuery(provider, modality, min_context, q, sort, order == "desc")
+    return cached_response(request, index.render(query, cached))
+
+
+@app.get("/models/{model_id:path}")
+async def get_model(model_id: str, request: Request):
+    """Details of one model from the catalog, with the same ETag and compression as /models"""
+    validate_api_key()
+    index, _ = await get_catalog_index()
+    body = index.render_model(model_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Model not found")
+    return cached_response(request, body)
+
+
 @app.post("/conversations", response_model=Conversation)
 async def create_conversation(request: CreateConversationRequest):
     """
@@ -313,34 +475,37 @@ async def create_conversation(request: CreateConversationRequest):
         "updated_at": now
     }
     
-    conversations[conversation_id] = conversation
-    messages_store[conversation_id] = []
+    await chat_store.create_conversation(conversation)
     
     logger.info(f"Created conversation {conversation_id} with model {model}")
     return Conversation(**conversation)
 
 
 @app.get("/conversations/{conversation_id}", response_model=Conversation)
-async def get_conversation(conversation_id: str):
-    """Get conversation details"""
-    if conversation_id not in conversations:
+async def get_conversation(conversation_id: str, request: Request, response: Response):
+    """Get conversation details (ETag/Last-Modified, 304 when unchanged)"""
+    conversation = await chat_store.get_conversation(conversation_id)
+    if conversation is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    return Conversation(**conversations[conversation_id])
+    headers = conversation_validators(conversation, "conversation")
+    if is_not_modified(request, headers["ETag"], conversation["modified_at"]):
+        return not_modified(headers)
+    response.headers.update(headers)
+    return Conversation(**conversation)
 
 
 @app.get("/conversations")
-async def list_conversations():
-    """List all conversations"""
-    return {
-        "conversations": [
-            {
-                **conv,
-                "message_count": len(messages_store.get(conv["id"], []))
-            }
-            for conv in conversations.values()
-        ]
-    }
+async def list_conversations(
+    limit: int = Query(default=CONVERSATIONS_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(default=None, description="next_cursor from the previous page"),
+):
+    """List conversations, most recently updated first, one page at a time"""
+    try:
+        conversations, next_cursor = await chat_store.list_conversations(limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"conversations": conversations, "next_cursor": next_cursor}
 
 
 @app.patch("/conversations/{conversation_id}", response_model=Conversation)
@@ -348,12 +513,18 @@ async def update_conversation(conversation_id: str, request: UpdateConversationR
     """
     Update the default model for a conversation.
     """
-    if conversation_id not in conversations:
+    conversation = await chat_store.get_conversation(conversation_id)
+    if conversation is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    conversation = conversations[conversation_id]
     conversation["default_model"] = request.default_model
     conversation["updated_at"] = datetime.now()
+    conversation["version"] += 1
+    await chat_store.update_conversation(
+        conversation_id,
+        default_model=conversation["default_model"],
+        updated_at=conversation["updated_at"],
+    )
     
     logger.info(f"Updated conversation {conversation_id} model to {request.default_model}")
     return Conversation(**conversation)
@@ -365,7 +536,7 @@ async def send_message(conversation_id: str, request: SendMessageRequest):
     Send a user message to a conversation.
     The message is stored and will be used in the streaming response.
     """
-    if conversation_id not in conversations:
+    if await chat_store.get_conversation(conversation_id) is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
     validate_api_key()
@@ -377,42 +548,93 @@ async def send_message(conversation_id: str, request: SendMessageRequest):
         "role": "user",
         "content": request.message,
         "model": None,
+        "status": "complete",
         "timestamp": datetime.now()
     }
     
-    messages_store[conversation_id].append(user_message)
-    conversations[conversation_id]["updated_at"] = datetime.now()
+    await chat_store.add_message(conversation_id, user_message)
     
     logger.info(f"Added user message to conversation {conversation_id}")
     return Message(**user_message)
 
 
 @app.get("/conversations/{conversation_id}/messages")
-async def get_messages(conversation_id: str):
-    """Get all messages in a conversation"""
-    if conversation_id not in conversations:
+async def get_messages(
+    conversation_id: str,
+    request: Request,
+    response: Response,
+    limit: int = Query(default=MESSAGES_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(default=None, description="next_cursor from the previous page"),
+):
+    """
+    Get the messages in a conversation, oldest first, one page at a time.
+    
+    The ETag follows the conversation's version, so an unchanged poll is
+    answered 304 from the conversation row alone, without loading or
+    serializing the messages.
+    """
+    conversation = await chat_store.get_conversation(conversation_id)
+    if conversation is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
+    # Read before the page: a write landing in between makes the page newer
+    # than its ETag, which only costs the next poll a full response
+    headers = conversation_validators(conversation, "messages", str(limit), cursor or "")
+    if is_not_modified(request, headers["ETag"], conversation["modified_at"]):
+        return not_modified(headers)
     
+    try:
+        page = await chat_store.get_message_page(conversation_id, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if page is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    response.headers.update(headers)
+    messages, next_cursor = page
     return {
         "conversation_id": conversation_id,
-        "messages": messages_store.get(conversation_id, [])
+        "messages": messages,
+        "next_cursor": next_cursor
     }
 
 
 @app.get("/conversations/{conversation_id}/stream")
-async def stream_response(conversation_id: str, model: Optional[str] = None):
+async def stream_response(
+    conversation_id: str,
+    model: Optional[str] = None,
+    last_event_id: Optional[str] = Header(default=None),
+):
     """
     Stream assistant response using Server-Sent Events (SSE).
     Uses conversation history to maintain context.
     Optional model parameter overrides conversation default.
+    
+    The answer is generated in a background task and every event carries an
+    id (``<generation id>:<n>``). A client that reconnects with the
+    ``Last-Event-ID`` header (EventSource does this automatically) receives
+    the events it missed and then the rest of the same answer. Clients that
+    open the stream while the same answer is already being generated join
+    it instead of starting another upstream call.
     """
-    if conversation_id not in conversations:
+    conversation = await chat_store.get_conversation(conversation_id)
+    if conversation is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
+    if last_event_id:
+        # Resume an answer that is still running (or just finished)
+        try:
+            generation_id, after = parse_event_id(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+        generation = generation_registry.get(generation_id)
+        if generation is None or generation.conversation_id != conversation_id:
+            raise HTTPException(status_code=404, detail="Generation not found or expired")
+        logger.info(f"Resuming generation {generation_id} for conversation {conversation_id} after event {after}")
+        return _event_stream(generation, after)
+    
     validate_api_key()
     
-    conversation = conversations[conversation_id]
-    messages = messages_store.get(conversation_id, [])
+    messages = await chat_store.get_messages(conversation_id)
     
     if not messages:
         raise HTTPException(status_code=400, detail="No messages in conversation")
@@ -420,73 +642,349 @@ async def stream_response(conversation_id: str, model: Optional[str] = None):
     # Determine which model to use
     selected_model = model or conversation["default_model"]
     
-    # Build message history for OpenRouter
-    chat_messages = [
-        {"role": msg["role"], "content": msg["content"]}
-        for msg in messages
-    ]
+    # Another client (a second tab, a shared screen) is already streaming this answer: join it.
+    # A running answer checkpoints itself as a trailing partial message, so
+    # look past those for the message it is replying to
+    reply_to = messages[-1]["id"]
+    for message in reversed(messages):
+        if message["role"] != "assistant" or message.get("status") != "partial":
+            reply_to = message["id"]
+            break
+    running = generation_registry.find_running(conversation_id, selected_model, reply_to)
+    if running is not None:
+        logger.info(f"Joining generation {running.id} for conversation {conversation_id}")
+        return _event_stream(running)
+    
+    # Build message history for OpenRouter, trimmed to the model's context window
+    chat_messages = context_builder.build(
+        conversation_id,
+        messages,
+        model_catalog.context_length(selected_model),
+    )
+    
+    # Fail fast when too many requests are already waiting for this upstream
+    try:
+        ticket = admission_controller.reserve(selected_model)
+    except AdmissionRejected as e:
+        logger.warning(f"Rejected stream for conversation {conversation_id}: {e}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     
     logger.info(f"Streaming response for conversation {conversation_id} with model {selected_model}")
     
-    async def event_generator():
-        """Generate Server-Sent Events from OpenRouter stream using the service helper"""
+    async def produce(generation: Generation) -> None:
+        """Publish events from the OpenRouter stream using the service helper"""
         assistant_message_id = str(uuid4())
-        full_response = ""
+        parts: List[str] = []
+        unsaved_chars = 0
+        saved = False
+        completed = False
+        last_checkpoint = time.monotonic()
+        stats = GenerationStats(selected_model)
+        
+        async def save(status: str) -> None:
+            """Store the answer so far: the first save adds the message, later ones update it."""
+            nonlocal saved, unsaved_chars, last_checkpoint
+            content = "".join(parts)
+            if saved:
+                await chat_store.update_message(
+                    conversation_id, assistant_message_id, content=content, status=status
+                )
+            else:
+                await chat_store.add_message(conversation_id, {
+                    "id": assistant_message_id,
+                    "role": "assistant",
+                    "content": content,
+                    # The model that actually answered (a hedged request may switch to a fallback)
+                    "model": stats.model,
+                    "status": status,
+                    "timestamp": datetime.now()
+                })
+                saved = True
+            unsaved_chars = 0
+            last_checkpoint = time.monotonic()
+        
+        def report_position(position: int) -> None:
+            generation.publish({"queue_position": position})
         
         try:
-            # Use the OpenRouter service to get streaming response
-            async for content_chunk in send_to_openrouter(chat_messages, selected_model):
-                full_response += content_chunk
-                # Send content chunk as SSE
-                yield f"data: {json.dumps({'content': content_chunk})}\n\n"
+            # Wait for an upstream slot (clients see their queue position meanwhile)
+            async with admission_controller.slot(ticket, on_position=report_position):
+                # Use the OpenRouter service to get streaming response
+                # Deltas are merged into fewer, larger frames (first token is not delayed)
+                async for content_chunk in coalesce(send_to_openrouter(chat_messages, selected_model, stats=stats)):
+                    if not parts and stats.model != selected_model:
+                        # A fallback model won the hedged request
+                        generation.publish({"model": stats.model})
+                    parts.append(content_chunk)
+                    unsaved_chars += len(content_chunk)
+                    # Send content chunk as SSE
+                    generation.publish({"content": content_chunk})
+                    
+                    # Checkpoint the partial answer so a crash or disconnect keeps it
+                    if (
+                        unsaved_chars >= STREAM_CHECKPOINT_CHARS
+                        or time.monotonic() - last_checkpoint >= STREAM_CHECKPOINT_SECONDS
+                    ):
+                        await save("partial")
             
             # Stream finished - store complete assistant message
-            assistant_message = {
-                "id": assistant_message_id,
-                "role": "assistant",
-                "content": full_response,
-                "model": selected_model,
-                "timestamp": datetime.now()
-            }
-            messages_store[conversation_id].append(assistant_message)
-            conversations[conversation_id]["updated_at"] = datetime.now()
+            await save("complete")
+            completed = True
             
             # Send final event
-            yield f"data: {json.dumps({'done': True, 'message_id': assistant_message_id})}\n\n"
+            generation.publish({"done": True, "message_id": assistant_message_id})
             logger.info(f"Completed streaming for conversation {conversation_id}")
             
+        except AdmissionRejected as e:
+            logger.warning(f"Stream for conversation {conversation_id} not admitted: {e}")
+            generation.publish({"error": str(e), "retry_after": e.retry_after})
         except ValueError as e:
             error_msg = f"Configuration error: {str(e)}"
             logger.error(error_msg)
-            yield f"data: {json.dumps({'error': error_msg})}\n\n"
+            generation.publish({"error": error_msg})
         except httpx.HTTPError as e:
             error_msg = f"Error streaming from OpenRouter: {str(e)}"
             logger.error(error_msg)
-            yield f"data: {json.dumps({'error': error_msg})}\n\n"
+            generation.publish({"error": error_msg})
         except Exception as e:
             error_msg = f"Unexpected error: {str(e)}"
             logger.error(error_msg)
-            yield f"data: {json.dumps({'error': error_msg})}\n\n"
+            generation.publish({"error": error_msg})
+        finally:
+            record = stats.to_record()
+            if completed and not stats.cached:
+                completion_lengths.observe(stats.model, record["tokens_completion"])
+            if not completed and generation.abandoned:
+                # Every client disconnected and the upstream stream was closed early
+                tokens_saved = completion_lengths.remaining(stats.model, record["tokens_completion"])
+                GENERATIONS_CANCELLED.inc(model=selected_model)
+                GENERATION_TOKENS_SAVED.inc(tokens_saved, model=selected_model)
+                logger.info(
+                    f"Cancelled generation for conversation {conversation_id} "
+                    f"after {record['tokens_completion']} tokens (~{tokens_saved} saved)"
+                )
+                if STREAM_CANCEL_SAVE == "discard":
+                    if saved:
+                        await chat_store.delete_message(conversation_id, assistant_message_id)
+                        saved = False
+                    unsaved_chars = 0
+            # Errors, shutdown and cancellation keep whatever was generated, marked partial
+            if not completed and unsaved_chars:
+                await save("partial")
+            # Latency/usage metrics for answers that came from the upstream
+            if parts and not stats.cached:
+                await chat_store.add_response(
+                    record, conversation_id, assistant_message_id if saved else None
+                )
+    
+    generation = generation_registry.start(conversation_id, selected_model, produce, reply_to)
+    return _event_stream(generation)
+
+
+def _event_stream(generation: Generation, after: int = 0) -> StreamingResponse:
+    """SSE response that follows a generation from event ``after`` on."""
+    async def event_generator():
+        SSE_ACTIVE_STREAMS.inc()
+        try:
+            async for frame in generation.events(after):
+                yield frame
+        finally:
+            SSE_ACTIVE_STREAMS.dec()
     
     return StreamingResponse(
         event_generator(),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"
+        headers={**SSE_HEADERS, "X-Generation-Id": generation.id},
+    )
+
+
+@app.post("/compare")
+async def compare_models(request: CompareRequest):
+    """
+    Stream the answers of several models to the same prompt at the same time.
+    
+    The prompt is either a conversation's history (trimmed to each model's
+    context window) or a list of messages. Every SSE event carries a
+    ``model`` field; the last event lists each model's time to first token
+    and duration. Requests go through the same admission limits as /stream.
+    """
+    if len(set(request.models)) != len(request.models):
+        raise HTTPException(status_code=400, detail="Each model can only be compared once")
+    if len(request.models) > COMPARE_MAX_MODELS:
+        raise HTTPException(status_code=400, detail=f"At most {COMPARE_MAX_MODELS} models can be compared")
+    if (request.conversation_id is None) == (request.messages is None):
+        raise HTTPException(status_code=400, detail="Provide either conversation_id or messages")
+    
+    if request.conversation_id is not None:
+        messages = await chat_store.get_messages(request.conversation_id)
+        if messages is None:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        if not messages:
+            raise HTTPException(status_code=400, detail="No messages in conversation")
+        prompts = {
+            model: context_builder.build(
+                request.conversation_id, messages, model_catalog.context_length(model)
+            )
+            for model in request.models
         }
+    else:
+        if not request.messages:
+            raise HTTPException(status_code=400, detail="No messages to compare on")
+        chat_messages = [{"role": m.role, "content": m.content} for m in request.messages]
+        prompts = {model: chat_messages for model in request.models}
+    
+    validate_api_key()
+    
+    # Reserve every model's place up front, so a full queue fails the whole request
+    tickets = {}
+    try:
+        for model in request.models:
+            tickets[model] = admission_controller.reserve(model)
+    except AdmissionRejected as e:
+        for ticket in tickets.values():
+            admission_controller.release(ticket)
+        logger.warning(f"Rejected comparison of {', '.join(request.models)}: {e}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    
+    def release_tickets() -> None:
+        # Covers clients that disconnect before the stream starts (no-op otherwise)
+        for ticket in tickets.values():
+            admission_controller.release(ticket)
+    
+    logger.info(f"Comparing models: {', '.join(request.models)}")
+    return StreamingResponse(
+        stream_comparison(prompts, tickets, request.conversation_id or ""),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+        background=BackgroundTask(release_tickets),
+    )
+
+
+_batch_jobs_adapter = TypeAdapter(List[BatchJobRequest])
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-lines")
+
+
+def parse_batch_body(body: bytes, content_type: str) -> BatchRequest:
+    """
+    Read a batch from a JSON body (``{"jobs": [...]}`` or a bare list) or
+    from NDJSON, one job per line.
+    
+    Raises:
+        HTTPException: 422 if the body or a job is invalid
+    """
+    try:
+        if content_type.split(";")[0].strip() in NDJSON_CONTENT_TYPES:
+            jobs = []
+            for line_number, line in enumerate(body.splitlines(), start=1):
+                if not line.strip():
+                    continue
+                try:
+                    jobs.append(BatchJobRequest.model_validate_json(line))
+                except ValidationError as e:
+                    raise HTTPException(status_code=422, detail=f"Invalid job on line {line_number}: {e}")
+            return BatchRequest(jobs=jobs)
+        data = json.loads(body)
+        if isinstance(data, list):
+            return BatchRequest(jobs=_batch_jobs_adapter.validate_python(data))
+        return BatchRequest.model_validate(data)
+    except (ValueError, ValidationError) as e:
+        # json.JSONDecodeError is a ValueError
+        raise HTTPException(status_code=422, detail=f"Invalid batch: {e}")
+
+
+@app.post("/batches")
+async def create_batch(
+    request: Request,
+    model: Optional[str] = Query(default=None, description="Model for jobs that do not name one"),
+    concurrency: Optional[int] = Query(default=None, ge=1, description="Jobs of this batch in flight at once"),
+    stream: bool = Query(default=True, description="Stream results as NDJSON; false returns the batch id at once"),
+):
+    """
+    Run many independent prompts without streaming, a bounded number at a time.
+    
+    The body is JSON (``{"jobs": [...], "model": "..."}`` or a list of jobs)
+    or NDJSON with one job per line. Each job has ``messages`` or ``prompt``,
+    and optionally ``id``, ``model`` and ``params``. Transient upstream
+    errors are retried with backoff. The batch runs in the background: with
+    ``stream=true`` results come back as NDJSON lines as jobs finish, and
+    progress can always be polled at ``GET /batches/{id}``.
+    """
+    batch_request = parse_batch_body(await request.body(), request.headers.get("content-type", ""))
+    if not batch_request.jobs:
+        raise HTTPException(status_code=400, detail="Batch has no jobs")
+    if len(batch_request.jobs) > BATCH_MAX_JOBS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_JOBS} jobs per batch")
+    
+    default_model = batch_request.model or model or DEFAULT_MODEL
+    jobs = []
+    for index, job in enumerate(batch_request.jobs):
+        if (job.messages is None) == (job.prompt is None):
+            raise HTTPException(status_code=400, detail=f"Job {job.id or index}: provide either messages or prompt")
+        if job.prompt is not None:
+            messages = [{"role": "user", "content": job.prompt}]
+        else:
+            messages = [{"role": m.role, "content": m.content} for m in job.messages]
+        jobs.append(BatchJob(index, job.model or default_model, messages, job.params, job.id))
+    
+    validate_api_key()
+    batch = batch_runner.submit(jobs, concurrency)
+    
+    if not stream:
+        return JSONResponse(status_code=202, content=batch.get_progress())
+    return StreamingResponse(
+        ndjson_results(batch),
+        media_type="application/x-ndjson",
+        headers={"X-Batch-Id": batch.id},
+    )
+
+
+@app.get("/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    """Progress of a batch: job counts by state"""
+    batch = batch_runner.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found or expired")
+    return batch.get_progress()
+
+
+@app.get("/batches/{batch_id}/results")
+async def get_batch_results(
+    batch_id: str,
+    after: int = Query(default=0, ge=0, description="Number of results already received"),
+):
+    """
+    Results of a batch as NDJSON, in the order jobs finished. Follows the
+    batch until it finishes, so it can also resume an interrupted stream.
+    """
+    batch = batch_runner.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found or expired")
+    return StreamingResponse(
+        ndjson_results(batch, after),
+        media_type="application/x-ndjson",
+        headers={"X-Batch-Id": batch.id},
     )
 
 
+@app.delete("/batches/{batch_id}")
+async def cancel_batch(batch_id: str):
+    """Cancel a running batch; finished jobs keep their results"""
+    batch = await batch_runner.cancel(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found or expired")
+    logger.info(f"Cancelled batch {batch_id}")
+    return batch.get_progress()
+
+
 @app.delete("/conversations/{conversation_id}")
 async def delete_conversation(conversation_id: str):
     """Delete a conversation and all its messages"""
-    if conversation_id not in conversations:
+    if await chat_store.get_conversation(conversation_id) is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    del conversations[conversation_id]
-    del messages_store[conversation_id]
+    await chat_store.delete_conversation(conversation_id)
+    context_builder.discard(conversation_id)
     
     logger.info(f"Deleted conversation {conversation_id}")
     return {"status": "deleted", "conversation_id": conversation_id}
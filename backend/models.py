@@ -2,7 +2,7 @@
 SQLAlchemy database models for the Open Chat application
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -34,6 +34,10 @@ class Conversation(Base):
     Each conversation has a default model that can be overridden per message.
     """
     __tablename__ = "conversations"
+    __table_args__ = (
+        # Keyset pagination of a user's conversations by recency
+        Index("ix_conversations_user_id_updated_at", "user_id", "updated_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     uuid = Column(String(36), unique=True, index=True, nullable=False)  # Public identifier
@@ -41,7 +45,11 @@ class Conversation(Base):
     default_model = Column(String(100), nullable=False)  # e.g., "openai/gpt-3.5-turbo"
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # Nullable for anonymous users
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    # No onupdate: services/storage.py sets it explicitly (last message or settings change),
+    # and version bumps must not move it
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    version = Column(Integer, default=1, nullable=False)  # Bumped by every write to the conversation or its messages
+    modified_at = Column(DateTime, nullable=True)  # Time of the last such write (Last-Modified)
     
     # Relationships
     user = relationship("User", back_populates="conversations")
@@ -58,6 +66,10 @@ class Message(Base):
     User messages can optionally override the conversation's default model.
     """
     __tablename__ = "messages"
+    __table_args__ = (
+        # Keyset pagination of a conversation's messages in order
+        Index("ix_messages_conversation_id_created_at", "conversation_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     uuid = Column(String(36), unique=True, index=True, nullable=False)  # Public identifier
@@ -65,6 +77,7 @@ class Message(Base):
     role = Column(String(20), nullable=False)  # 'user' or 'assistant'
     content = Column(Text, nullable=False)
     model = Column(String(100), nullable=True)  # Model override for this message (optional)
+    status = Column(String(20), default="complete", nullable=False)  # 'partial' while an answer is still streaming
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     
     # Relationships
@@ -84,16 +97,39 @@ class Response(Base):
     __tablename__ = "responses"
     
     id = Column(Integer, primary_key=True, index=True)
-    message_id = Column(Integer, ForeignKey("messages.id"), unique=True, nullable=False)
-    model_used = Column(String(100), nullable=False)  # Actual model that generated the response
+    message_id = Column(Integer, ForeignKey("messages.id"), unique=True, nullable=True)  # Null for generations not stored as a message
+    model_used = Column(String(100), index=True, nullable=False)  # Actual model that generated the response
     tokens_prompt = Column(Integer, nullable=True)  # Tokens in prompt
     tokens_completion = Column(Integer, nullable=True)  # Tokens in completion
     tokens_total = Column(Integer, nullable=True)  # Total tokens used
+    usage_estimated = Column(Boolean, default=False, nullable=False)  # Token counts estimated (no upstream usage report)
     completion_time_ms = Column(Integer, nullable=True)  # Time taken to generate response
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    ttft_ms = Column(Integer, nullable=True)  # Time to first content chunk
+    chunk_count = Column(Integer, nullable=True)  # Content chunks received from upstream
+    inter_chunk_p50_ms = Column(Integer, nullable=True)  # Latency between consecutive chunks
+    inter_chunk_p95_ms = Column(Integer, nullable=True)
+    inter_chunk_p99_ms = Column(Integer, nullable=True)
+    streamed = Column(Boolean, default=True, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True, nullable=False)
     
     # Relationships
     message = relationship("Message", back_populates="response")
     
     def __repr__(self):
         return f"<Response(id={self.id}, model_used='{self.model_used}', tokens_total={self.tokens_total})>"
+
+
+class UserSession(Base):
+    """
+    Login session for the SQL session backend (services/sessions.py).
+    Only a SHA-256 digest of the cookie token is stored.
+    """
+    __tablename__ = "sessions"
+    
+    token_hash = Column(String(64), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, index=True, nullable=False)
+    
+    def __repr__(self):
+        return f"<UserSession(user_id={self.user_id}, expires_at={self.expires_at})>"
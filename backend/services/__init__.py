@@ -8,10 +8,62 @@ from .openrouter import (
     get_available_models,
     get_openrouter_headers,
 )
+from .http_client import (
+    start_http_client,
+    close_http_client,
+    get_http_client,
+    get_pool_stats,
+)
+from .storage import ChatStore, chat_store
+from .context import ContextBuilder, context_builder, estimate_tokens
+from .cache import CompletionCache, completion_cache
+from .catalog import CatalogIndex, CatalogQuery, ModelCatalog, model_catalog
+from .telemetry import GenerationStats, CompletionLengths, aggregate_generations, completion_lengths
+from .sessions import SessionBackend, create_session_backend, session_backend
+from .users import UserCache, user_cache
+from .generations import Generation, GenerationRegistry, generation_registry
+from .admission import AdmissionController, AdmissionRejected, admission_controller
+from .compare import stream_comparison
+from .batches import Batch, BatchJob, BatchRunner, batch_runner
 
 __all__ = [
     "send_to_openrouter",
     "send_to_openrouter_no_stream",
     "get_available_models",
     "get_openrouter_headers",
+    "start_http_client",
+    "close_http_client",
+    "get_http_client",
+    "get_pool_stats",
+    "ChatStore",
+    "chat_store",
+    "ContextBuilder",
+    "context_builder",
+    "estimate_tokens",
+    "CompletionCache",
+    "completion_cache",
+    "CatalogIndex",
+    "CatalogQuery",
+    "ModelCatalog",
+    "model_catalog",
+    "GenerationStats",
+    "aggregate_generations",
+    "CompletionLengths",
+    "completion_lengths",
+    "SessionBackend",
+    "create_session_backend",
+    "session_backend",
+    "UserCache",
+    "user_cache",
+    "Generation",
+    "GenerationRegistry",
+    "generation_registry",
+    "AdmissionController",
+    "AdmissionRejected",
+    "admission_controller",
+    "stream_comparison",
+    "Batch",
+    "BatchJob",
+    "BatchRunner",
+    "batch_runner",
 ]
@@ -0,0 +1,276 @@
+"""
+Admission control
+Global and per-model limits on concurrent upstream requests, with a bounded
+FIFO wait queue. Requests that cannot even queue are rejected right away
+(HTTP 429 with Retry-After) instead of piling up as upstream rate limits.
+"""
+import os
+import math
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from .metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_LENGTH, ADMISSION_REJECTED, ADMISSION_WAIT
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+# Upstream requests in flight across all models (0 = unlimited)
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", 64))
+# Per-model limit for models not listed in ADMISSION_MODEL_LIMITS (0 = unlimited)
+ADMISSION_MODEL_CONCURRENCY = int(os.getenv("ADMISSION_MODEL_CONCURRENCY", 8))
+# Per-model overrides: "model-a=2,model-b=16"
+ADMISSION_MODEL_LIMITS = os.getenv("ADMISSION_MODEL_LIMITS", "")
+# Requests allowed to wait for a slot; more are rejected with 429
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", 100))
+# Seconds a request may wait for a slot before it fails
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 30))
+
+
+def parse_model_limits(value: str) -> Dict[str, int]:
+    """
+    Parse ``model=limit`` pairs separated by commas.
+
+    Raises:
+        ValueError: If a pair is malformed
+    """
+    limits = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        model, _, limit = item.rpartition("=")
+        if not model.strip():
+            raise ValueError(f"Invalid ADMISSION_MODEL_LIMITS entry: {item!r}")
+        limits[model.strip()] = int(limit)
+    return limits
+
+
+class AdmissionRejected(Exception):
+    """No upstream slot: the wait queue is full or the wait timed out."""
+
+    def __init__(self, model: str, reason: str, retry_after: int):
+        self.model = model
+        self.reason = reason
+        self.retry_after = retry_after
+        if reason == "queue_full":
+            message = f"Too many requests waiting for {model}, retry in {retry_after}s"
+        else:
+            message = f"Timed out waiting for capacity on {model}, retry in {retry_after}s"
+        super().__init__(message)
+
+
+class Ticket:
+    """A request's place in line, and later its upstream slot."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.granted = False
+        self.released = False
+        self.position = 0
+        self.enqueued_at = time.monotonic()
+        self.granted_at: Optional[float] = None
+        self.on_position: Optional[Callable[[int], None]] = None
+        self._waiter: Optional[asyncio.Future] = None
+
+
+class AdmissionController:
+    """
+    Hands out upstream slots under a global and a per-model limit.
+
+    Waiting requests are served in arrival order, except that a request
+    whose model is at its limit does not block requests for other models.
+    ``reserve`` is synchronous so the HTTP handler can answer 429 before the
+    response starts; the actual wait happens in ``slot``.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = ADMISSION_MAX_CONCURRENT,
+        model_concurrency: int = ADMISSION_MODEL_CONCURRENCY,
+        model_limits: Optional[Dict[str, int]] = None,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+    ):
+        self.max_concurrent = max_concurrent
+        self.model_concurrency = model_concurrency
+        self.model_limits = (
+            model_limits if model_limits is not None else parse_model_limits(ADMISSION_MODEL_LIMITS)
+        )
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._in_flight_total = 0
+        self._in_flight: Dict[str, int] = {}
+        self._waiters: List[Ticket] = []
+        # Running mean of how long a slot is held, for Retry-After
+        self._hold_seconds: Optional[float] = None
+
+    # ----- Public API -----
+
+    def model_limit(self, model: str) -> int:
+        return self.model_limits.get(model, self.model_concurrency)
+
+    def reserve(self, model: str) -> Ticket:
+        """
+        Take a slot if one is free, otherwise a place in the wait queue.
+
+        Args:
+            model: Model the upstream request is for
+
+        Returns:
+            Ticket: Pass it to ``slot`` (or ``release`` it if unused)
+
+        Raises:
+            AdmissionRejected: If the wait queue is full
+        """
+        ticket = Ticket(model)
+        if self._has_capacity(model):
+            self._grant(ticket)
+            return ticket
+        if len(self._waiters) >= self.queue_size:
+            ADMISSION_REJECTED.inc(model=model, reason="queue_full")
+            raise AdmissionRejected(model, "queue_full", self.retry_after())
+        ticket._waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(ticket)
+        ticket.position = len(self._waiters)
+        ADMISSION_QUEUE_LENGTH.set(len(self._waiters))
+        return ticket
+
+    def try_acquire(self, model: str) -> Optional[Ticket]:
+        """
+        Take a slot only if one is free right now, without queueing (for
+        optional extra requests such as hedges).
+
+        Returns:
+            Optional[Ticket]: A granted ticket to ``release`` when done, or
+            None if the model or the global limit is reached
+        """
+        if not self._has_capacity(model):
+            return None
+        ticket = Ticket(model)
+        self._grant(ticket)
+        return ticket
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        ticket: Ticket,
+        on_position: Optional[Callable[[int], None]] = None,
+    ) -> AsyncIterator[None]:
+        """
+        Wait for the ticket's slot and hold it for the duration of the block.
+
+        Args:
+            ticket: Ticket from ``reserve``
+            on_position: Called with the 1-based queue position while waiting,
+                         initially and whenever it changes
+
+        Raises:
+            AdmissionRejected: If no slot frees up within the queue timeout
+        """
+        try:
+            await self._wait(ticket, on_position)
+            yield
+        finally:
+            self.release(ticket)
+
+    def release(self, ticket: Ticket) -> None:
+        """Give back a slot, or leave the queue. Safe to call more than once."""
+        if ticket.released:
+            return
+        ticket.released = True
+        if not ticket.granted:
+            self._remove_waiter(ticket)
+            return
+        self._in_flight_total -= 1
+        self._in_flight[ticket.model] -= 1
+        ADMISSION_IN_FLIGHT.set(self._in_flight[ticket.model], model=ticket.model)
+        held = time.monotonic() - ticket.granted_at
+        self._hold_seconds = held if self._hold_seconds is None else self._hold_seconds + 0.1 * (held - self._hold_seconds)
+        self._dispatch()
+
+    def retry_after(self) -> int:
+        """Seconds a rejected client should wait, from the queue length and recent slot hold times."""
+        if self._hold_seconds is None:
+            return 1
+        slots = self.max_concurrent or max(1, self._in_flight_total)
+        estimate = self._hold_seconds * (len(self._waiters) + 1) / slots
+        return max(1, min(math.ceil(estimate), math.ceil(self.queue_timeout)))
+
+    def get_stats(self) -> Dict[str, object]:
+        return {
+            "in_flight": self._in_flight_total,
+            "in_flight_by_model": {model: count for model, count in self._in_flight.items() if count},
+            "waiting": len(self._waiters),
+            "max_concurrent": self.max_concurrent,
+            "queue_size": self.queue_size,
+        }
+
+    # ----- Internals -----
+
+    def _has_capacity(self, model: str) -> bool:
+        if self.max_concurrent and self._in_flight_total >= self.max_concurrent:
+            return False
+        limit = self.model_limit(model)
+        return not limit or self._in_flight.get(model, 0) < limit
+
+    def _grant(self, ticket: Ticket) -> None:
+        ticket.granted = True
+        ticket.granted_at = time.monotonic()
+        self._in_flight_total += 1
+        self._in_flight[ticket.model] = self._in_flight.get(ticket.model, 0) + 1
+        ADMISSION_IN_FLIGHT.set(self._in_flight[ticket.model], model=ticket.model)
+        ADMISSION_WAIT.observe(ticket.granted_at - ticket.enqueued_at, model=ticket.model)
+
+    async def _wait(self, ticket: Ticket, on_position: Optional[Callable[[int], None]]) -> None:
+        if ticket.granted:
+            return
+        ticket.on_position = on_position
+        if on_position is not None:
+            on_position(ticket.position)
+        remaining = ticket.enqueued_at + self.queue_timeout - time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket._waiter), max(0.0, remaining))
+        except asyncio.TimeoutError:
+            if ticket.granted:
+                return
+            ADMISSION_REJECTED.inc(model=ticket.model, reason="timeout")
+            raise AdmissionRejected(ticket.model, "timeout", self.retry_after())
+
+    def _remove_waiter(self, ticket: Ticket) -> None:
+        if ticket in self._waiters:
+            self._waiters.remove(ticket)
+            self._update_positions()
+
+    def _dispatch(self) -> None:
+        """Grant slots to waiting requests that fit, oldest first."""
+        granted = False
+        for ticket in list(self._waiters):
+            if self._has_capacity(ticket.model):
+                self._waiters.remove(ticket)
+                self._grant(ticket)
+                if not ticket._waiter.done():
+                    ticket._waiter.set_result(None)
+                granted = True
+            elif self.max_concurrent and self._in_flight_total >= self.max_concurrent:
+                break
+        if granted:
+            self._update_positions()
+
+    def _update_positions(self) -> None:
+        ADMISSION_QUEUE_LENGTH.set(len(self._waiters))
+        for position, ticket in enumerate(self._waiters, start=1):
+            if ticket.position != position:
+                ticket.position = position
+                if ticket.on_position is not None:
+                    ticket.on_position(position)
+
+
+# Process-wide controller in front of the upstream streaming calls
+admission_controller = AdmissionController()
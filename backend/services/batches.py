@@ -0,0 +1,326 @@
+"""
+Batch completions
+Runs many independent prompts through ``send_to_openrouter_no_stream`` in a
+background task, with a bounded number in flight and per-job retries.
+Results are kept in finishing order, so clients can stream them as NDJSON
+and poll a batch's progress by id.
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+from uuid import uuid4
+
+import httpx
+from dotenv import load_dotenv
+
+from .openrouter import send_to_openrouter_no_stream, upstream_error_code
+from .telemetry import GenerationStats
+from .storage import chat_store
+from .jsonutil import dumps
+from .metrics import BATCH_JOBS, BATCH_JOBS_RUNNING, BATCH_RETRIES
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+# Upstream requests in flight across all batches
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+# Jobs accepted in one batch
+BATCH_MAX_JOBS = int(os.getenv("BATCH_MAX_JOBS", 10000))
+# Attempts per job, including the first
+BATCH_MAX_ATTEMPTS = int(os.getenv("BATCH_MAX_ATTEMPTS", 3))
+# Backoff before retry n is BASE * 2^(n-1) seconds with jitter, at most MAX
+BATCH_RETRY_BASE_DELAY = float(os.getenv("BATCH_RETRY_BASE_DELAY", 1.0))
+BATCH_RETRY_MAX_DELAY = float(os.getenv("BATCH_RETRY_MAX_DELAY", 30.0))
+# How long a finished batch and its results stay available
+BATCH_RETENTION_SECONDS = float(os.getenv("BATCH_RETENTION_SECONDS", 3600))
+
+# Upstream statuses worth another attempt
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+def retry_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    Seconds to wait before the attempt after ``attempt``.
+
+    Exponential backoff with jitter, or the upstream's Retry-After when it
+    asked for longer; never more than ``BATCH_RETRY_MAX_DELAY``.
+    """
+    delay = BATCH_RETRY_BASE_DELAY * 2 ** (attempt - 1) * random.uniform(0.5, 1.0)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return min(delay, BATCH_RETRY_MAX_DELAY)
+
+
+def _retry_after(error: httpx.HTTPStatusError) -> Optional[float]:
+    value = error.response.headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, httpx.TransportError)
+
+
+class BatchJob:
+    """One prompt of a batch."""
+
+    def __init__(
+        self,
+        index: int,
+        model: str,
+        messages: List[Dict[str, str]],
+        params: Optional[Dict[str, Any]] = None,
+        custom_id: Optional[str] = None,
+    ):
+        self.index = index
+        self.id = custom_id if custom_id is not None else str(index)
+        self.model = model
+        self.messages = messages
+        self.params = params
+        # queued, running, succeeded or failed
+        self.status = "queued"
+        self.attempts = 0
+
+
+class Batch:
+    """
+    A submitted batch: its jobs, their results in finishing order, and
+    counters for progress polling.
+    """
+
+    def __init__(self, jobs: List[BatchJob], concurrency: int):
+        self.id = uuid4().hex
+        self.jobs = jobs
+        self.concurrency = concurrency
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.cancelled = False
+        self.task: Optional[asyncio.Task] = None
+        self.results: List[Dict[str, Any]] = []
+        self.succeeded = 0
+        self.failed = 0
+        self.running = 0
+        # Replaced after every result; readers wait on the current one
+        self._changed = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def status(self) -> str:
+        if self.cancelled:
+            return "cancelled"
+        return "completed" if self.done else "running"
+
+    def add_result(self, result: Dict[str, Any]) -> None:
+        self.results.append(result)
+        self._notify()
+
+    def finish(self) -> None:
+        self.finished_at = time.time()
+        self._notify()
+
+    def get_progress(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "total": len(self.jobs),
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "running": self.running,
+            "queued": len(self.jobs) - len(self.results) - self.running,
+            "concurrency": self.concurrency,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+    async def stream_results(self, after: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield results from position ``after`` on, waiting for new ones until
+        the batch finishes.
+
+        Args:
+            after: Number of results the client already has
+        """
+        position = after
+        while True:
+            changed = self._changed
+            while position < len(self.results):
+                yield self.results[position]
+                position += 1
+            if self.done:
+                return
+            await changed.wait()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+
+class BatchRunner:
+    """
+    Runs batches in background tasks that outlive the submitting request.
+
+    Each batch has ``concurrency`` workers pulling its jobs in order, and all
+    batches share ``max_concurrent`` upstream slots. Slots are not held while
+    a job backs off between attempts.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = BATCH_CONCURRENCY,
+        max_attempts: int = BATCH_MAX_ATTEMPTS,
+        retention: float = BATCH_RETENTION_SECONDS,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._batches: Dict[str, Batch] = {}
+
+    def submit(self, jobs: List[BatchJob], concurrency: Optional[int] = None) -> Batch:
+        """
+        Start running a batch.
+
+        Args:
+            jobs: Jobs in submission order
+            concurrency: Jobs of this batch in flight at once (at most
+                         ``max_concurrent``)
+
+        Returns:
+            Batch: The running batch
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+        concurrency = min(concurrency or self.max_concurrent, self.max_concurrent)
+        batch = Batch(jobs, concurrency)
+        self._batches[batch.id] = batch
+        batch.task = asyncio.create_task(self._run(batch))
+        logger.info(f"Started batch {batch.id}: {len(jobs)} jobs, concurrency {concurrency}")
+        return batch
+
+    def get(self, batch_id: str) -> Optional[Batch]:
+        return self._batches.get(batch_id)
+
+    async def cancel(self, batch_id: str) -> Optional[Batch]:
+        """Stop a running batch and wait for it to wind down; finished jobs keep their results."""
+        batch = self._batches.get(batch_id)
+        if batch is not None and not batch.done and batch.task is not None:
+            batch.cancelled = True
+            batch.task.cancel()
+            await asyncio.gather(batch.task, return_exceptions=True)
+        return batch
+
+    async def stop(self) -> None:
+        """Cancel running batches. Called from the app shutdown hook."""
+        tasks = [b.task for b in self._batches.values() if b.task is not None and not b.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._batches.clear()
+
+    async def _run(self, batch: Batch) -> None:
+        pending = iter(batch.jobs)
+
+        async def worker() -> None:
+            for job in pending:
+                await self._run_job(batch, job)
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(batch.concurrency, len(batch.jobs)))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            batch.finish()
+            logger.info(
+                f"Batch {batch.id} {batch.status}: "
+                f"{batch.succeeded} succeeded, {batch.failed} failed of {len(batch.jobs)}"
+            )
+            asyncio.get_running_loop().call_later(self.retention, self._batches.pop, batch.id, None)
+
+    async def _run_job(self, batch: Batch, job: BatchJob) -> None:
+        job.status = "running"
+        batch.running += 1
+        started = time.monotonic()
+        result: Dict[str, Any] = {"id": job.id, "index": job.index, "model": job.model}
+        try:
+            while True:
+                job.attempts += 1
+                stats = GenerationStats(job.model, streamed=False)
+                retry_after = None
+                try:
+                    async with self._slots:
+                        BATCH_JOBS_RUNNING.inc()
+                        try:
+                            content = await send_to_openrouter_no_stream(
+                                job.messages, job.model, job.params, stats=stats
+                            )
+                        finally:
+                            BATCH_JOBS_RUNNING.dec()
+                    record = stats.to_record()
+                    job.status = "succeeded"
+                    result.update({
+                        "status": "succeeded",
+                        "content": content,
+                        "usage": {
+                            "prompt_tokens": record["tokens_prompt"],
+                            "completion_tokens": record["tokens_completion"],
+                            "estimated": record["usage_estimated"],
+                        },
+                        "cached": stats.cached,
+                    })
+                    break
+                except Exception as e:
+                    retryable = _is_retryable(e) and job.attempts < self.max_attempts
+                    if isinstance(e, httpx.HTTPStatusError):
+                        retry_after = _retry_after(e)
+                    if not retryable:
+                        job.status = "failed"
+                        error = upstream_error_code(e) if isinstance(e, httpx.HTTPError) else type(e).__name__
+                        result.update({"status": "failed", "error": f"{error}: {e}"})
+                        logger.warning(f"Batch {batch.id} job {job.id} failed after {job.attempts} attempts: {e}")
+                        break
+                    BATCH_RETRIES.inc(model=job.model)
+                finally:
+                    # Latency/usage records like other generations, one per upstream call
+                    if stats.started_at is not None and not stats.cached:
+                        await chat_store.add_response(stats.to_record(), "")
+                await asyncio.sleep(retry_delay(job.attempts, retry_after))
+        except asyncio.CancelledError:
+            # Cancelled mid-job: the job is neither finished nor reported, and
+            # the cancellation must reach the worker so it stops taking jobs
+            batch.running -= 1
+            job.status = "queued"
+            raise
+        batch.running -= 1
+        if job.status == "succeeded":
+            batch.succeeded += 1
+        else:
+            batch.failed += 1
+        BATCH_JOBS.inc(model=job.model, status=job.status)
+        result["attempts"] = job.attempts
+        result["duration_ms"] = int((time.monotonic() - started) * 1000)
+        batch.add_result(result)
+
+
+async def ndjson_results(batch: Batch, after: int = 0) -> AsyncIterator[bytes]:
+    """Encode a batch's results as NDJSON lines, following it until it finishes."""
+    async for result in batch.stream_results(after):
+        yield dumps(result) + b"\n"
+
+
+# Process-wide runner used by the batch endpoints
+batch_runner = BatchRunner()
@@ -0,0 +1,241 @@
+"""
+Completion cache
+Opt-in exact-match cache for chat completions, keyed on the model, the
+normalized message list and the sampling parameters. An in-memory LRU with
+TTL sits in front of an optional SQLite-backed second tier.
+"""
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from .metrics import CACHE_REQUESTS
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+COMPLETION_CACHE_ENABLED = os.getenv("COMPLETION_CACHE_ENABLED", "false").lower() == "true"
+COMPLETION_CACHE_MAX_ENTRIES = int(os.getenv("COMPLETION_CACHE_MAX_ENTRIES", 1000))
+COMPLETION_CACHE_MAX_BYTES = int(os.getenv("COMPLETION_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+COMPLETION_CACHE_TTL = float(os.getenv("COMPLETION_CACHE_TTL", 3600))
+# Path of the SQLite second tier; empty disables it
+COMPLETION_CACHE_SQLITE_PATH = os.getenv("COMPLETION_CACHE_SQLITE_PATH", "")
+# Characters per chunk when a cached completion is replayed as a stream
+COMPLETION_CACHE_REPLAY_CHUNK_SIZE = int(os.getenv("COMPLETION_CACHE_REPLAY_CHUNK_SIZE", 32))
+
+
+def make_cache_key(
+    model: str,
+    messages: List[Dict[str, str]],
+    params: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Hash a request into a cache key.
+
+    Message content is normalized (line endings, surrounding whitespace) so
+    trivially different retries of the same prompt share an entry.
+
+    Args:
+        model: Model identifier
+        messages: Message dicts with 'role' and 'content'
+        params: Sampling parameters sent with the request
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    normalized = [
+        [message["role"], message["content"].replace("\r\n", "\n").strip()]
+        for message in messages
+    ]
+    material = json.dumps(
+        [model, normalized, sorted((params or {}).items())],
+        ensure_ascii=False,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def replay_chunks(text: str, chunk_size: int = COMPLETION_CACHE_REPLAY_CHUNK_SIZE) -> Iterator[str]:
+    """Split a cached completion into stream-sized chunks."""
+    for start in range(0, len(text), chunk_size):
+        yield text[start:start + chunk_size]
+
+
+class _SQLiteTier:
+    """Second cache tier in a local SQLite file. Calls run in a worker thread."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completion_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_completion_cache_expires_at "
+            "ON completion_cache (expires_at)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM completion_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def put(self, key: str, value: str, expires_at: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completion_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            self._conn.execute("DELETE FROM completion_cache WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CompletionCache:
+    """
+    Two-tier exact-match cache for completion text.
+
+    The memory tier is an LRU bounded by entry count and total bytes; entries
+    also expire after ``ttl`` seconds. Memory misses fall through to the
+    SQLite tier when one is configured, and disk hits are promoted to memory.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = COMPLETION_CACHE_ENABLED,
+        max_entries: int = COMPLETION_CACHE_MAX_ENTRIES,
+        max_bytes: int = COMPLETION_CACHE_MAX_BYTES,
+        ttl: float = COMPLETION_CACHE_TTL,
+        sqlite_path: str = COMPLETION_CACHE_SQLITE_PATH,
+    ):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sqlite_path = sqlite_path
+
+        # key -> (text, size in bytes, expires_at)
+        self._entries: "OrderedDict[str, Tuple[str, int, float]]" = OrderedDict()
+        self._bytes = 0
+        self._disk: Optional[_SQLiteTier] = None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _disk_tier(self) -> Optional[_SQLiteTier]:
+        if self._disk is None and self.sqlite_path:
+            self._disk = _SQLiteTier(self.sqlite_path)
+        return self._disk
+
+    async def get(self, key: str) -> Optional[str]:
+        """Return the cached text for a key, or None on a miss."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            text, _, expires_at = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                CACHE_REQUESTS.inc(cache="completion", result="hit")
+                return text
+            self._remove(key)
+
+        disk = self._disk_tier()
+        if disk is not None:
+            row = await asyncio.to_thread(disk.get, key)
+            if row is not None:
+                text, expires_at = row
+                self._store(key, text, expires_at)
+                self.hits += 1
+                self.disk_hits += 1
+                CACHE_REQUESTS.inc(cache="completion", result="hit")
+                return text
+
+        self.misses += 1
+        CACHE_REQUESTS.inc(cache="completion", result="miss")
+        return None
+
+    async def put(self, key: str, text: str) -> None:
+        """Cache a completed response."""
+        expires_at = time.time() + self.ttl
+        self._store(key, text, expires_at)
+        disk = self._disk_tier()
+        if disk is not None:
+            await asyncio.to_thread(disk.put, key, text, expires_at)
+
+    def _store(self, key: str, text: str, expires_at: float) -> None:
+        size = len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (text, size, expires_at)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def clear(self) -> None:
+        """Drop every in-memory entry."""
+        self._entries.clear()
+        self._bytes = 0
+
+    def close(self) -> None:
+        """Close the SQLite tier, if open."""
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Hit/miss counters and current size.
+
+        Returns:
+            dict: Counters, hit rate and memory usage
+        """
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "sqlite_tier": bool(self.sqlite_path),
+        }
+
+
+# Process-wide cache used by the OpenRouter service
+completion_cache = CompletionCache()
@@ -0,0 +1,291 @@
+"""
+Model catalog service
+Caches the OpenRouter model list with single-flight refreshes and
+stale-while-revalidate, so an expiry never turns into a burst of upstream calls.
+Each refresh builds an index for lookups, filters, search and sorting, with
+precompressed response bodies and ETags.
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+from .openrouter import get_available_models
+from .metrics import CACHE_REQUESTS
+from .jsonutil import dumps
+from .http_cache import CompressedBody, make_etag
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Seconds before the cached model list is considered stale
+MODELS_CACHE_TTL = float(os.getenv("MODELS_CACHE_TTL", 3600))
+# Rendered /models responses kept per catalog version (one per distinct query)
+CATALOG_QUERY_CACHE_SIZE = int(os.getenv("CATALOG_QUERY_CACHE_SIZE", 128))
+
+# Sort keys accepted by CatalogIndex.query
+SORT_KEYS = ("id", "name", "context_length", "created")
+
+
+class CatalogQuery(NamedTuple):
+    """Filters and ordering for the model list; all optional."""
+
+    # Comma-separated provider names
+    provider: Optional[str] = None
+    modality: Optional[str] = None
+    min_context: Optional[int] = None
+    search: Optional[str] = None
+    sort: Optional[str] = None
+    descending: bool = False
+
+
+def _modalities(model: Dict[str, Any]) -> Set[str]:
+    """Input and output modalities, from ``architecture`` (``text`` if unknown)."""
+    architecture = model.get("architecture") or {}
+    found = set(architecture.get("input_modalities") or []) | set(architecture.get("output_modalities") or [])
+    if not found and architecture.get("modality"):
+        # Older shape: "text+image->text"
+        for side in architecture["modality"].split("->"):
+            found.update(part for part in side.split("+") if part)
+    return {modality.lower() for modality in found} or {"text"}
+
+
+def _sort_value(model: Dict[str, Any], key: str) -> Any:
+    if key == "name":
+        return (model.get("name") or model["id"]).lower()
+    if key in ("context_length", "created"):
+        return model.get(key) or 0
+    return model["id"]
+
+
+class CatalogIndex:
+    """
+    Lookup structures over one catalog snapshot, built once per refresh.
+
+    Providers (the id prefix before ``/``) and modalities map to model
+    positions, every sort key has a precomputed order, and search runs over
+    lowercased id, name and description. Rendered responses are cached per
+    query, with their gzip/brotli encodings and a weak ETag derived from the
+    catalog contents and the query, so the ETag only changes when the
+    answer does.
+    """
+
+    def __init__(self, models: List[Dict[str, Any]], cache_size: int = CATALOG_QUERY_CACHE_SIZE):
+        self.models = models
+        self.by_id = {model["id"]: model for model in models}
+        self.version = make_etag(dumps(models))
+        self.context_lengths = {
+            model["id"]: model["context_length"]
+            for model in models
+            if model.get("context_length")
+        }
+        self._providers: Dict[str, Set[int]] = {}
+        self._modalities: Dict[str, Set[int]] = {}
+        self._search_text: List[str] = []
+        for position, model in enumerate(models):
+            provider = model["id"].split("/", 1)[0].lower()
+            self._providers.setdefault(provider, set()).add(position)
+            for modality in _modalities(model):
+                self._modalities.setdefault(modality, set()).add(position)
+            self._search_text.append(
+                " ".join((model["id"], model.get("name") or "", model.get("description") or "")).lower()
+            )
+        self._order = {
+            key: sorted(range(len(models)), key=lambda position: _sort_value(models[position], key))
+            for key in SORT_KEYS
+        }
+        self._cache_size = cache_size
+        self._rendered: "OrderedDict[Tuple, CompressedBody]" = OrderedDict()
+        # The unfiltered list is what most clients ask for: encode it up front
+        self.render(CatalogQuery(), cached=True)
+
+    @property
+    def providers(self) -> List[str]:
+        return sorted(self._providers)
+
+    def query(self, query: CatalogQuery) -> List[Dict[str, Any]]:
+        """
+        Models matching every filter, in the requested order.
+
+        Args:
+            query: Filters and sort; ``search`` matches when every
+                   whitespace-separated term appears in the id, name or
+                   description (case-insensitive)
+
+        Returns:
+            List[Dict]: Matching models (upstream order unless sorted)
+
+        Raises:
+            ValueError: If the sort key is unknown
+        """
+        if query.sort is not None and query.sort not in SORT_KEYS:
+            raise ValueError(f"Unknown sort key '{query.sort}' (expected one of: {', '.join(SORT_KEYS)})")
+
+        selected: Optional[Set[int]] = None
+        if query.provider:
+            selected = set()
+            for provider in query.provider.lower().split(","):
+                selected |= self._providers.get(provider.strip(), set())
+        if query.modality:
+            matching = self._modalities.get(query.modality.lower(), set())
+            selected = matching if selected is None else selected & matching
+        order = self._order[query.sort] if query.sort else range(len(self.models))
+        if query.descending and query.sort:
+            order = reversed(order)
+        terms = query.search.lower().split() if query.search else []
+
+        results = []
+        for position in order:
+            if selected is not None and position not in selected:
+                continue
+            model = self.models[position]
+            if query.min_context and (model.get("context_length") or 0) < query.min_context:
+                continue
+            if terms and not all(term in self._search_text[position] for term in terms):
+                continue
+            results.append(model)
+        return results
+
+    def render(self, query: CatalogQuery, cached: bool) -> CompressedBody:
+        """The ``/models`` response body for a query, from the cache when possible."""
+        key = (query, cached)
+        body = self._rendered.get(key)
+        if body is not None:
+            self._rendered.move_to_end(key)
+            return body
+        # The ETag is a hash of the body itself, so it also tells the cached flag apart
+        body = CompressedBody(dumps({"models": self.query(query), "cached": cached}))
+        self._rendered[key] = body
+        while len(self._rendered) > self._cache_size:
+            self._rendered.popitem(last=False)
+        return body
+
+    def render_model(self, model_id: str) -> Optional[CompressedBody]:
+        """The response body for one model, or None if it is not in the catalog."""
+        model = self.by_id.get(model_id)
+        if model is None:
+            return None
+        key = ("model", model_id)
+        body = self._rendered.get(key)
+        if body is None:
+            body = CompressedBody(dumps(model))
+            self._rendered[key] = body
+            while len(self._rendered) > self._cache_size:
+                self._rendered.popitem(last=False)
+        return body
+
+
+class ModelCatalog:
+    """
+    Cached model list with coalesced refreshes.
+
+    - Cold cache: callers share one in-flight fetch and wait for it.
+    - Stale cache: callers get the stale list immediately while a single
+      background refresh runs.
+    - Failed refresh: the last good list keeps being served; the error is
+      only raised when there is nothing cached at all.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[], Awaitable[List[Dict[str, Any]]]] = get_available_models,
+        ttl: float = MODELS_CACHE_TTL,
+    ):
+        self._fetch = fetch
+        self.ttl = ttl
+        self._index: Optional[CatalogIndex] = None
+        self._fetched_at: Optional[float] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def age(self) -> Optional[float]:
+        """Seconds since the last successful fetch, or None if never fetched."""
+        if self._fetched_at is None:
+            return None
+        return time.monotonic() - self._fetched_at
+
+    def is_stale(self) -> bool:
+        return self._index is None or self.age >= self.ttl
+
+    async def get(self) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Return the model list.
+
+        Returns:
+            Tuple[List[Dict], bool]: The models and whether they came from cache
+
+        Raises:
+            ValueError: If the API key is not configured (cold cache only)
+            httpx.HTTPError: If the upstream fetch fails (cold cache only)
+        """
+        index, cached = await self.get_index()
+        return index.models, cached
+
+    async def get_index(self) -> Tuple[CatalogIndex, bool]:
+        """
+        Return the index of the current model list (same caching as ``get``).
+
+        Returns:
+            Tuple[CatalogIndex, bool]: The index and whether it came from cache
+
+        Raises:
+            ValueError: If the API key is not configured (cold cache only)
+            httpx.HTTPError: If the upstream fetch fails (cold cache only)
+        """
+        if self._index is None:
+            CACHE_REQUESTS.inc(cache="models", result="miss")
+            # shield() keeps the shared fetch alive if this caller goes away
+            await asyncio.shield(self._ensure_refresh())
+            return self._index, False
+
+        if self.is_stale():
+            logger.info(f"Serving stale models (age: {self.age:.0f}s) while refreshing")
+            CACHE_REQUESTS.inc(cache="models", result="stale")
+            self._ensure_refresh()
+        else:
+            logger.info(f"Returning cached models (age: {self.age:.0f}s)")
+            CACHE_REQUESTS.inc(cache="models", result="hit")
+        return self._index, True
+
+    def context_length(self, model_id: str) -> Optional[int]:
+        """Context length of a model from the cached catalog, if known."""
+        if self._index is None:
+            return None
+        return self._index.context_lengths.get(model_id)
+
+    def _ensure_refresh(self) -> asyncio.Task:
+        """Start a refresh unless one is already running, and return it."""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh())
+        return self._refresh_task
+
+    async def _refresh(self) -> None:
+        try:
+            models = await self._fetch()
+            # Indexing and compressing the bodies is CPU work: keep it off the event loop
+            index = await asyncio.to_thread(CatalogIndex, models)
+        except Exception as e:
+            self.last_error = str(e)
+            if self._index is None:
+                raise
+            logger.error(f"Model list refresh failed, keeping last good copy: {e}")
+            return
+
+        if self._index is not None and index.version == self._index.version:
+            # Unchanged catalog: keep the warm response cache (and the ETags)
+            index = self._index
+        self._index = index
+        self._fetched_at = time.monotonic()
+        self.last_error = None
+        logger.info(f"Fetched {len(models)} models from OpenRouter")
+
+
+# Process-wide catalog used by the API
+model_catalog = ModelCatalog()
@@ -0,0 +1,117 @@
+"""
+Model comparison
+Streams the answers of several models to the same prompt at the same time
+over one SSE connection, every event tagged with its model
+"""
+import os
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List
+
+import httpx
+from dotenv import load_dotenv
+
+from .openrouter import send_to_openrouter
+from .admission import AdmissionRejected, Ticket, admission_controller
+from .telemetry import GenerationStats
+from .storage import chat_store
+from .sse import coalesce, sse_event
+from .metrics import SSE_ACTIVE_STREAMS
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+COMPARE_MAX_MODELS = int(os.getenv("COMPARE_MAX_MODELS", 5))
+
+# Put in the event queue when a model's task ends
+_FINISHED = object()
+
+
+def _summary(model: str, stats: GenerationStats) -> Dict[str, Any]:
+    record = stats.to_record()
+    return {
+        "model": model,
+        "ttft_ms": record["ttft_ms"],
+        "duration_ms": record["completion_time_ms"],
+        "chunk_count": record["chunk_count"],
+        "tokens_completion": record["tokens_completion"],
+        "usage_estimated": record["usage_estimated"],
+        "cached": stats.cached,
+    }
+
+
+async def stream_comparison(
+    prompts: Dict[str, List[Dict[str, str]]],
+    tickets: Dict[str, Ticket],
+    conversation_id: str = "",
+) -> AsyncIterator[bytes]:
+    """
+    Run one streaming completion per model concurrently and merge their events.
+
+    Each model waits for its own admission slot, so comparisons share the
+    upstream limits with /stream. Hedging is off: a comparison wants each
+    model's own answer. Closing the generator (client disconnect) cancels
+    the requests still running.
+
+    Args:
+        prompts: Model id -> messages to send it (the context window may
+                 differ per model)
+        tickets: Model id -> ticket from ``admission_controller.reserve``
+        conversation_id: Conversation the prompt came from, for the recorded
+                         generation metrics
+
+    Yields:
+        bytes: SSE frames, in arrival order:
+            ``{"model": m, "queue_position": n}`` while waiting for a slot,
+            ``{"model": m, "content": "..."}`` for each chunk,
+            ``{"model": m, "done": true, "ttft_ms": ..., "duration_ms": ...}``
+            or ``{"model": m, "error": "..."}`` when a model ends, and finally
+            ``{"done": true, "results": [...]}`` with every model's timings
+    """
+    events: "asyncio.Queue[Any]" = asyncio.Queue()
+    results: Dict[str, Dict[str, Any]] = {}
+
+    async def run(model: str) -> None:
+        stats = GenerationStats(model)
+        try:
+            async with admission_controller.slot(
+                tickets[model],
+                on_position=lambda position: events.put_nowait({"model": model, "queue_position": position}),
+            ):
+                async for chunk in coalesce(send_to_openrouter(prompts[model], model, stats=stats, hedge=False)):
+                    events.put_nowait({"model": model, "content": chunk})
+            results[model] = _summary(model, stats)
+            events.put_nowait({**results[model], "done": True})
+        except (AdmissionRejected, ValueError, httpx.HTTPError) as e:
+            logger.error(f"Comparison request for {model} failed: {e}")
+            results[model] = {**_summary(model, stats), "error": str(e)}
+            events.put_nowait({"model": model, "error": str(e)})
+        except Exception as e:
+            logger.error(f"Unexpected error comparing {model}: {e}")
+            results[model] = {**_summary(model, stats), "error": f"Unexpected error: {e}"}
+            events.put_nowait({"model": model, "error": f"Unexpected error: {e}"})
+        finally:
+            # Same latency/usage records as /stream, without a message
+            if stats.started_at is not None and not stats.cached:
+                await chat_store.add_response(stats.to_record(), conversation_id)
+            events.put_nowait(_FINISHED)
+
+    SSE_ACTIVE_STREAMS.inc()
+    tasks = [asyncio.create_task(run(model)) for model in prompts]
+    try:
+        running = len(tasks)
+        while running:
+            event = await events.get()
+            if event is _FINISHED:
+                running -= 1
+                continue
+            yield sse_event(event)
+        yield sse_event({"done": True, "results": [results[model] for model in prompts]})
+    finally:
+        SSE_ACTIVE_STREAMS.dec()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
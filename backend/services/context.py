@@ -0,0 +1,204 @@
+"""
+Context window builder
+Chooses which conversation messages to send upstream so a request fits the
+model's context length, keeping system/pinned messages and the newest turns
+"""
+import os
+import logging
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+# Hard cap on prompt tokens; 0 means "whatever the model's context allows"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 0))
+# Tokens left free for the model's reply
+CONTEXT_RESPONSE_RESERVE = int(os.getenv("CONTEXT_RESPONSE_RESERVE", 1024))
+# Used when a model is missing from the /models catalog
+DEFAULT_CONTEXT_LENGTH = int(os.getenv("DEFAULT_CONTEXT_LENGTH", 8192))
+# Number of conversations whose token estimates are kept in memory
+CONTEXT_CACHE_SIZE = int(os.getenv("CONTEXT_CACHE_SIZE", 1000))
+
+# Rough per-message framing cost (role, separators) in chat templates
+MESSAGE_OVERHEAD_TOKENS = 4
+MIN_TOKEN_BUDGET = 256
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate for a message (~4 characters per token plus framing).
+
+    Args:
+        text: Message content
+
+    Returns:
+        int: Estimated token count
+    """
+    return (len(text) + 3) // 4 + MESSAGE_OVERHEAD_TOKENS
+
+
+def token_budget(context_length: Optional[int]) -> int:
+    """
+    Prompt token budget for a model.
+
+    Args:
+        context_length: The model's context length, or None if unknown
+
+    Returns:
+        int: Tokens available for the prompt after reserving room for the reply
+    """
+    budget = (context_length or DEFAULT_CONTEXT_LENGTH) - CONTEXT_RESPONSE_RESERVE
+    if CONTEXT_TOKEN_BUDGET > 0:
+        budget = min(budget, CONTEXT_TOKEN_BUDGET)
+    return max(budget, MIN_TOKEN_BUDGET)
+
+
+def _is_pinned(message: Dict[str, Any]) -> bool:
+    return message.get("role") == "system" or bool(message.get("pinned"))
+
+
+class ContextWindow:
+    """
+    Token estimates for one conversation, maintained incrementally.
+
+    Each message is estimated once when it is appended. A running prefix sum
+    over unpinned messages lets ``select`` find the oldest message that still
+    fits with a binary search instead of walking the history. Messages that
+    were still streaming (status 'partial') are re-read on the next sync.
+    """
+
+    def __init__(self):
+        self._messages: List[Dict[str, str]] = []
+        self._ids: List[str] = []
+        self._pinned: List[int] = []
+        self._pinned_tokens = 0
+        # _prefix[i] = tokens of unpinned messages before index i
+        self._prefix: List[int] = [0]
+        # Index of the oldest message that was partial when appended
+        self._first_partial: Optional[int] = None
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def append(self, message: Dict[str, Any]) -> None:
+        """Add the next message of the conversation."""
+        tokens = estimate_tokens(message["content"])
+        index = len(self._messages)
+        self._messages.append({"role": message["role"], "content": message["content"]})
+        self._ids.append(message["id"])
+        if message.get("status") == "partial" and self._first_partial is None:
+            self._first_partial = index
+        if _is_pinned(message):
+            self._pinned.append(index)
+            self._pinned_tokens += tokens
+            self._prefix.append(self._prefix[-1])
+        else:
+            self._prefix.append(self._prefix[-1] + tokens)
+
+    def sync(self, messages: List[Dict[str, Any]]) -> None:
+        """
+        Catch up with the stored history.
+
+        Only messages past the ones already seen are estimated. If the history
+        no longer starts with what we have (e.g. another worker changed it),
+        the window is rebuilt.
+        """
+        known = len(self._ids)
+        if known > len(messages) or (known and messages[known - 1]["id"] != self._ids[-1]):
+            self.__init__()
+            known = 0
+        elif self._first_partial is not None:
+            known = self._first_partial
+            self._truncate(known)
+        for message in messages[known:]:
+            self.append(message)
+
+    def _truncate(self, length: int) -> None:
+        """Drop every message from index ``length`` on."""
+        del self._messages[length:]
+        del self._ids[length:]
+        del self._prefix[length + 1:]
+        self._pinned = [i for i in self._pinned if i < length]
+        self._pinned_tokens = sum(estimate_tokens(self._messages[i]["content"]) for i in self._pinned)
+        self._first_partial = None
+
+    def select(self, budget: int) -> List[Dict[str, str]]:
+        """
+        Pick the messages to send.
+
+        Pinned (system) messages are always kept. The rest of the budget goes
+        to the newest messages; the latest message is always included even if
+        it alone is over budget.
+
+        Args:
+            budget: Prompt token budget
+
+        Returns:
+            List[Dict]: Messages with 'role' and 'content', in conversation order
+        """
+        count = len(self._messages)
+        if count == 0:
+            return []
+        remaining = budget - self._pinned_tokens
+        total = self._prefix[count]
+        # Oldest index whose suffix of unpinned messages fits in `remaining`
+        start = bisect_left(self._prefix, total - remaining, 0, count)
+        start = min(start, count - 1)
+
+        selected = [self._messages[i] for i in self._pinned if i < start]
+        selected.extend(self._messages[start:])
+        dropped = count - len(selected)
+        if dropped:
+            logger.debug(f"Context trimmed: dropped {dropped} of {count} messages")
+        return selected
+
+
+class ContextBuilder:
+    """Keeps a bounded LRU of ContextWindows keyed by conversation id."""
+
+    def __init__(self, max_conversations: int = CONTEXT_CACHE_SIZE):
+        self.max_conversations = max_conversations
+        self._windows: "OrderedDict[str, ContextWindow]" = OrderedDict()
+
+    def build(
+        self,
+        conversation_id: str,
+        messages: List[Dict[str, Any]],
+        context_length: Optional[int] = None,
+    ) -> List[Dict[str, str]]:
+        """
+        Build the upstream message list for a conversation.
+
+        Args:
+            conversation_id: Conversation the messages belong to
+            messages: Full stored history, oldest first
+            context_length: The target model's context length, if known
+
+        Returns:
+            List[Dict]: Messages that fit the token budget
+        """
+        window = self._windows.get(conversation_id)
+        if window is None:
+            window = ContextWindow()
+            self._windows[conversation_id] = window
+            if len(self._windows) > self.max_conversations:
+                self._windows.popitem(last=False)
+        else:
+            self._windows.move_to_end(conversation_id)
+        window.sync(messages)
+        return window.select(token_budget(context_length))
+
+    def discard(self, conversation_id: str) -> None:
+        """Forget a conversation (e.g. after it is deleted)."""
+        self._windows.pop(conversation_id, None)
+
+
+# Process-wide builder used by the API
+context_builder = ContextBuilder()
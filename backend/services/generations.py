@@ -0,0 +1,322 @@
+"""
+Generation registry
+Each streamed answer runs as a background task that publishes numbered SSE
+events. Every connected client is a subscriber with its own bounded queue, so
+several tabs can follow one answer and a slow client cannot hold up the
+others. A bounded replay buffer lets a client that reconnects with
+``Last-Event-ID`` (or joins late) catch up without a second upstream call.
+"""
+import os
+import asyncio
+import logging
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+from uuid import uuid4
+
+from dotenv import load_dotenv
+
+from .sse import sse_event
+from .metrics import GENERATIONS_ACTIVE, SSE_SLOW_CONSUMERS
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+# Events kept per generation for replay (frames are coalesced, so each holds
+# up to SSE_COALESCE_MAX_BYTES characters)
+GENERATION_BUFFER_EVENTS = int(os.getenv("GENERATION_BUFFER_EVENTS", 1024))
+# How long a finished generation stays available for reconnects
+GENERATION_RETENTION_SECONDS = float(os.getenv("GENERATION_RETENTION_SECONDS", 120))
+# Frames a subscriber may have waiting before it counts as a slow consumer
+GENERATION_SUBSCRIBER_QUEUE = int(os.getenv("GENERATION_SUBSCRIBER_QUEUE", 256))
+# drop: discard the backlog and resync with a snapshot; disconnect: end the stream
+GENERATION_SLOW_CONSUMER_POLICY = os.getenv("GENERATION_SLOW_CONSUMER_POLICY", "drop")
+
+# Seconds a generation may run with no connected client before the upstream
+# call is cancelled (leaves time to reconnect); negative: never cancel
+GENERATION_CANCEL_GRACE_SECONDS = float(os.getenv("GENERATION_CANCEL_GRACE_SECONDS", 10))
+
+SLOW_CONSUMER_POLICIES = ("drop", "disconnect")
+
+
+def parse_event_id(event_id: str) -> Tuple[str, int]:
+    """
+    Split an SSE event id into generation id and sequence number.
+
+    Args:
+        event_id: Value of the Last-Event-ID header (``<generation id>:<seq>``)
+
+    Returns:
+        Tuple[str, int]: Generation id and the last sequence number received
+
+    Raises:
+        ValueError: If the id is malformed
+    """
+    generation_id, _, seq = event_id.strip().rpartition(":")
+    if not generation_id:
+        raise ValueError("Invalid event id")
+    return generation_id, int(seq)
+
+
+class _Subscriber:
+    """A connected client: frames waiting to be sent, ``None`` ends the stream."""
+
+    def __init__(self):
+        # Bounded by Generation.publish, not by the queue, so the end marker always fits
+        self.queue: "asyncio.Queue[Optional[bytes]]" = asyncio.Queue()
+
+
+class Generation:
+    """
+    One answer being generated for a conversation.
+
+    Events are numbered from 1. ``publish`` pushes each frame into every
+    subscriber's queue without waiting. A subscriber with ``queue_size``
+    frames already waiting is handled by ``slow_consumer_policy``:
+
+    - drop: its backlog is discarded and replaced by a ``snapshot`` event
+      with all the text so far, after which it follows the live events again
+    - disconnect: its stream ends; EventSource reconnects with Last-Event-ID
+      and resumes from the replay buffer
+
+    The newest ``buffer_size`` events are kept for replay; a client that
+    resumes from further back gets a ``snapshot`` instead of the evicted
+    content events.
+
+    Client disconnects are detected by the ASGI server (Starlette's
+    streaming response listens for ``http.disconnect`` and cancels the
+    iteration of ``events``). Once the last subscriber has been gone for
+    ``cancel_grace`` seconds, the generation task is cancelled, which closes
+    the upstream stream, and ``abandoned`` is set.
+    """
+
+    def __init__(
+        self,
+        conversation_id: str,
+        model: str,
+        reply_to: Optional[str] = None,
+        buffer_size: int = GENERATION_BUFFER_EVENTS,
+        queue_size: int = GENERATION_SUBSCRIBER_QUEUE,
+        slow_consumer_policy: str = GENERATION_SLOW_CONSUMER_POLICY,
+        cancel_grace: float = GENERATION_CANCEL_GRACE_SECONDS,
+    ):
+        if slow_consumer_policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(
+                f"Unknown slow consumer policy '{slow_consumer_policy}' "
+                f"(expected one of: {', '.join(SLOW_CONSUMER_POLICIES)})"
+            )
+        self.id = uuid4().hex
+        self.conversation_id = conversation_id
+        self.model = model
+        # Id of the last message in the history being answered
+        self.reply_to = reply_to
+        self.queue_size = queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        self.cancel_grace = cancel_grace
+        self.seq = 0
+        self.done = False
+        # Set when the task was cancelled because every client left
+        self.abandoned = False
+        self.task: Optional[asyncio.Task] = None
+        self._idle_timer: Optional[asyncio.TimerHandle] = None
+        self._events: Deque[Tuple[int, bytes]] = deque(maxlen=buffer_size)
+        self._parts: List[str] = []
+        # Sequence number of the last content event
+        self._text_seq = 0
+        self._subscribers: Set[_Subscriber] = set()
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def publish(self, payload: Dict[str, Any]) -> None:
+        """Append an event and hand it to every subscriber."""
+        self.seq += 1
+        frame = sse_event(payload, event_id=f"{self.id}:{self.seq}")
+        self._events.append((self.seq, frame))
+        if "content" in payload:
+            self._parts.append(payload["content"])
+            self._text_seq = self.seq
+        for subscriber in list(self._subscribers):
+            if subscriber.queue.qsize() < self.queue_size:
+                subscriber.queue.put_nowait(frame)
+            else:
+                self._slow_consumer(subscriber, frame, content="content" in payload)
+
+    def finish(self) -> None:
+        """Mark the generation done and end every subscriber's stream."""
+        self.done = True
+        self._stop_idle_timer()
+        for subscriber in self._subscribers:
+            subscriber.queue.put_nowait(None)
+        self._subscribers.clear()
+
+    async def events(self, after: int = 0) -> AsyncIterator[bytes]:
+        """
+        Yield encoded events with a sequence number above ``after``, then
+        follow new ones until the generation finishes.
+
+        Args:
+            after: Last sequence number the client has (0 for a new client)
+
+        Yields:
+            bytes: SSE frames
+        """
+        subscriber = _Subscriber()
+        # Replay and registration happen together, so no event is missed or repeated
+        replay = self._replay(after)
+        if self.done:
+            subscriber.queue.put_nowait(None)
+        else:
+            self._subscribers.add(subscriber)
+            self._stop_idle_timer()
+        try:
+            for frame in replay:
+                yield frame
+            while True:
+                frame = await subscriber.queue.get()
+                if frame is None:
+                    return
+                yield frame
+        finally:
+            self._subscribers.discard(subscriber)
+            if not self._subscribers and not self.done:
+                self._start_idle_timer()
+
+    def _replay(self, after: int) -> List[bytes]:
+        if not self._events or after >= self.seq:
+            return []
+        frames = []
+        if self._events[0][0] > after + 1:
+            # Content the client missed was evicted: send the text so far
+            after = max(self._text_seq, self._events[0][0] - 1)
+            frames.append(self._snapshot(after))
+        start = max(0, after + 1 - self._events[0][0])
+        frames.extend(frame for _, frame in list(self._events)[start:])
+        return frames
+
+    def _start_idle_timer(self) -> None:
+        if self.cancel_grace < 0 or self._idle_timer is not None:
+            return
+        self._idle_timer = asyncio.get_running_loop().call_later(self.cancel_grace, self._abandon)
+
+    def _stop_idle_timer(self) -> None:
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+
+    def _abandon(self) -> None:
+        self._idle_timer = None
+        if self.done or self._subscribers or self.task is None:
+            return
+        logger.info(f"No clients left for generation {self.id}, cancelling it")
+        self.abandoned = True
+        self.task.cancel()
+
+    def _snapshot(self, seq: int) -> bytes:
+        return sse_event({"snapshot": self.text}, event_id=f"{self.id}:{seq}")
+
+    def _slow_consumer(self, subscriber: _Subscriber, frame: bytes, content: bool) -> None:
+        SSE_SLOW_CONSUMERS.inc(policy=self.slow_consumer_policy)
+        queue = subscriber.queue
+        while not queue.empty():
+            queue.get_nowait()
+        if self.slow_consumer_policy == "disconnect":
+            self._subscribers.discard(subscriber)
+            queue.put_nowait(None)
+            return
+        queue.put_nowait(self._snapshot(self._text_seq))
+        if not content:
+            # Control events (done, error) are not part of the snapshot
+            queue.put_nowait(frame)
+
+
+class GenerationRegistry:
+    """
+    Active (and recently finished) generations by id, plus the running
+    generation of each conversation so later clients can join it.
+    """
+
+    def __init__(self, retention: float = GENERATION_RETENTION_SECONDS):
+        self.retention = retention
+        self._generations: Dict[str, Generation] = {}
+        # conversation id -> generation currently running for it
+        self._running: Dict[str, Generation] = {}
+
+    def start(
+        self,
+        conversation_id: str,
+        model: str,
+        produce: Callable[[Generation], Awaitable[None]],
+        reply_to: Optional[str] = None,
+    ) -> Generation:
+        """
+        Run ``produce`` in a background task that outlives the request.
+
+        Args:
+            conversation_id: Conversation the answer belongs to
+            model: Model generating the answer
+            produce: Coroutine function that publishes the events
+            reply_to: Id of the last message in the history being answered
+
+        Returns:
+            Generation: The new generation
+        """
+        generation = Generation(conversation_id, model, reply_to)
+        self._generations[generation.id] = generation
+        self._running[conversation_id] = generation
+        generation.task = asyncio.create_task(self._run(generation, produce))
+        # Armed now, not when the last client leaves: a client that disconnects
+        # before its stream first runs never subscribes, and never leaves
+        generation._start_idle_timer()
+        return generation
+
+    def get(self, generation_id: str) -> Optional[Generation]:
+        return self._generations.get(generation_id)
+
+    def find_running(self, conversation_id: str, model: str, reply_to: Optional[str]) -> Optional[Generation]:
+        """
+        Return the generation already answering the same history with the
+        same model, if there is one.
+        """
+        generation = self._running.get(conversation_id)
+        if generation is None or generation.done:
+            return None
+        if generation.model != model or generation.reply_to != reply_to:
+            return None
+        return generation
+
+    async def stop(self) -> None:
+        """Cancel running generations. Called from the app shutdown hook."""
+        tasks = [g.task for g in self._generations.values() if g.task is not None and not g.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._generations.clear()
+        self._running.clear()
+
+    async def _run(self, generation: Generation, produce: Callable[[Generation], Awaitable[None]]) -> None:
+        GENERATIONS_ACTIVE.inc()
+        try:
+            await produce(generation)
+        except Exception as e:
+            logger.error(f"Generation {generation.id} failed: {e}")
+        finally:
+            GENERATIONS_ACTIVE.dec()
+            generation.finish()
+            if self._running.get(generation.conversation_id) is generation:
+                del self._running[generation.conversation_id]
+            # Keep it around for clients reconnecting right after the end
+            asyncio.get_running_loop().call_later(
+                self.retention, self._generations.pop, generation.id, None
+            )
+
+
+# Process-wide registry used by the streaming endpoint
+generation_registry = GenerationRegistry()
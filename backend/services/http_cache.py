@@ -0,0 +1,281 @@
+"""
+HTTP caching helpers
+ETag and Last-Modified validation, and response compression (gzip, and
+brotli when installed): precomputed bodies for endpoints that serve the same
+bytes repeatedly, and a middleware for everything else
+"""
+import os
+import gzip
+import asyncio
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Iterable, Optional
+
+from dotenv import load_dotenv
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is used without it
+    brotli = None
+
+# Load environment variables
+load_dotenv()
+
+# Content codings in order of preference
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+# Responses smaller than this many bytes are sent uncompressed by CompressionMiddleware
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+
+# Bodies at least this large are compressed on a worker thread, not the event loop
+_THREAD_MIN_SIZE = 256 * 1024
+
+# Streamed content types, never held back for compression
+_STREAMED_TYPES = ("text/event-stream", "application/x-ndjson")
+
+
+def make_etag(*parts: bytes, weak: bool = True) -> str:
+    """
+    Build an ETag from the bytes that determine a response.
+
+    Weak by default: the same validator then covers every content coding
+    of the body.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part)
+        digest.update(b"\0")
+    tag = f'"{digest.hexdigest()[:32]}"'
+    return f"W/{tag}" if weak else tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Whether an ``If-None-Match`` header matches an ETag (weak comparison,
+    as RFC 9110 requires for If-None-Match).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    wanted = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == wanted or _strip_coding(candidate) == wanted:
+            return True
+    return False
+
+
+def _strip_coding(etag: str) -> str:
+    """Undo the coding suffix CompressionMiddleware adds to strong ETags."""
+    for encoding in ENCODINGS:
+        suffix = f'-{encoding}"'
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
+
+
+def http_date(value: datetime) -> str:
+    """Format a timestamp for Last-Modified (naive timestamps are local time)."""
+    return format_datetime(value.astimezone(timezone.utc).replace(microsecond=0), usegmt=True)
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime] = None) -> Dict[str, str]:
+    """
+    Headers for a revalidated resource: the validators, and ``no-cache`` so
+    clients keep the body but check it with a conditional request on every use.
+    """
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """
+    Evaluate the request's conditional headers (RFC 9110, 13.2.2).
+
+    ``If-Modified-Since`` is only used when there is no ``If-None-Match``;
+    with one-second resolution it can miss a change made within the same
+    second, so the ETag is the validator clients should rely on.
+
+    Args:
+        request: Incoming GET or HEAD request
+        etag: Current ETag of the resource
+        last_modified: Time of the last change, if known
+
+    Returns:
+        bool: True if a 304 should be sent instead of the body
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if last_modified is None or not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return last_modified.astimezone(timezone.utc).replace(microsecond=0) <= since
+
+
+def not_modified(headers: Dict[str, str]) -> Response:
+    """A 304 response carrying the resource's validators."""
+    return Response(status_code=304, headers=headers)
+
+
+def negotiate_encoding(accept_encoding: Optional[str], available: Iterable[str] = ENCODINGS) -> Optional[str]:
+    """
+    Pick the preferred content coding the client accepts.
+
+    Args:
+        accept_encoding: Value of the Accept-Encoding header
+        available: Codings the body exists in, most preferred first
+
+    Returns:
+        Optional[str]: ``br`` or ``gzip``, or None for the identity coding
+    """
+    if not accept_encoding:
+        return None
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    for encoding in available:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Encode a body with ``gzip`` or ``br``."""
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6, mtime=0)
+    raise ValueError(f"Unsupported content coding: {encoding}")
+
+
+class CompressedBody:
+    """A response body with its precomputed content codings and ETag."""
+
+    def __init__(self, body: bytes, etag: Optional[str] = None):
+        self.identity = body
+        self.etag = etag or make_etag(body)
+        self._encoded = {encoding: compress(body, encoding) for encoding in ENCODINGS}
+
+    def encoded(self, encoding: Optional[str]) -> bytes:
+        return self._encoded[encoding] if encoding else self.identity
+
+
+def cached_response(request: Request, body: CompressedBody, media_type: str = "application/json") -> Response:
+    """
+    Serve a precomputed body: 304 when the client's ETag matches, otherwise
+    the body in the best coding the client accepts.
+    """
+    headers = {**validator_headers(body.etag), "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), body.etag):
+        return not_modified(headers)
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body.encoded(encoding), media_type=media_type, headers=headers)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware that compresses response bodies with the client's
+    preferred coding.
+
+    Whether to compress is decided when the response starts. Only responses
+    that declare a Content-Length of at least ``minimum_size`` are held back
+    until their body arrives. Streamed responses (no Content-Length,
+    ``text/event-stream``, NDJSON) are passed straight through, so their
+    status line and headers go out immediately. Responses that already have
+    a Content-Encoding (such as the precompressed catalog) and 304s are also
+    left alone. A strong ETag gets the coding appended (``"tag-gzip"``), as
+    each coding is a different representation; etag_matches accepts it back.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE, enabled: bool = COMPRESSION_ENABLED):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        start: Optional[dict] = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                content_length = headers.get("content-length")
+                if (
+                    message["status"] in (204, 304)
+                    or "content-encoding" in headers
+                    or content_type.startswith(_STREAMED_TYPES)
+                    or content_length is None
+                    or not content_length.isdigit()
+                    or int(content_length) < self.minimum_size
+                ):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            # First body message of a sized response: compress it if it is the whole body
+            passthrough = True
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                await send(start)
+                await send(message)
+                return
+            headers = MutableHeaders(raw=start["headers"])
+            headers.add_vary_header("Accept-Encoding")
+            if encoding:
+                if len(body) >= _THREAD_MIN_SIZE:
+                    body = await asyncio.to_thread(compress, body, encoding)
+                else:
+                    body = compress(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/") and etag.endswith('"'):
+                    headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+                message = {**message, "body": body}
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,189 @@
+"""
+Shared HTTP client for upstream API calls
+Keeps one pooled httpx.AsyncClient per process so chat turns reuse warm
+keep-alive (and HTTP/2) connections instead of handshaking every request
+"""
+import os
+import time
+import logging
+from typing import Any, Dict, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Pool configuration
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30.0))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", 10.0))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 10.0))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+
+# Per-operation read timeouts (seconds)
+STREAM_TIMEOUT = float(os.getenv("OPENROUTER_STREAM_TIMEOUT", 60.0))
+COMPLETION_TIMEOUT = float(os.getenv("OPENROUTER_COMPLETION_TIMEOUT", 30.0))
+MODELS_TIMEOUT = float(os.getenv("OPENROUTER_MODELS_TIMEOUT", 10.0))
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+class PoolStats:
+    """
+    Running statistics about connection acquisition.
+
+    "Wait" is measured from the moment a request is handed to the pool until
+    its headers start going out on a connection, so it covers both queueing
+    for a free slot and establishing a new connection when none is idle.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds: float) -> None:
+        self.requests += 1
+        self.wait_total += seconds
+        if seconds > self.wait_max:
+            self.wait_max = seconds
+
+    def as_dict(self) -> Dict[str, Any]:
+        avg = self.wait_total / self.requests if self.requests else 0.0
+        return {
+            "requests": self.requests,
+            "wait_avg_ms": round(avg * 1000, 3),
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+        }
+
+
+pool_stats = PoolStats()
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (installed by httpx[http2])."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _make_trace(started: float):
+    """Build an httpcore trace hook that records pool wait time once per request."""
+    recorded = False
+
+    async def trace(event_name: str, info: Dict[str, Any]) -> None:
+        nonlocal recorded
+        if not recorded and event_name.endswith("send_request_headers.started"):
+            recorded = True
+            pool_stats.record_wait(time.perf_counter() - started)
+
+    return trace
+
+
+async def _on_request(request: httpx.Request) -> None:
+    request.extensions["trace"] = _make_trace(time.perf_counter())
+
+
+def create_client() -> httpx.AsyncClient:
+    """
+    Build a pooled AsyncClient using the configured limits.
+
+    Returns:
+        httpx.AsyncClient: A new client; the caller owns its lifecycle
+    """
+    http2 = HTTP2_ENABLED and _http2_available()
+    if HTTP2_ENABLED and not http2:
+        logger.warning("HTTP2_ENABLED is set but the 'h2' package is missing; using HTTP/1.1")
+
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        STREAM_TIMEOUT,
+        connect=HTTP_CONNECT_TIMEOUT,
+        pool=HTTP_POOL_TIMEOUT,
+    )
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=limits,
+        timeout=timeout,
+        event_hooks={"request": [_on_request]},
+    )
+
+
+def operation_timeout(read_timeout: float) -> httpx.Timeout:
+    """Timeout for a single operation, sharing the pool-wide connect/pool settings."""
+    return httpx.Timeout(read_timeout, connect=HTTP_CONNECT_TIMEOUT, pool=HTTP_POOL_TIMEOUT)
+
+
+async def start_http_client() -> None:
+    """Create the process-wide client. Called from the app startup hook."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_client()
+        logger.info(
+            f"HTTP client started (max_connections={HTTP_MAX_CONNECTIONS}, "
+            f"max_keepalive={HTTP_MAX_KEEPALIVE_CONNECTIONS})"
+        )
+
+
+async def close_http_client() -> None:
+    """Close the process-wide client. Called from the app shutdown hook."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        logger.info("HTTP client closed")
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Return the shared client, creating it lazily.
+
+    The lazy path keeps standalone scripts (like test_service.py) working
+    without going through the FastAPI startup hook.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_client()
+    return _client
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """
+    Snapshot of the connection pool for sizing.
+
+    Returns:
+        dict: Active/idle connection counts, configured limits and wait times
+    """
+    stats = pool_stats.as_dict()
+    stats.update({
+        "max_connections": HTTP_MAX_CONNECTIONS,
+        "max_keepalive_connections": HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        "connections_active": 0,
+        "connections_idle": 0,
+        "http2": HTTP2_ENABLED and _http2_available(),
+    })
+    if _client is None or _client.is_closed:
+        return stats
+
+    # Connection counts come from httpx/httpcore internals; if a release
+    # changes them (or the transport is not pooled), report the zeros above
+    pool = getattr(getattr(_client, "_transport", None), "_pool", None)
+    try:
+        connections = list(pool.connections)
+        idle = sum(1 for conn in connections if conn.is_idle())
+    except (AttributeError, TypeError):
+        return stats
+    stats["connections_active"] = len(connections) - idle
+    stats["connections_idle"] = idle
+    stats["http2"] = getattr(pool, "_http2", stats["http2"])
+    return stats
@@ -0,0 +1,22 @@
+"""
+JSON encoding helper
+Compact JSON to bytes, through orjson when it is installed, for the
+endpoints that encode response bodies themselves
+"""
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+
+if orjson is not None:
+    def dumps(payload: Any) -> bytes:
+        """Encode a payload as compact UTF-8 JSON."""
+        return orjson.dumps(payload)
+else:
+    def dumps(payload: Any) -> bytes:
+        """Encode a payload as compact UTF-8 JSON."""
+        return json.dumps(payload, separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,329 @@
+"""
+Metrics registry
+In-process counters, gauges and histograms rendered in the Prometheus text
+exposition format for GET /metrics. Values are updated incrementally on the
+hot paths, so a scrape never touches storage.
+"""
+import time
+import threading
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Default latency buckets in seconds (upstream calls can take a while)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class: a named family of samples keyed by label values."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    """Value that can go up and down."""
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels: str) -> "_Timer":
+        """Context manager that observes the elapsed time of its block."""
+        return _Timer(self, labels)
+
+    def count(self, **labels: str) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+        lines = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+        self.start: Optional[float] = None
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Registry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+# Content type of Registry.render()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = Registry()
+
+HTTP_REQUEST_DURATION = registry.register(Histogram(
+    "http_request_duration_seconds",
+    "Time to handle an HTTP request, by route template (streams: until the stream ends)",
+    ["method", "route", "status"],
+))
+SSE_ACTIVE_STREAMS = registry.register(Gauge(
+    "sse_active_streams",
+    "Server-Sent Event streams currently open",
+))
+GENERATIONS_ACTIVE = registry.register(Gauge(
+    "generations_active",
+    "Answers currently being generated (with or without connected clients)",
+))
+GENERATIONS_CANCELLED = registry.register(Counter(
+    "generations_cancelled_total",
+    "Generations cancelled upstream because every client disconnected",
+    ["model"],
+))
+GENERATION_TOKENS_SAVED = registry.register(Counter(
+    "generation_tokens_saved_total",
+    "Estimated completion tokens not generated thanks to early cancellation",
+    ["model"],
+))
+SSE_SLOW_CONSUMERS = registry.register(Counter(
+    "sse_slow_consumers_total",
+    "Stream clients that fell too far behind, by policy (drop: resynced with a snapshot, disconnect: closed)",
+    ["policy"],
+))
+UPSTREAM_TTFT = registry.register(Histogram(
+    "upstream_ttft_seconds",
+    "Time from sending a streaming request to the first content chunk",
+    ["model"],
+))
+UPSTREAM_DURATION = registry.register(Histogram(
+    "upstream_duration_seconds",
+    "Time from sending a request upstream to the end of the response",
+    ["model"],
+))
+UPSTREAM_ERRORS = registry.register(Counter(
+    "upstream_errors_total",
+    "Failed upstream requests, by HTTP status code or error type",
+    ["model", "code"],
+))
+ADMISSION_IN_FLIGHT = registry.register(Gauge(
+    "admission_in_flight",
+    "Upstream requests holding an admission slot",
+    ["model"],
+))
+ADMISSION_QUEUE_LENGTH = registry.register(Gauge(
+    "admission_queue_length",
+    "Requests waiting for an upstream slot",
+))
+ADMISSION_WAIT = registry.register(Histogram(
+    "admission_wait_seconds",
+    "Time a request waited for an upstream slot",
+    ["model"],
+))
+ADMISSION_REJECTED = registry.register(Counter(
+    "admission_rejected_total",
+    "Requests refused an upstream slot, by reason (queue_full: HTTP 429, timeout: waited too long)",
+    ["model", "reason"],
+))
+UPSTREAM_HEDGES = registry.register(Counter(
+    "upstream_hedges_total",
+    "Second requests fired after a slow first token, by requested model, hedge model and which one answered",
+    ["model", "hedge_model", "winner"],
+))
+
+UPSTREAM_HEDGES_SKIPPED = registry.register(Counter(
+    "upstream_hedges_skipped_total",
+    "Hedges not sent because the admission limits had no free slot for the hedge model",
+    ["model", "hedge_model"],
+))
+BATCH_JOBS = registry.register(Counter(
+    "batch_jobs_total",
+    "Finished batch jobs by model and status (succeeded, failed)",
+    ["model", "status"],
+))
+BATCH_RETRIES = registry.register(Counter(
+    "batch_job_retries_total",
+    "Batch job attempts retried after a transient upstream error",
+    ["model"],
+))
+BATCH_JOBS_RUNNING = registry.register(Gauge(
+    "batch_jobs_running",
+    "Batch jobs currently waiting on the upstream",
+))
+DB_SESSION_WAIT = registry.register(Histogram(
+    "db_session_wait_seconds",
+    "Time for a database session to get a connection from the pool",
+    ["engine"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0),
+))
+CACHE_REQUESTS = registry.register(Counter(
+    "cache_requests_total",
+    "Cache lookups by cache and result (hit, stale, miss)",
+    ["cache", "result"],
+))
+CONVERSATIONS = registry.register(Gauge(
+    "chat_conversations",
+    "Stored conversations",
+))
+MESSAGES = registry.register(Gauge(
+    "chat_messages",
+    "Stored messages",
+))
+
+
+class HTTPMetricsMiddleware:
+    """
+    ASGI middleware that observes request latency by route template.
+
+    The route is read from the scope after routing (``/conversations/{conversation_id}``
+    rather than the concrete path), so label cardinality stays bounded.
+    Unmatched paths are reported as ``unmatched``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status),
+            )
@@ -4,12 +4,26 @@ Handles communication with the OpenRouter API for streaming chat completions
 """
 import os
 import json
+import asyncio
 import logging
-from typing import AsyncGenerator, List, Dict, Any
+from typing import AsyncGenerator, List, Dict, Any, Optional, Tuple
 
 import httpx
 from dotenv import load_dotenv
 
+from .http_client import (
+    get_http_client,
+    operation_timeout,
+    STREAM_TIMEOUT,
+    COMPLETION_TIMEOUT,
+    MODELS_TIMEOUT,
+)
+from .cache import completion_cache, make_cache_key, replay_chunks
+from .telemetry import GenerationStats
+from .sse_parser import SSEParser, is_done, parse_completion_chunk
+from .admission import admission_controller
+from .metrics import UPSTREAM_ERRORS, UPSTREAM_HEDGES, UPSTREAM_HEDGES_SKIPPED
+
 # Load environment variables
 load_dotenv()
 
@@ -22,6 +36,27 @@ APP_TITLE = os.getenv("APP_TITLE", "Open Chat API")
 APP_URL = os.getenv("APP_URL", "http://localhost:8001")
 
 
+def _parse_model_map(value: str) -> Dict[str, str]:
+    """Parse ``model=value`` pairs separated by commas (model ids may contain ':' and '/')."""
+    pairs = {}
+    for item in value.split(","):
+        model, _, setting = item.strip().rpartition("=")
+        if model:
+            pairs[model] = setting.strip()
+    return pairs
+
+
+# Hedged requests: seconds to wait for the first token before racing a second
+# request (0 = off), per-model overrides, and the model the second request goes
+# to (default: the same model)
+HEDGE_TTFT_SECONDS = float(os.getenv("HEDGE_TTFT_SECONDS", 0))
+HEDGE_TTFT_DEADLINES = {
+    model: float(seconds)
+    for model, seconds in _parse_model_map(os.getenv("HEDGE_TTFT_DEADLINES", "")).items()
+}
+HEDGE_FALLBACK_MODELS = _parse_model_map(os.getenv("HEDGE_FALLBACK_MODELS", ""))
+
+
 def get_openrouter_headers() -> Dict[str, str]:
     """
     Build headers for OpenRouter API requests with attribution
@@ -37,9 +72,21 @@ def get_openrouter_headers() -> Dict[str, str]:
     }
 
 
+def upstream_error_code(error: httpx.HTTPError) -> str:
+    """Short label for an upstream failure: the HTTP status code or the error type."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return str(error.response.status_code)
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    return "request_error"
+
+
 async def send_to_openrouter(
     messages: List[Dict[str, str]], 
-    model: str
+    model: str,
+    params: Optional[Dict[str, Any]] = None,
+    stats: Optional[GenerationStats] = None,
+    hedge: bool = True,
 ) -> AsyncGenerator[str, None]:
     """
     Send messages to OpenRouter API and stream the response.
@@ -51,9 +98,22 @@ async def send_to_openrouter(
         messages: List of message dictionaries with 'role' and 'content' keys
                   Example: [{"role": "user", "content": "Hello!"}]
         model: The model identifier to use (e.g., "openai/gpt-3.5-turbo")
+        params: Optional sampling parameters (temperature, top_p, max_tokens, ...)
+                merged into the request payload
+        stats: Optional GenerationStats filled in with the request's timing
+               and the upstream usage report. After a hedged request its
+               ``model`` is the model that actually answered.
+        hedge: Allow a hedged request when the model has a TTFT deadline
+               (see ``hedge_deadline``)
     
     Yields:
-        str: Text chunks from the AI model response as they arrive
+        str: Text chunks from the AI model response as they arrive. When the
+             completion cache is enabled and holds this request, the cached
+             text is replayed in chunks instead of calling OpenRouter.
+             When no token arrives within the model's TTFT deadline, a
+             second request (to the same model or its fallback) is raced
+             against the first, and the chunks come from whichever answers
+             first.
     
     Raises:
         httpx.HTTPError: If the request to OpenRouter fails
@@ -68,83 +128,257 @@ async def send_to_openrouter(
         logger.error("OPENROUTER_API_KEY not configured")
         raise ValueError("OPENROUTER_API_KEY not configured in environment")
     
+    if stats is None:
+        stats = GenerationStats(model)
+    cache_key = None
+    if completion_cache.enabled:
+        cache_key = make_cache_key(model, messages, params)
+        cached = await completion_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Replaying cached completion for model: {model}")
+            stats.cached = True
+            for chunk in replay_chunks(cached):
+                yield chunk
+            return
+    
+    deadline = hedge_deadline(model) if hedge else 0
+    if deadline > 0:
+        source = _hedged_stream(messages, model, params, stats, deadline)
+    else:
+        source = _stream_completion(messages, model, params, stats)
+    
+    parts: List[str] = []
+    async for content in source:
+        if cache_key is not None:
+            parts.append(content)
+        yield content
+    
+    # Cache complete answers from the requested model only (not from a fallback)
+    if cache_key is not None and stats.finished_at is not None and stats.model == model:
+        await completion_cache.put(cache_key, "".join(parts))
+
+
+async def _stream_completion(
+    messages: List[Dict[str, str]],
+    model: str,
+    params: Optional[Dict[str, Any]],
+    stats: GenerationStats,
+) -> AsyncGenerator[str, None]:
+    """One streaming chat completion request to OpenRouter (no cache, no hedging)."""
     logger.info(f"Starting stream to OpenRouter with model: {model}")
     logger.debug(f"Message count: {len(messages)}")
     
     # Prepare the request payload
     payload = {
+        **(params or {}),
         "model": model,
         "messages": messages,
         "stream": True
     }
+    # Ask OpenRouter to append token usage to the final chunk
+    payload["usage"] = {"include": True}
+    stats.start(messages)
     
     try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            async with client.stream(
-                "POST",
-                f"{OPENROUTER_BASE_URL}/chat/completions",
-                headers=get_openrouter_headers(),
-                json=payload
-            ) as response:
-                # Check for HTTP errors
-                response.raise_for_status()
-                
-                logger.info("Stream established successfully")
-                chunk_count = 0
-                
-                # Process the streaming response
-                async for line in response.aiter_lines():
-                    # Skip empty lines
-                    if not line.strip():
+        client = get_http_client()
+        async with client.stream(
+            "POST",
+            f"{OPENROUTER_BASE_URL}/chat/completions",
+            headers=get_openrouter_headers(),
+            json=payload,
+            timeout=operation_timeout(STREAM_TIMEOUT),
+        ) as response:
+            # Check for HTTP errors; a streamed error body must be read
+            # before the stream closes for the handler below to log it
+            if response.is_error:
+                await response.aread()
+            response.raise_for_status()
+            
+            logger.info("Stream established successfully")
+            chunk_count = 0
+            # Checked once: formatting a debug line per chunk is measurable at scale
+            debug = logger.isEnabledFor(logging.DEBUG)
+            
+            # Parse the event stream straight from the bytes
+            parser = SSEParser()
+            async for raw in response.aiter_bytes():
+                for event in parser.feed(raw):
+                    data = event.data
+                    
+                    # Check for stream completion
+                    if is_done(data):
+                        logger.info(f"Stream completed. Total chunks: {chunk_count}")
+                        stats.finish()
+                        return
+                    
+                    try:
+                        content, usage = parse_completion_chunk(data)
+                    except ValueError as e:
+                        logger.warning(f"Failed to parse chunk JSON: {data[:100]!r}... Error: {e}")
+                        continue
+                    except (AttributeError, KeyError, IndexError, TypeError) as e:
+                        logger.warning(f"Unexpected chunk structure: {e}")
                         continue
                     
-                    # Parse SSE data
-                    if line.startswith("data: "):
-                        data = line[6:]  # Remove "data: " prefix
-                        
-                        # Check for stream completion
-                        if data == "[DONE]":
-                            logger.info(f"Stream completed. Total chunks: {chunk_count}")
-                            break
+                    # The final chunk carries token usage (and may have no choices)
+                    if usage:
+                        stats.on_usage(usage)
+                    
+                    # Yield non-empty content
+                    if content:
+                        chunk_count += 1
+                        if debug:
+                            logger.debug(f"Yielding chunk {chunk_count}: {len(content)} chars")
+                        stats.on_chunk(content)
+                        yield content
                         
-                        try:
-                            # Parse the JSON chunk
-                            chunk_data = json.loads(data)
-                            
-                            # Extract content from the delta
-                            delta = chunk_data.get("choices", [{}])[0].get("delta", {})
-                            content = delta.get("content", "")
-                            
-                            # Yield non-empty content
-                            if content:
-                                chunk_count += 1
-                                logger.debug(f"Yielding chunk {chunk_count}: {len(content)} chars")
-                                yield content
-                                
-                        except json.JSONDecodeError as e:
-                            logger.warning(f"Failed to parse chunk JSON: {data[:100]}... Error: {e}")
-                            continue
-                        except (KeyError, IndexError) as e:
-                            logger.warning(f"Unexpected chunk structure: {e}")
-                            continue
-                            
     except httpx.HTTPStatusError as e:
+        UPSTREAM_ERRORS.inc(model=model, code=upstream_error_code(e))
         logger.error(f"HTTP error from OpenRouter: {e.response.status_code} - {e.response.text}")
         raise
     except httpx.TimeoutException as e:
+        UPSTREAM_ERRORS.inc(model=model, code=upstream_error_code(e))
         logger.error(f"Request to OpenRouter timed out: {e}")
         raise
     except httpx.RequestError as e:
+        UPSTREAM_ERRORS.inc(model=model, code=upstream_error_code(e))
         logger.error(f"Request error communicating with OpenRouter: {e}")
         raise
     except Exception as e:
         logger.error(f"Unexpected error in send_to_openrouter: {e}")
         raise
 
+# ===== Hedged requests =====
+
+# Marks the end of an attempt's stream in its queue
+_END = object()
+
+
+class _Attempt:
+    """One upstream request of a hedged call, drained into a queue by its own task."""
+
+    def __init__(self, model: str, stats: GenerationStats, source: AsyncGenerator[str, None]):
+        self.model = model
+        self.stats = stats
+        self.queue: "asyncio.Queue[Any]" = asyncio.Queue()
+        self.task = asyncio.create_task(self._run(source))
+
+    async def _run(self, source: AsyncGenerator[str, None]) -> None:
+        try:
+            async for chunk in source:
+                self.queue.put_nowait(chunk)
+            self.queue.put_nowait(_END)
+        except Exception as e:
+            self.queue.put_nowait(e)
+
+    async def cancel(self) -> None:
+        if not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+
+async def _first_response(attempts: List[_Attempt]) -> Tuple[_Attempt, Any]:
+    """
+    Wait for the first chunk (or the end of the stream) from any attempt.
+
+    An attempt that fails is dropped; the error is raised only if every
+    attempt fails.
+    """
+    getters = {asyncio.create_task(attempt.queue.get()): attempt for attempt in attempts}
+    error: Optional[BaseException] = None
+    try:
+        while getters:
+            done, _ = await asyncio.wait(getters, return_when=asyncio.FIRST_COMPLETED)
+            for getter in done:
+                attempt = getters.pop(getter)
+                item = getter.result()
+                if isinstance(item, BaseException):
+                    logger.warning(f"Hedged attempt on {attempt.model} failed: {item}")
+                    error = item
+                    continue
+                return attempt, item
+        raise error
+    finally:
+        for getter in getters:
+            getter.cancel()
+
+
+async def _hedged_stream(
+    messages: List[Dict[str, str]],
+    model: str,
+    params: Optional[Dict[str, Any]],
+    stats: GenerationStats,
+    deadline: float,
+) -> AsyncGenerator[str, None]:
+    """
+    Stream from ``model``, racing a second request if the first token takes
+    longer than ``deadline`` seconds. The losing request is cancelled as soon
+    as the winner produces its first chunk.
+
+    The hedge takes its own admission slot, without queueing: when the
+    limits have no free slot for the hedge model, no hedge is sent and the
+    first request is simply awaited.
+    """
+    primary = _Attempt(model, stats, _stream_completion(messages, model, params, stats))
+    attempts = [primary]
+    winner = primary
+    hedge_ticket = None
+    try:
+        try:
+            item = await asyncio.wait_for(primary.queue.get(), deadline)
+        except asyncio.TimeoutError:
+            hedge_model = HEDGE_FALLBACK_MODELS.get(model, model)
+            hedge_ticket = admission_controller.try_acquire(hedge_model)
+            if hedge_ticket is None:
+                logger.info(f"No token from {model} after {deadline}s, no capacity to hedge with {hedge_model}")
+                UPSTREAM_HEDGES_SKIPPED.inc(model=model, hedge_model=hedge_model)
+                item = await primary.queue.get()
+            else:
+                logger.info(f"No token from {model} after {deadline}s, hedging with {hedge_model}")
+                hedge_stats = GenerationStats(hedge_model)
+                hedge = _Attempt(
+                    hedge_model, hedge_stats, _stream_completion(messages, hedge_model, params, hedge_stats)
+                )
+                attempts.append(hedge)
+                winner, item = await _first_response(attempts)
+                UPSTREAM_HEDGES.inc(
+                    model=model, hedge_model=hedge_model, winner="hedge" if winner is not primary else "primary"
+                )
+                for attempt in attempts:
+                    if attempt is not winner:
+                        await attempt.cancel()
+                if winner is not hedge:
+                    admission_controller.release(hedge_ticket)
+                # Callers see which model is answering from the first chunk on
+                stats.model = winner.model
+        
+        while item is not _END:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+            item = await winner.queue.get()
+    finally:
+        for attempt in attempts:
+            await attempt.cancel()
+        if hedge_ticket is not None:
+            admission_controller.release(hedge_ticket)
+        if winner is not primary:
+            stats.adopt(winner.stats)
+
+
+def hedge_deadline(model: str) -> float:
+    """Seconds to wait for the first token before hedging (0: never hedge)."""
+    return HEDGE_TTFT_DEADLINES.get(model, HEDGE_TTFT_SECONDS)
+
 
 async def send_to_openrouter_no_stream(
     messages: List[Dict[str, str]], 
-    model: str
+    model: str,
+    params: Optional[Dict[str, Any]] = None,
+    stats: Optional[GenerationStats] = None,
 ) -> str:
     """
     Send messages to OpenRouter API without streaming (returns complete response).
@@ -155,9 +389,13 @@ async def send_to_openrouter_no_stream(
     Args:
         messages: List of message dictionaries with 'role' and 'content' keys
         model: The model identifier to use
+        params: Optional sampling parameters merged into the request payload
+        stats: Optional GenerationStats filled in with the request's timing
+               and the upstream usage report
     
     Returns:
-        str: Complete response from the AI model
+        str: Complete response from the AI model (served from the completion
+             cache when enabled and present)
     
     Raises:
         httpx.HTTPError: If the request to OpenRouter fails
@@ -166,33 +404,54 @@ async def send_to_openrouter_no_stream(
     if not OPENROUTER_API_KEY:
         raise ValueError("OPENROUTER_API_KEY not configured in environment")
     
+    if stats is None:
+        stats = GenerationStats(model, streamed=False)
+    cache_key = None
+    if completion_cache.enabled:
+        cache_key = make_cache_key(model, messages, params)
+        cached = await completion_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Returning cached completion for model: {model}")
+            stats.cached = True
+            return cached
+    
     logger.info(f"Sending request to OpenRouter with model: {model} (no streaming)")
     
     payload = {
+        **(params or {}),
         "model": model,
         "messages": messages,
         "stream": False
     }
+    stats.start(messages)
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                f"{OPENROUTER_BASE_URL}/chat/completions",
-                headers=get_openrouter_headers(),
-                json=payload
-            )
-            response.raise_for_status()
-            
-            # Read the response content first
-            response_data = await response.aread()
-            data = json.loads(response_data)
-            content = data["choices"][0]["message"]["content"]
-            
-            logger.info(f"Received complete response: {len(content)} chars")
-            return content
+        client = get_http_client()
+        response = await client.post(
+            f"{OPENROUTER_BASE_URL}/chat/completions",
+            headers=get_openrouter_headers(),
+            json=payload,
+            timeout=operation_timeout(COMPLETION_TIMEOUT),
+        )
+        response.raise_for_status()
+        
+        # Read the response content first
+        response_data = await response.aread()
+        data = json.loads(response_data)
+        content = data["choices"][0]["message"]["content"]
+        stats.on_chunk(content)
+        stats.finish()
+        if data.get("usage"):
+            stats.on_usage(data["usage"])
+        
+        logger.info(f"Received complete response: {len(content)} chars")
+        if cache_key is not None:
+            await completion_cache.put(cache_key, content)
+        return content
             
     except httpx.HTTPError as e:
         logger.error(f"Error communicating with OpenRouter: {e}")
+        UPSTREAM_ERRORS.inc(model=model, code=upstream_error_code(e))
         raise
     except (KeyError, IndexError) as e:
         logger.error(f"Unexpected response format from OpenRouter: {e}")
@@ -220,26 +479,27 @@ async def get_available_models() -> List[Dict[str, Any]]:
     logger.info("Fetching available models from OpenRouter")
     
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                f"{OPENROUTER_BASE_URL}/models",
-                headers=get_openrouter_headers()
-            )
-            response.raise_for_status()
-            
-            data = response.json()
-            all_models = data.get("data", [])
-            
-            # Filter for free models only
-            # A model is free if both prompt and completion prices are 0
-            free_models = [
-                model for model in all_models
-                if model.get("pricing", {}).get("prompt") == "0" and
-                   model.get("pricing", {}).get("completion") == "0"
-            ]
-            
-            logger.info(f"Retrieved {len(all_models)} total models, filtered to {len(free_models)} free models")
-            return free_models
+        client = get_http_client()
+        response = await client.get(
+            f"{OPENROUTER_BASE_URL}/models",
+            headers=get_openrouter_headers(),
+            timeout=operation_timeout(MODELS_TIMEOUT),
+        )
+        response.raise_for_status()
+        
+        data = response.json()
+        all_models = data.get("data", [])
+        
+        # Filter for free models only
+        # A model is free if both prompt and completion prices are 0
+        free_models = [
+            model for model in all_models
+            if model.get("pricing", {}).get("prompt") == "0" and
+               model.get("pricing", {}).get("completion") == "0"
+        ]
+        
+        logger.info(f"Retrieved {len(all_models)} total models, filtered to {len(free_models)} free models")
+        return free_models
             
     except httpx.HTTPError as e:
         logger.error(f"Error fetching models from OpenRouter: {e}")
@@ -0,0 +1,325 @@
+"""
+Session backends
+Map session cookie tokens to user ids. The backend is chosen with
+SESSION_BACKEND so that logins survive across several worker processes:
+
+- memory: a per-process dict (single worker only)
+- sql:    a ``sessions`` table shared by every worker, swept for expired rows
+- signed: stateless HMAC-signed tokens, nothing stored server-side
+"""
+import os
+import hmac
+import time
+import base64
+import asyncio
+import hashlib
+import logging
+import secrets
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, select
+
+from database import AsyncSessionLocal
+from models import UserSession
+from .metrics import CACHE_REQUESTS
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")  # memory | sql | signed
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", 7 * 24 * 3600))
+# Required by the signed backend; must be the same for every worker
+SESSION_SECRET = os.getenv("SESSION_SECRET", "")
+# In-process LRU in front of the sql and signed backends
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", 1024))
+# Seconds a cached lookup is trusted (bounds how long a logout on another worker goes unseen)
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", 30))
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", 300))
+
+
+def _hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class SessionBackend:
+    """
+    Base class for session stores.
+
+    Subclasses implement ``_create``, ``_load``, ``_delete`` and ``_sweep``;
+    this class adds a bounded LRU of recent lookups and a background task that
+    periodically removes expired sessions. Expiry times are Unix timestamps.
+    """
+
+    name = "base"
+
+    def __init__(
+        self,
+        ttl: int = SESSION_TTL_SECONDS,
+        cache_size: int = SESSION_CACHE_SIZE,
+        cache_ttl: float = SESSION_CACHE_TTL,
+        sweep_interval: float = SESSION_SWEEP_INTERVAL,
+    ):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.sweep_interval = sweep_interval
+        # token -> (user_id, cached until (monotonic), session expires at (unix))
+        self._cache: "OrderedDict[str, Tuple[int, float, float]]" = OrderedDict()
+        self._sweeper_task: Optional[asyncio.Task] = None
+
+    # ----- Public API -----
+
+    async def create(self, user_id: int) -> str:
+        """Start a session for a user and return its token."""
+        expires_at = time.time() + self.ttl
+        token = await self._create(user_id, expires_at)
+        self._remember(token, user_id, expires_at)
+        return token
+
+    async def get(self, token: str) -> Optional[int]:
+        """Return the user id of a live session, or None."""
+        entry = self._cache.get(token)
+        if entry is not None:
+            user_id, cached_until, expires_at = entry
+            if cached_until > time.monotonic() and expires_at > time.time():
+                self._cache.move_to_end(token)
+                CACHE_REQUESTS.inc(cache="sessions", result="hit")
+                return user_id
+            del self._cache[token]
+        if self.cache_size:
+            CACHE_REQUESTS.inc(cache="sessions", result="miss")
+
+        session = await self._load(token)
+        if session is None:
+            return None
+        user_id, expires_at = session
+        self._remember(token, user_id, expires_at)
+        return user_id
+
+    async def delete(self, token: str) -> None:
+        """End a session (logout)."""
+        self._cache.pop(token, None)
+        await self._delete(token)
+
+    async def start(self) -> None:
+        """Start the expiry sweeper. Called from the app startup hook."""
+        if self._sweeper_task is None and self.sweep_interval > 0:
+            self._sweeper_task = asyncio.create_task(self._sweeper())
+        logger.info(f"Session backend: {self.name}")
+
+    async def stop(self) -> None:
+        """Stop the expiry sweeper."""
+        if self._sweeper_task is not None:
+            self._sweeper_task.cancel()
+            try:
+                await self._sweeper_task
+            except asyncio.CancelledError:
+                pass
+            self._sweeper_task = None
+
+    # ----- Internals -----
+
+    def _remember(self, token: str, user_id: int, expires_at: float) -> None:
+        if not self.cache_size:
+            return
+        self._cache[token] = (user_id, time.monotonic() + self.cache_ttl, expires_at)
+        self._cache.move_to_end(token)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _sweeper(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                removed = await self._sweep()
+                if removed:
+                    logger.info(f"Removed {removed} expired sessions")
+            except Exception as e:
+                logger.error(f"Session sweep failed: {e}")
+
+    async def _create(self, user_id: int, expires_at: float) -> str:
+        raise NotImplementedError
+
+    async def _load(self, token: str) -> Optional[Tuple[int, float]]:
+        raise NotImplementedError
+
+    async def _delete(self, token: str) -> None:
+        raise NotImplementedError
+
+    async def _sweep(self) -> int:
+        return 0
+
+
+class MemorySessionBackend(SessionBackend):
+    """Per-process dict. The store is already in memory, so the LRU is off."""
+
+    name = "memory"
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("cache_size", 0)
+        super().__init__(**kwargs)
+        self._sessions: Dict[str, Tuple[int, float]] = {}
+
+    async def _create(self, user_id: int, expires_at: float) -> str:
+        token = secrets.token_urlsafe(32)
+        self._sessions[token] = (user_id, expires_at)
+        return token
+
+    async def _load(self, token: str) -> Optional[Tuple[int, float]]:
+        session = self._sessions.get(token)
+        if session is None or session[1] <= time.time():
+            return None
+        return session
+
+    async def _delete(self, token: str) -> None:
+        self._sessions.pop(token, None)
+
+    async def _sweep(self) -> int:
+        now = time.time()
+        expired = [token for token, (_, expires_at) in self._sessions.items() if expires_at <= now]
+        for token in expired:
+            del self._sessions[token]
+        return len(expired)
+
+
+class SQLSessionBackend(SessionBackend):
+    """
+    Sessions in the ``sessions`` table, shared by all workers.
+
+    Lookups go through the primary key (a SHA-256 digest of the token, so a
+    leaked table does not leak usable cookies). A logout on one worker is
+    seen by the others once their cached entry expires (SESSION_CACHE_TTL).
+    """
+
+    name = "sql"
+
+    def __init__(self, session_factory: Callable = AsyncSessionLocal, **kwargs):
+        super().__init__(**kwargs)
+        self._session_factory = session_factory
+
+    async def _create(self, user_id: int, expires_at: float) -> str:
+        token = secrets.token_urlsafe(32)
+        async with self._session_factory() as db:
+            db.add(UserSession(
+                token_hash=_hash_token(token),
+                user_id=user_id,
+                expires_at=datetime.utcfromtimestamp(expires_at),
+            ))
+            await db.commit()
+        return token
+
+    async def _load(self, token: str) -> Optional[Tuple[int, float]]:
+        async with self._session_factory() as db:
+            row = (await db.execute(
+                select(UserSession.user_id, UserSession.expires_at)
+                .where(UserSession.token_hash == _hash_token(token))
+                .where(UserSession.expires_at > datetime.utcnow())
+            )).first()
+        if row is None:
+            return None
+        return row.user_id, (row.expires_at - datetime(1970, 1, 1)).total_seconds()
+
+    async def _delete(self, token: str) -> None:
+        async with self._session_factory() as db:
+            await db.execute(delete(UserSession).where(UserSession.token_hash == _hash_token(token)))
+            await db.commit()
+
+    async def _sweep(self) -> int:
+        async with self._session_factory() as db:
+            result = await db.execute(delete(UserSession).where(UserSession.expires_at <= datetime.utcnow()))
+            await db.commit()
+            return result.rowcount or 0
+
+
+class SignedSessionBackend(SessionBackend):
+    """
+    Stateless tokens: ``<user id>.<expiry>.<nonce>.<HMAC-SHA256 signature>``.
+
+    Any worker holding SESSION_SECRET can verify a token without storage.
+    Tokens cannot be revoked globally: logout clears the cookie and denies
+    the token on the worker that handled it until it expires.
+    """
+
+    name = "signed"
+
+    def __init__(self, secret: str = SESSION_SECRET, **kwargs):
+        if not secret:
+            raise ValueError("SESSION_SECRET must be set to use signed sessions")
+        super().__init__(**kwargs)
+        self._key = secret.encode("utf-8")
+        # token -> expiry of tokens logged out on this worker
+        self._revoked: Dict[str, float] = {}
+
+    def _sign(self, payload: str) -> str:
+        digest = hmac.new(self._key, payload.encode("ascii"), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+    async def _create(self, user_id: int, expires_at: float) -> str:
+        payload = f"{user_id}.{int(expires_at)}.{secrets.token_urlsafe(8)}"
+        return f"{payload}.{self._sign(payload)}"
+
+    async def _load(self, token: str) -> Optional[Tuple[int, float]]:
+        # Tokens we issue are ASCII; anything else is forged (and would not encode)
+        if not token.isascii():
+            return None
+        payload, _, signature = token.rpartition(".")
+        if not payload or not hmac.compare_digest(signature, self._sign(payload)):
+            return None
+        if token in self._revoked:
+            return None
+        try:
+            user_id, expires_at, _ = payload.split(".", 2)
+            user_id, expires_at = int(user_id), float(expires_at)
+        except ValueError:
+            return None
+        if expires_at <= time.time():
+            return None
+        return user_id, expires_at
+
+    async def _delete(self, token: str) -> None:
+        session = await self._load(token)
+        if session is not None:
+            self._revoked[token] = session[1]
+
+    async def _sweep(self) -> int:
+        now = time.time()
+        expired = [token for token, expires_at in self._revoked.items() if expires_at <= now]
+        for token in expired:
+            del self._revoked[token]
+        return len(expired)
+
+
+_BACKENDS = {
+    "memory": MemorySessionBackend,
+    "sql": SQLSessionBackend,
+    "signed": SignedSessionBackend,
+}
+
+
+def create_session_backend(kind: str = SESSION_BACKEND) -> SessionBackend:
+    """
+    Build the configured session backend.
+
+    Args:
+        kind: 'memory', 'sql' or 'signed'
+
+    Returns:
+        SessionBackend: The backend instance
+
+    Raises:
+        ValueError: If the kind is unknown or the signed backend has no secret
+    """
+    backend = _BACKENDS.get(kind.lower())
+    if backend is None:
+        raise ValueError(f"Unknown SESSION_BACKEND '{kind}' (expected one of: {', '.join(_BACKENDS)})")
+    return backend()
+
+
+# Process-wide session backend used by the auth endpoints
+session_backend = create_session_backend()
@@ -0,0 +1,140 @@
+"""
+Server-Sent Events helpers
+Fast `data:` frame encoding and delta coalescing for the streaming endpoints
+"""
+import os
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from .jsonutil import dumps, orjson  # orjson: checked by benchmarks/sse_framing.py
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Coalescing window: merge deltas until this many characters are buffered or
+# this many milliseconds have passed. SSE_COALESCE_MAX_MS=0 disables merging.
+SSE_COALESCE_MAX_BYTES = int(os.getenv("SSE_COALESCE_MAX_BYTES", 512))
+SSE_COALESCE_MAX_MS = float(os.getenv("SSE_COALESCE_MAX_MS", 30))
+
+
+def sse_event(payload: Dict[str, Any], event_id: Optional[str] = None) -> bytes:
+    """Encode a payload as one SSE `data:` frame, optionally with an `id:` line."""
+    if event_id is None:
+        return b"data: " + dumps(payload) + b"\n\n"
+    return b"id: " + event_id.encode("ascii") + b"\ndata: " + dumps(payload) + b"\n\n"
+
+
+class _Pump:
+    """
+    Drains an async iterator into a buffer from its own task.
+
+    The reader is woken only when the buffer goes from empty to non-empty,
+    when it reaches ``flush_at`` characters, or when the source ends - not on
+    every delta.
+    """
+
+    def __init__(self, source: AsyncIterator[str], flush_at: int):
+        self.buffer: List[str] = []
+        self.size = 0
+        self.flush_at = flush_at
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._ready = asyncio.Event()
+        self._task = asyncio.create_task(self._run(source))
+
+    async def _run(self, source: AsyncIterator[str]) -> None:
+        try:
+            async for chunk in source:
+                self.buffer.append(chunk)
+                self.size += len(chunk)
+                if len(self.buffer) == 1 or self.size >= self.flush_at:
+                    self._ready.set()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._ready.set()
+
+    async def wait_for_data(self) -> bool:
+        """Wait until something is buffered. Returns False once the source is exhausted."""
+        if not self.buffer and not self.done:
+            self._ready.clear()
+            await self._ready.wait()
+        return bool(self.buffer)
+
+    async def wait_until_full(self, timeout: float) -> None:
+        """Wait until the buffer reaches flush_at, the source ends, or the timeout passes."""
+        if self.size >= self.flush_at or self.done or timeout <= 0:
+            return
+        self._ready.clear()
+        # A plain timer is much cheaper than asyncio.wait_for's extra task
+        timer = asyncio.get_running_loop().call_later(timeout, self._ready.set)
+        try:
+            await self._ready.wait()
+        finally:
+            timer.cancel()
+
+    def take(self) -> str:
+        text = "".join(self.buffer)
+        self.buffer.clear()
+        self.size = 0
+        return text
+
+    async def close(self) -> None:
+        if not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+async def coalesce(
+    chunks: AsyncIterator[str],
+    max_bytes: int = SSE_COALESCE_MAX_BYTES,
+    max_ms: float = SSE_COALESCE_MAX_MS,
+) -> AsyncIterator[str]:
+    """
+    Merge small text deltas into larger ones.
+
+    The first frame goes out as soon as the first delta arrives (merged only
+    with deltas that are already waiting), so time-to-first-token is never
+    delayed. After that, each frame collects deltas for up to ``max_ms``
+    milliseconds after its first delta, or until ``max_bytes`` characters are
+    buffered, whichever comes first.
+
+    Errors raised by ``chunks`` are re-raised after the buffered text is
+    yielded. Closing this generator cancels the upstream iteration.
+
+    Args:
+        chunks: Source of text deltas (e.g. send_to_openrouter)
+        max_bytes: Flush once this many characters are buffered
+        max_ms: Flush once the oldest buffered delta is this old
+
+    Yields:
+        str: Merged text
+    """
+    if max_ms <= 0 or max_bytes <= 1:
+        async for chunk in chunks:
+            yield chunk
+        return
+
+    window = max_ms / 1000
+    loop = asyncio.get_running_loop()
+    pump = _Pump(chunks, max_bytes)
+    try:
+        first = True
+        while await pump.wait_for_data():
+            if not first:
+                await pump.wait_until_full(window)
+            first = False
+            yield pump.take()
+        if pump.error is not None:
+            raise pump.error
+    finally:
+        await pump.close()
@@ -0,0 +1,164 @@
+"""
+Server-Sent Events parser
+Incremental, byte-level parser for the upstream `text/event-stream`, plus a
+cheap extractor for the fields of an OpenRouter chat completion chunk
+"""
+import json
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+_BOM = b"\xef\xbb\xbf"
+_DATA_PREFIX = b"data: "
+_DONE = b"[DONE]"
+
+
+class SSEEvent(NamedTuple):
+    """One dispatched event. ``data`` is the raw UTF-8 payload, lines joined by ``\\n``."""
+
+    data: bytes
+    event: str = "message"
+    id: Optional[str] = None
+
+
+# Builds an SSEEvent without NamedTuple's argument handling (hot path)
+_new_event = tuple.__new__
+
+
+class SSEParser:
+    """
+    Parser for the event stream format of the HTML spec, fed raw bytes.
+
+    Handles LF, CRLF and CR line endings (also split across chunks), a
+    leading BOM, comments (``:`` lines, used for keep-alives), multi-line
+    ``data:``, ``event:``, ``id:`` and ``retry:``. Events are dispatched on a
+    blank line; an event without data is dropped, as the spec says. Data is
+    left as bytes so JSON parsers can read it without a decode step.
+    """
+
+    def __init__(self):
+        self._buffer = b""
+        self._data: List[bytes] = []
+        self._event_type: Optional[str] = None
+        self._started = False
+        # The last chunk ended in CR: an LF at the start of the next one is part of CRLF
+        self._skip_lf = False
+        self.last_event_id: Optional[str] = None
+        self.retry: Optional[int] = None
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        """
+        Parse the next bytes of the stream. An unterminated event left at the
+        end of the stream is never returned, as the spec requires.
+
+        Args:
+            chunk: Bytes as received, split anywhere
+
+        Returns:
+            List[SSEEvent]: Events completed by this chunk
+        """
+        if self._skip_lf:
+            self._skip_lf = False
+            if chunk[:1] == b"\n":
+                chunk = chunk[1:]
+        if not self._started and chunk:
+            self._started = True
+            if chunk.startswith(_BOM):
+                chunk = chunk[len(_BOM):]
+        buffer = self._buffer + chunk if self._buffer else chunk
+        if b"\r" in buffer:
+            self._skip_lf = buffer.endswith(b"\r")
+            buffer = buffer.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+        if b"\n\n" not in buffer:
+            self._buffer = buffer
+            return []
+
+        # Work on whole events: everything up to the last blank line
+        blocks = buffer.split(b"\n\n")
+        self._buffer = blocks.pop()
+        events = []
+        for block in blocks:
+            # Fast path: nearly every OpenRouter event is a single "data: {...}" line
+            if block.startswith(_DATA_PREFIX) and b"\n" not in block:
+                events.append(_new_event(SSEEvent, (block[6:], "message", self.last_event_id)))
+                continue
+            for line in block.split(b"\n"):
+                self._line(line, events)
+            self._dispatch(events)
+        return events
+
+    def _line(self, line: bytes, events: List[SSEEvent]) -> None:
+        if not line:
+            self._dispatch(events)
+        elif line.startswith(_DATA_PREFIX):
+            self._data.append(line[6:])
+        elif line[0] != 58:  # ":" starts a comment
+            self._field(line)
+
+    def _dispatch(self, events: List[SSEEvent]) -> None:
+        if self._data:
+            events.append(SSEEvent(
+                b"\n".join(self._data),
+                self._event_type or "message",
+                self.last_event_id,
+            ))
+            self._data = []
+        self._event_type = None
+
+    def _field(self, line: bytes) -> None:
+        name, _, value = line.partition(b":")
+        if value[:1] == b" ":
+            value = value[1:]
+        if name == b"data":
+            self._data.append(value)
+        elif name == b"event":
+            self._event_type = value.decode("utf-8", "replace")
+        elif name == b"id":
+            if b"\0" not in value:
+                self.last_event_id = value.decode("utf-8", "replace")
+        elif name == b"retry":
+            if value.isdigit():
+                self.retry = int(value)
+        # Other field names are ignored
+
+
+if orjson is not None:
+    _loads = orjson.loads
+else:
+    _loads = json.loads
+
+
+def is_done(data: bytes) -> bool:
+    """Whether an event is OpenRouter's ``[DONE]`` end marker."""
+    return data == _DONE
+
+
+def parse_completion_chunk(data: bytes) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """
+    Pull the text delta and the usage report out of a chat completion chunk.
+
+    Chunks that mention neither field (role-only or tool call deltas) are
+    skipped without a JSON parse.
+
+    Args:
+        data: Event data of one chunk
+
+    Returns:
+        Tuple: ``choices[0].delta.content`` (None if empty or absent) and
+        ``usage`` (None if absent)
+
+    Raises:
+        ValueError: If the data is not valid JSON (``json.JSONDecodeError``
+                    and ``orjson.JSONDecodeError`` are both ValueErrors)
+        AttributeError, TypeError, IndexError: If the JSON is not shaped
+                    like a chunk
+    """
+    if b'"content"' not in data and b'"usage"' not in data:
+        return None, None
+    chunk = _loads(data)
+    choices = chunk.get("choices")
+    content = choices[0].get("delta", {}).get("content") if choices else None
+    return content or None, chunk.get("usage") or None
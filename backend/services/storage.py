@@ -0,0 +1,735 @@
+"""
+Conversation storage service
+Persists conversations and messages through the SQLAlchemy models with
+write-behind batching: writes are queued and committed in batches by a
+background task, while reads merge in writes that have not been flushed yet
+"""
+import os
+import base64
+import asyncio
+import logging
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import and_, func, inspect, or_, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from database import ReaderSessionLocal, WriterSessionLocal, SQLITE_READER_POOL_SIZE
+from models import Conversation as ConversationRecord
+from models import Message as MessageRecord
+from models import Response as ResponseRecord
+from .metrics import CONVERSATIONS, DB_SESSION_WAIT, MESSAGES
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Flush a batch once it holds this many writes, or after this many milliseconds
+STORAGE_BATCH_SIZE = int(os.getenv("STORAGE_BATCH_SIZE", 100))
+STORAGE_FLUSH_INTERVAL_MS = int(os.getenv("STORAGE_FLUSH_INTERVAL_MS", 50))
+STORAGE_RETRY_DELAY = float(os.getenv("STORAGE_RETRY_DELAY", 1.0))
+
+# A page position: (timestamp, public id) of the last item on the previous page
+Cursor = Tuple[datetime, str]
+
+# Number of times a read is retried when a commit lands while it runs
+_READ_ATTEMPTS = 3
+
+
+@dataclass
+class WriteOp:
+    """A single buffered write, applied in order by the flusher."""
+    seq: int
+    kind: str  # create_conversation | update_conversation | delete_conversation | add_message | update_message | add_response
+    conversation_id: str
+    data: Dict[str, Any] = field(default_factory=dict)
+    at: datetime = field(default_factory=datetime.now)
+
+
+class ChatStore:
+    """
+    Write-behind store for conversations and messages.
+
+    Conversations and messages use the same dict shapes the API already
+    returns: conversations have ``id``, ``default_model``, ``created_at`` and
+    ``updated_at``; messages have ``id``, ``role``, ``content``, ``model``,
+    ``status`` and ``timestamp``. Public ids map to the ``uuid`` columns.
+
+    Conversations also carry ``version``, bumped by every write to the
+    conversation or its messages, and ``modified_at``, the time of that
+    write. Each pending write counts as one bump until it commits, so the
+    version a read reports always identifies the content it returned.
+
+    Write methods only enqueue and return immediately. Every write stays in a
+    pending list until its batch commits, and reads replay pending writes on
+    top of what the database returns, so a caller always sees its own writes.
+
+    Batches are committed from one dedicated writer thread (SQLite has a
+    single writer anyway), and reads run on a small pool of reader threads,
+    each normally using a read-only connection (see database.py).
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable = WriterSessionLocal,
+        read_session_factory: Callable = ReaderSessionLocal,
+        batch_size: int = STORAGE_BATCH_SIZE,
+        flush_interval: float = STORAGE_FLUSH_INTERVAL_MS / 1000,
+        reader_threads: int = SQLITE_READER_POOL_SIZE,
+    ):
+        self._session_factory = session_factory
+        self._read_session_factory = read_session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage-writer")
+        self._readers = ThreadPoolExecutor(max_workers=reader_threads, thread_name_prefix="storage-reader")
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Deque[WriteOp] = deque()
+        self._seq = 0
+        # Even while idle, odd while a batch commit is running
+        self._epoch = 0
+        self._commit_lock = asyncio.Lock()
+
+    # ----- Lifecycle -----
+
+    async def start(self) -> None:
+        """
+        Start the background flusher and load the conversation/message
+        counters. Called from the app startup hook.
+        """
+        if self._task is None:
+            conversations, messages = await self._run_read(self._count_rows)
+            CONVERSATIONS.set(conversations)
+            MESSAGES.set(messages)
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._flusher())
+            logger.info(
+                f"Storage flusher started (batch_size={self.batch_size}, "
+                f"flush_interval={self.flush_interval * 1000:.0f}ms)"
+            )
+
+    async def stop(self) -> None:
+        """Flush outstanding writes and stop the flusher."""
+        if self._task is None:
+            return
+        await self.flush()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        logger.info("Storage flusher stopped")
+
+    async def flush(self) -> None:
+        """Wait until every write queued so far has been committed."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    # ----- Writes -----
+
+    def _enqueue(self, kind: str, conversation_id: str, data: Optional[Dict[str, Any]] = None) -> None:
+        if self._queue is None:
+            raise RuntimeError("ChatStore.start() must be called before writing")
+        self._seq += 1
+        op = WriteOp(self._seq, kind, conversation_id, dict(data or {}))
+        self._pending.append(op)
+        self._queue.put_nowait(op)
+
+    async def create_conversation(self, conversation: Dict[str, Any]) -> None:
+        """Queue a new conversation."""
+        conversation = {"version": 1, "modified_at": conversation["created_at"], **conversation}
+        self._enqueue("create_conversation", conversation["id"], conversation)
+        CONVERSATIONS.inc()
+
+    async def update_conversation(self, conversation_id: str, **fields: Any) -> None:
+        """Queue a partial update of a conversation (e.g. default_model, updated_at)."""
+        self._enqueue("update_conversation", conversation_id, fields)
+
+    async def delete_conversation(self, conversation_id: str) -> None:
+        """Queue deletion of a conversation and its messages."""
+        messages = await self.get_messages(conversation_id)
+        self._enqueue("delete_conversation", conversation_id)
+        if messages is not None:
+            CONVERSATIONS.dec()
+            MESSAGES.dec(len(messages))
+
+    async def add_message(self, conversation_id: str, message: Dict[str, Any]) -> None:
+        """Queue a message; the conversation's updated_at follows the message timestamp."""
+        self._enqueue("add_message", conversation_id, message)
+        MESSAGES.inc()
+
+    async def update_message(self, conversation_id: str, message_id: str, **fields: Any) -> None:
+        """Queue a partial update of a message (e.g. content and status of a streaming answer)."""
+        self._enqueue("update_message", conversation_id, {**fields, "id": message_id})
+
+    async def delete_message(self, conversation_id: str, message_id: str) -> None:
+        """Queue deletion of a message (e.g. a cancelled answer that should not be kept)."""
+        self._enqueue("delete_message", conversation_id, {"id": message_id})
+        MESSAGES.dec()
+
+    async def add_response(
+        self,
+        record: Dict[str, Any],
+        conversation_id: str = "",
+        message_id: Optional[str] = None,
+    ) -> None:
+        """
+        Queue generation metrics (a ``Response`` row, see GenerationStats.to_record).
+
+        Args:
+            record: Response column values
+            conversation_id: Conversation the generated message belongs to
+            message_id: Public id of the assistant message, or None for
+                        generations that were not stored as a message
+        """
+        self._enqueue("add_response", conversation_id, {**record, "message_id": message_id})
+
+    # ----- Reads -----
+
+    async def get_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Return a conversation dict, or None if it does not exist."""
+        conversation, ops = await self._read(self._load_conversation, conversation_id)
+        for op in ops:
+            if op.conversation_id == conversation_id:
+                conversation = _apply_to_conversation(conversation, op)
+        return conversation
+
+    async def list_conversations(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        user_id: Optional[int] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Return one page of a user's conversations, most recently updated first.
+
+        Pages are keyset-paginated on (updated_at, id), so each page is an
+        index range scan no matter how deep it is.
+
+        Args:
+            limit: Page size
+            cursor: ``next_cursor`` of the previous page, or None for the first page
+            user_id: Owner of the conversations (None: anonymous conversations,
+                     which is every conversation the API creates)
+
+        Returns:
+            Tuple[List[Dict], Optional[str]]: Conversations with a
+            ``message_count`` field, and the cursor of the next page (None on
+            the last page)
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        after = decode_cursor(cursor) if cursor else None
+        rows, ops = await self._read(
+            self._load_conversation_page, limit + 1, after, user_id, with_pending=True
+        )
+        by_id = {conv["id"]: conv for conv in rows}
+        for op in ops:
+            conversation = _apply_to_conversation(by_id.get(op.conversation_id), op)
+            if conversation is None or (op.kind == "create_conversation" and user_id is not None):
+                by_id.pop(op.conversation_id, None)
+                continue
+            conversation.setdefault("message_count", 0)
+            if op.kind == "add_message":
+                conversation["message_count"] += 1
+            elif op.kind == "delete_message":
+                conversation["message_count"] -= 1
+            by_id[op.conversation_id] = conversation
+
+        # Pending writes may have moved conversations into or out of this page
+        def key(conv: Dict[str, Any]) -> Cursor:
+            return conv["updated_at"], conv["id"]
+
+        page = sorted(
+            (conv for conv in by_id.values() if after is None or key(conv) < after),
+            key=key,
+            reverse=True,
+        )
+        next_cursor = encode_cursor(*key(page[limit - 1])) if len(page) > limit else None
+        return page[:limit], next_cursor
+
+    async def get_messages(self, conversation_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Return the messages of a conversation in order, or None if it does not exist."""
+        result, ops = await self._read(self._load_messages, conversation_id)
+        conversation, messages = result
+        for op in ops:
+            if op.conversation_id != conversation_id:
+                continue
+            conversation = _apply_to_conversation(conversation, op)
+            if op.kind == "create_conversation":
+                messages = []
+            elif op.kind == "delete_conversation":
+                messages = None
+            elif op.kind == "add_message" and messages is not None:
+                messages.append(dict(op.data))
+            elif op.kind in ("update_message", "delete_message") and messages is not None:
+                _apply_to_messages(messages, op)
+        return messages if conversation is not None else None
+
+    async def get_message_page(
+        self,
+        conversation_id: str,
+        limit: int,
+        cursor: Optional[str] = None,
+    ) -> Optional[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        """
+        Return one page of a conversation's messages, oldest first.
+
+        Pages are keyset-paginated on (timestamp, id) using the
+        (conversation_id, created_at) index.
+
+        Args:
+            conversation_id: Conversation to read
+            limit: Page size
+            cursor: ``next_cursor`` of the previous page, or None for the first page
+
+        Returns:
+            Tuple[List[Dict], Optional[str]]: The messages and the cursor of the
+            next page (None on the last page), or None if the conversation
+            does not exist
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        after = decode_cursor(cursor) if cursor else None
+        result, ops = await self._read(self._load_message_page, conversation_id, limit + 1, after)
+        conversation, messages = result
+        for op in ops:
+            if op.conversation_id != conversation_id:
+                continue
+            conversation = _apply_to_conversation(conversation, op)
+            if op.kind == "create_conversation":
+                messages = []
+            elif op.kind == "delete_conversation":
+                messages = None
+            elif op.kind == "add_message" and messages is not None:
+                messages.append(dict(op.data))
+            elif op.kind in ("update_message", "delete_message") and messages is not None:
+                _apply_to_messages(messages, op)
+        if conversation is None:
+            return None
+
+        def key(message: Dict[str, Any]) -> Cursor:
+            return message["timestamp"], message["id"]
+
+        page = sorted(
+            (message for message in messages if after is None or key(message) > after),
+            key=key,
+        )
+        next_cursor = encode_cursor(*key(page[limit - 1])) if len(page) > limit else None
+        return page[:limit], next_cursor
+
+    async def get_stats(self) -> Dict[str, int]:
+        """Count conversations and messages (from the metrics gauges, no query)."""
+        return {
+            "conversations": int(CONVERSATIONS.value()),
+            "total_messages": int(MESSAGES.value()),
+        }
+
+    async def get_generations(self, since: datetime, model: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Return the generation metrics recorded since a point in time.
+
+        Metrics still waiting in the write-behind queue are not included.
+
+        Args:
+            since: Oldest creation time (UTC) to include
+            model: Only return generations by this model
+
+        Returns:
+            List[Dict]: Response columns and ``created_at``, oldest first
+        """
+        return await self._run_read(self._load_generations, since, model)
+
+    async def _read(self, loader: Callable, *args: Any, with_pending: bool = False):
+        """
+        Run a database read on a reader thread and return it together with the
+        pending writes that are not yet visible in it.
+
+        The snapshot is only consistent if no batch committed while the query
+        ran, which the commit epoch tells us; otherwise the read is retried.
+        With ``with_pending`` the loader also receives the pending writes, so
+        it can load the rows they touch.
+        """
+        for _ in range(_READ_ATTEMPTS):
+            epoch = self._epoch
+            ops = list(self._pending)
+            result = await self._run_read(loader, *args, *([ops] if with_pending else []))
+            if epoch == self._epoch and epoch % 2 == 0:
+                return result, ops
+            await asyncio.sleep(0)
+        # Commits keep racing us: hold them off for one read
+        async with self._commit_lock:
+            ops = list(self._pending)
+            return await self._run_read(loader, *args, *([ops] if with_pending else [])), ops
+
+    def _run_read(self, fn: Callable, *args: Any) -> "asyncio.Future":
+        return asyncio.get_running_loop().run_in_executor(self._readers, functools.partial(fn, *args))
+
+    def _run_write(self, fn: Callable, *args: Any) -> "asyncio.Future":
+        return asyncio.get_running_loop().run_in_executor(self._writer, functools.partial(fn, *args))
+
+    @contextmanager
+    def _session(self, write: bool = False) -> Iterator[Session]:
+        """Open a reader (or the writer) session and check out its connection, timing the pool wait."""
+        factory = self._session_factory if write else self._read_session_factory
+        with factory() as session:
+            with DB_SESSION_WAIT.time(engine="writer" if write else "reader"):
+                session.connection()
+            yield session
+
+    def _count_rows(self):
+        with self._session() as session:
+            conversations = session.scalar(select(func.count(ConversationRecord.id)))
+            messages = session.scalar(select(func.count(MessageRecord.id)))
+            return conversations, messages
+
+    def _load_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        with self._session() as session:
+            record = session.execute(
+                select(ConversationRecord).where(ConversationRecord.uuid == conversation_id)
+            ).scalar_one_or_none()
+            return _conversation_to_dict(record) if record else None
+
+    def _load_conversation_page(
+        self,
+        limit: int,
+        after: Optional[Cursor],
+        user_id: Optional[int],
+        ops: List[WriteOp],
+    ) -> List[Dict[str, Any]]:
+        owner = (
+            ConversationRecord.user_id.is_(None) if user_id is None
+            else ConversationRecord.user_id == user_id
+        )
+        query = select(ConversationRecord).where(owner)
+        if after is not None:
+            updated_at, uuid = after
+            query = query.where(or_(
+                ConversationRecord.updated_at < updated_at,
+                and_(ConversationRecord.updated_at == updated_at, ConversationRecord.uuid < uuid),
+            ))
+        query = query.order_by(ConversationRecord.updated_at.desc(), ConversationRecord.uuid.desc())
+
+        with self._session() as session:
+            records = list(session.execute(query.limit(limit)).scalars())
+            # Conversations with pending writes may belong in this page too
+            touched = {op.conversation_id for op in ops} - {record.uuid for record in records}
+            if touched:
+                records.extend(session.execute(
+                    select(ConversationRecord).where(owner, ConversationRecord.uuid.in_(touched))
+                ).scalars())
+            if not records:
+                return []
+            counts = dict(session.execute(
+                select(MessageRecord.conversation_id, func.count(MessageRecord.id))
+                .where(MessageRecord.conversation_id.in_([record.id for record in records]))
+                .group_by(MessageRecord.conversation_id)
+            ).all())
+            return [
+                {**_conversation_to_dict(record), "message_count": counts.get(record.id, 0)}
+                for record in records
+            ]
+
+    def _load_messages(self, conversation_id: str):
+        with self._session() as session:
+            record = session.execute(
+                select(ConversationRecord).where(ConversationRecord.uuid == conversation_id)
+            ).scalar_one_or_none()
+            if record is None:
+                return None, None
+            messages = session.execute(
+                select(MessageRecord)
+                .where(MessageRecord.conversation_id == record.id)
+                .order_by(MessageRecord.created_at, MessageRecord.id)
+            ).scalars().all()
+            return _conversation_to_dict(record), [_message_to_dict(m) for m in messages]
+
+    def _load_message_page(self, conversation_id: str, limit: int, after: Optional[Cursor]):
+        with self._session() as session:
+            record = session.execute(
+                select(ConversationRecord).where(ConversationRecord.uuid == conversation_id)
+            ).scalar_one_or_none()
+            if record is None:
+                return None, None
+            query = select(MessageRecord).where(MessageRecord.conversation_id == record.id)
+            if after is not None:
+                created_at, uuid = after
+                query = query.where(or_(
+                    MessageRecord.created_at > created_at,
+                    and_(MessageRecord.created_at == created_at, MessageRecord.uuid > uuid),
+                ))
+            messages = session.execute(
+                query.order_by(MessageRecord.created_at, MessageRecord.uuid).limit(limit)
+            ).scalars().all()
+            return _conversation_to_dict(record), [_message_to_dict(m) for m in messages]
+
+    def _load_generations(self, since: datetime, model: Optional[str]) -> List[Dict[str, Any]]:
+        columns = [
+            ResponseRecord.model_used,
+            ResponseRecord.tokens_prompt,
+            ResponseRecord.tokens_completion,
+            ResponseRecord.tokens_total,
+            ResponseRecord.usage_estimated,
+            ResponseRecord.completion_time_ms,
+            ResponseRecord.ttft_ms,
+            ResponseRecord.chunk_count,
+            ResponseRecord.inter_chunk_p50_ms,
+            ResponseRecord.inter_chunk_p95_ms,
+            ResponseRecord.inter_chunk_p99_ms,
+            ResponseRecord.streamed,
+            ResponseRecord.created_at,
+        ]
+        query = select(*columns).where(ResponseRecord.created_at >= since)
+        if model:
+            query = query.where(ResponseRecord.model_used == model)
+        with self._session() as session:
+            rows = session.execute(query.order_by(ResponseRecord.created_at)).all()
+            return [dict(row._mapping) for row in rows]
+
+    # ----- Flushing -----
+
+    async def _flusher(self) -> None:
+        """Collect writes into batches and commit them off the event loop."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._commit(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _commit(self, batch: List[WriteOp]) -> None:
+        """Commit a batch, retrying transient errors and isolating bad writes."""
+        async with self._commit_lock:
+            while True:
+                self._epoch += 1
+                try:
+                    await self._run_write(self._apply_batch, batch)
+                    break
+                except OperationalError as e:
+                    logger.error(f"Storage flush failed, retrying in {STORAGE_RETRY_DELAY}s: {e}")
+                    self._epoch += 1
+                    await asyncio.sleep(STORAGE_RETRY_DELAY)
+                except Exception as e:
+                    logger.error(f"Storage batch of {len(batch)} writes failed, applying one by one: {e}")
+                    for op in batch:
+                        try:
+                            await self._run_write(self._apply_batch, [op])
+                        except Exception as op_error:
+                            logger.error(f"Dropping write {op.kind} for {op.conversation_id}: {op_error}")
+                    break
+            last_seq = batch[-1].seq
+            while self._pending and self._pending[0].seq <= last_seq:
+                self._pending.popleft()
+            self._epoch += 1
+        logger.debug(f"Flushed {len(batch)} writes")
+
+    def _apply_batch(self, batch: List[WriteOp]) -> None:
+        """Apply a batch of writes in a single transaction (runs on the writer thread)."""
+        with self._session(write=True) as session:
+            records: Dict[str, Optional[ConversationRecord]] = {}
+            message_records: Dict[str, MessageRecord] = {}
+
+            def conversation(uuid: str) -> Optional[ConversationRecord]:
+                if uuid not in records:
+                    records[uuid] = session.execute(
+                        select(ConversationRecord).where(ConversationRecord.uuid == uuid)
+                    ).scalar_one_or_none()
+                return records[uuid]
+
+            def touch(op: WriteOp) -> Optional[ConversationRecord]:
+                # Mirrors _apply_to_conversation: one version per write
+                record = conversation(op.conversation_id)
+                if record is not None:
+                    record.version = (record.version or 1) + 1
+                    record.modified_at = op.at
+                return record
+
+            for op in batch:
+                data = op.data
+                if op.kind == "create_conversation":
+                    record = ConversationRecord(
+                        uuid=op.conversation_id,
+                        default_model=data["default_model"],
+                        created_at=data["created_at"],
+                        updated_at=data["updated_at"],
+                        version=data["version"],
+                        modified_at=data["modified_at"],
+                    )
+                    session.add(record)
+                    records[op.conversation_id] = record
+                elif op.kind == "update_conversation":
+                    record = touch(op)
+                    if record is not None:
+                        for key, value in data.items():
+                            setattr(record, key, value)
+                elif op.kind == "delete_conversation":
+                    record = conversation(op.conversation_id)
+                    if record is not None:
+                        if inspect(record).pending:
+                            # Created earlier in this same batch: just drop it
+                            session.expunge(record)
+                        else:
+                            session.delete(record)
+                        records[op.conversation_id] = None
+                elif op.kind == "add_message":
+                    record = touch(op)
+                    if record is None:
+                        continue
+                    message = MessageRecord(
+                        uuid=data["id"],
+                        conversation=record,
+                        role=data["role"],
+                        content=data["content"],
+                        model=data.get("model"),
+                        status=data.get("status", "complete"),
+                        created_at=data["timestamp"],
+                    )
+                    session.add(message)
+                    message_records[data["id"]] = message
+                    record.updated_at = data["timestamp"]
+                elif op.kind == "update_message":
+                    touch(op)
+                    message = message_records.get(data["id"])
+                    if message is None:
+                        message = session.execute(
+                            select(MessageRecord).where(MessageRecord.uuid == data["id"])
+                        ).scalar_one_or_none()
+                    if message is None:
+                        continue
+                    message_records[data["id"]] = message
+                    for key, value in data.items():
+                        if key != "id":
+                            setattr(message, key, value)
+                elif op.kind == "delete_message":
+                    touch(op)
+                    message = message_records.pop(data["id"], None)
+                    if message is None:
+                        message = session.execute(
+                            select(MessageRecord).where(MessageRecord.uuid == data["id"])
+                        ).scalar_one_or_none()
+                    if message is None:
+                        continue
+                    if inspect(message).pending:
+                        # Added earlier in this same batch: detach it (delete-orphan
+                        # cascade drops it from the session) instead of inserting it
+                        message.conversation = None
+                        if message in session:
+                            session.expunge(message)
+                    else:
+                        session.delete(message)
+                elif op.kind == "add_response":
+                    fields = {key: value for key, value in data.items() if key != "message_id"}
+                    response = ResponseRecord(**fields)
+                    if data["message_id"] is not None:
+                        message = message_records.get(data["message_id"])
+                        if message is None:
+                            message = session.execute(
+                                select(MessageRecord).where(MessageRecord.uuid == data["message_id"])
+                            ).scalar_one_or_none()
+                        if message is None:
+                            continue
+                        response.message = message
+                    session.add(response)
+            session.commit()
+
+
+# ===== Helpers =====
+
+def encode_cursor(timestamp: datetime, item_id: str) -> str:
+    """Opaque page cursor for the item at (timestamp, id)."""
+    raw = f"{timestamp.isoformat()}|{item_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """
+    Parse a cursor made by encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        timestamp, item_id = raw.split("|", 1)
+        return datetime.fromisoformat(timestamp), item_id
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def _conversation_to_dict(record: ConversationRecord) -> Dict[str, Any]:
+    return {
+        "id": record.uuid,
+        "default_model": record.default_model,
+        "created_at": record.created_at,
+        "updated_at": record.updated_at,
+        "version": record.version or 1,
+        "modified_at": record.modified_at or record.updated_at,
+    }
+
+
+def _message_to_dict(record: MessageRecord) -> Dict[str, Any]:
+    return {
+        "id": record.uuid,
+        "role": record.role,
+        "content": record.content,
+        "model": record.model,
+        "status": record.status,
+        "timestamp": record.created_at,
+    }
+
+
+def _apply_to_messages(messages: List[Dict[str, Any]], op: WriteOp) -> None:
+    """Replay a pending message update or deletion on a loaded message list."""
+    # The message being changed is almost always the newest one
+    for index in range(len(messages) - 1, -1, -1):
+        if messages[index]["id"] == op.data["id"]:
+            if op.kind == "delete_message":
+                del messages[index]
+            else:
+                messages[index].update(op.data)
+            return
+
+
+def _apply_to_conversation(conversation: Optional[Dict[str, Any]], op: WriteOp) -> Optional[Dict[str, Any]]:
+    """Replay one pending write on a conversation dict (None means it does not exist)."""
+    if op.kind == "create_conversation":
+        return dict(op.data) if conversation is None else conversation
+    if op.kind == "delete_conversation" or conversation is None:
+        return None
+    if op.kind == "add_response":
+        return conversation
+    conversation = dict(conversation)
+    if op.kind == "update_conversation":
+        conversation.update(op.data)
+    elif op.kind == "add_message":
+        conversation["updated_at"] = op.data["timestamp"]
+    conversation["version"] = conversation.get("version", 1) + 1
+    conversation["modified_at"] = op.at
+    return conversation
+
+
+# Process-wide store used by the API
+chat_store = ChatStore()
@@ -0,0 +1,240 @@
+"""
+Generation telemetry
+Per-generation latency and token measurements (time to first token, total
+duration, inter-chunk latency, usage) and their aggregation by model
+"""
+import math
+import time
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from .context import estimate_tokens
+from .metrics import UPSTREAM_DURATION, UPSTREAM_TTFT
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """
+    Nearest-rank percentile of a list of values.
+
+    Args:
+        values: Samples, in any order
+        pct: Percentile between 0 and 100
+
+    Returns:
+        float: The percentile, or None for an empty list
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = math.ceil(pct / 100 * len(ordered))
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+def _ms(seconds: Optional[float]) -> Optional[int]:
+    return None if seconds is None else int(round(seconds * 1000))
+
+
+class GenerationStats:
+    """
+    Timing and usage of one upstream generation.
+
+    The OpenRouter service fills this in as the response arrives: ``start``
+    before the request is sent, ``on_chunk`` for every content delta,
+    ``on_usage`` when the upstream reports token counts and ``finish`` when
+    the response ends. ``to_record`` turns it into a ``Response`` row.
+    """
+
+    def __init__(self, model: str, streamed: bool = True):
+        self.model = model
+        self.streamed = streamed
+        self.cached = False
+        self.started_at: Optional[float] = None
+        self.first_chunk_at: Optional[float] = None
+        self.last_chunk_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.chunk_count = 0
+        self.completion_chars = 0
+        # Seconds between consecutive content chunks
+        self.gaps: List[float] = []
+        self.usage: Optional[Dict[str, int]] = None
+        self.prompt_texts: Optional[List[str]] = None
+
+    def start(self, messages: List[Dict[str, str]]) -> None:
+        """Mark the request as sent."""
+        self.started_at = time.monotonic()
+        self.prompt_texts = [message["content"] for message in messages]
+
+    def on_chunk(self, content: str) -> None:
+        """Record the arrival of a content delta."""
+        now = time.monotonic()
+        if self.first_chunk_at is None:
+            self.first_chunk_at = now
+            if self.streamed and self.started_at is not None:
+                UPSTREAM_TTFT.observe(now - self.started_at, model=self.model)
+        else:
+            self.gaps.append(now - self.last_chunk_at)
+        self.last_chunk_at = now
+        self.chunk_count += 1
+        self.completion_chars += len(content)
+
+    def on_usage(self, usage: Dict[str, Any]) -> None:
+        """Record the token counts reported by the upstream."""
+        self.usage = {
+            key: int(usage[key])
+            for key in ("prompt_tokens", "completion_tokens", "total_tokens")
+            if usage.get(key) is not None
+        }
+
+    def finish(self) -> None:
+        """Mark the response as complete (the first call wins)."""
+        if self.finished_at is None:
+            self.finished_at = time.monotonic()
+            if self.started_at is not None:
+                UPSTREAM_DURATION.observe(self.finished_at - self.started_at, model=self.model)
+
+    def adopt(self, other: "GenerationStats") -> None:
+        """
+        Take over the measurements of another request, the winner of a hedged
+        call. The start time stays this request's, so time to first token and
+        duration include the wait before the hedge.
+        """
+        self.model = other.model
+        self.first_chunk_at = other.first_chunk_at
+        self.last_chunk_at = other.last_chunk_at
+        self.finished_at = other.finished_at
+        self.chunk_count = other.chunk_count
+        self.completion_chars = other.completion_chars
+        self.gaps = other.gaps
+        self.usage = other.usage
+
+    @property
+    def ttft_ms(self) -> Optional[int]:
+        if self.started_at is None or self.first_chunk_at is None:
+            return None
+        return _ms(self.first_chunk_at - self.started_at)
+
+    @property
+    def duration_ms(self) -> Optional[int]:
+        if self.started_at is None:
+            return None
+        end = self.finished_at or self.last_chunk_at or time.monotonic()
+        return _ms(end - self.started_at)
+
+    def to_record(self) -> Dict[str, Any]:
+        """
+        Column values for a ``Response`` row.
+
+        Token counts come from the upstream usage report when there was one;
+        otherwise they are estimated from the prompt and the generated text.
+        """
+        usage = dict(self.usage or {})
+        estimated = "prompt_tokens" not in usage or "completion_tokens" not in usage
+        if "prompt_tokens" not in usage:
+            usage["prompt_tokens"] = sum(estimate_tokens(text) for text in self.prompt_texts or [])
+        if "completion_tokens" not in usage:
+            usage["completion_tokens"] = (self.completion_chars + 3) // 4
+        usage.setdefault("total_tokens", usage["prompt_tokens"] + usage["completion_tokens"])
+
+        return {
+            "model_used": self.model,
+            "tokens_prompt": usage["prompt_tokens"],
+            "tokens_completion": usage["completion_tokens"],
+            "tokens_total": usage["total_tokens"],
+            "usage_estimated": estimated,
+            "completion_time_ms": self.duration_ms,
+            "ttft_ms": self.ttft_ms,
+            "chunk_count": self.chunk_count,
+            "inter_chunk_p50_ms": _ms(percentile(self.gaps, 50)),
+            "inter_chunk_p95_ms": _ms(percentile(self.gaps, 95)),
+            "inter_chunk_p99_ms": _ms(percentile(self.gaps, 99)),
+            "streamed": self.streamed,
+        }
+
+
+class CompletionLengths:
+    """
+    Exponentially weighted mean of completion tokens per model, used to
+    estimate how much of an answer was still to come when it was cancelled.
+    """
+
+    def __init__(self, alpha: float = 0.1):
+        self.alpha = alpha
+        self._means: Dict[str, float] = {}
+
+    def observe(self, model: str, tokens: int) -> None:
+        """Record the length of a completed answer."""
+        mean = self._means.get(model)
+        self._means[model] = tokens if mean is None else mean + self.alpha * (tokens - mean)
+
+    def remaining(self, model: str, generated: int) -> int:
+        """
+        Estimated tokens an unfinished answer would still have produced.
+
+        Returns 0 until the model has completed at least one answer.
+        """
+        mean = self._means.get(model)
+        if mean is None:
+            return 0
+        return max(0, int(round(mean - generated)))
+
+
+# Process-wide completion lengths, fed by completed streams
+completion_lengths = CompletionLengths()
+
+
+def _summarize(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Aggregate a group of generation rows."""
+    ttft = [row["ttft_ms"] for row in rows if row["ttft_ms"] is not None]
+    duration = [row["completion_time_ms"] for row in rows if row["completion_time_ms"] is not None]
+    gaps_p95 = [row["inter_chunk_p95_ms"] for row in rows if row["inter_chunk_p95_ms"] is not None]
+    tokens_completion = sum(row["tokens_completion"] or 0 for row in rows)
+    total_seconds = sum(duration) / 1000
+    return {
+        "generations": len(rows),
+        "ttft_ms": {"p50": percentile(ttft, 50), "p95": percentile(ttft, 95), "p99": percentile(ttft, 99)},
+        "duration_ms": {"p50": percentile(duration, 50), "p95": percentile(duration, 95), "p99": percentile(duration, 99)},
+        "inter_chunk_p95_ms": {"p50": percentile(gaps_p95, 50), "max": max(gaps_p95) if gaps_p95 else None},
+        "tokens_prompt": sum(row["tokens_prompt"] or 0 for row in rows),
+        "tokens_completion": tokens_completion,
+        "tokens_per_second": round(tokens_completion / total_seconds, 2) if total_seconds else None,
+        "estimated_usage": sum(1 for row in rows if row["usage_estimated"]),
+    }
+
+
+def aggregate_generations(
+    rows: List[Dict[str, Any]],
+    bucket_minutes: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Group generation rows by model (and optionally by time bucket) and
+    summarize each group.
+
+    Args:
+        rows: Dicts with the Response columns plus ``created_at``
+        bucket_minutes: Width of the time buckets, or None for one group per model
+
+    Returns:
+        List[Dict]: One summary per group, ordered by model then bucket
+    """
+    groups: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
+    for row in rows:
+        bucket = None
+        if bucket_minutes:
+            # created_at is naive UTC; bucket on seconds since the epoch
+            offset = (row["created_at"] - _EPOCH).total_seconds() % (bucket_minutes * 60)
+            bucket = (row["created_at"] - timedelta(seconds=offset)).isoformat()
+        groups[(row["model_used"], bucket)].append(row)
+
+    summaries = []
+    for (model, bucket), group in sorted(groups.items(), key=lambda item: (item[0][0], item[0][1] or "")):
+        summary = {"model": model, **_summarize(group)}
+        if bucket_minutes:
+            summary["bucket_start"] = bucket
+        summaries.append(summary)
+    return summaries
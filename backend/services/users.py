@@ -0,0 +1,126 @@
+"""
+User cache
+Bounded, TTL'd in-process cache of user rows for the authenticated request
+path, with negative caching of unknown ids and invalidation on ORM updates
+"""
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from database import AsyncSessionLocal
+from models import User
+from .metrics import CACHE_REQUESTS
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+USER_CACHE_ENABLED = os.getenv("USER_CACHE_ENABLED", "true").lower() == "true"
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 300))
+# Unknown ids are remembered for a shorter time
+USER_CACHE_NEGATIVE_TTL = float(os.getenv("USER_CACHE_NEGATIVE_TTL", 30))
+
+
+def _user_to_dict(user: User) -> Dict[str, Any]:
+    return {
+        "id": user.id,
+        "name": user.name,
+        "email": user.email,
+        "is_active": user.is_active,
+    }
+
+
+class UserCache:
+    """
+    LRU of user snapshots keyed by id.
+
+    Entries expire after ``ttl`` seconds (``negative_ttl`` for ids that do not
+    exist). Changes made through the ORM in this process invalidate the entry
+    right away (see the mapper events below); changes made elsewhere (another
+    worker, raw SQL) are picked up when the entry expires.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable = AsyncSessionLocal,
+        enabled: bool = USER_CACHE_ENABLED,
+        max_entries: int = USER_CACHE_SIZE,
+        ttl: float = USER_CACHE_TTL,
+        negative_ttl: float = USER_CACHE_NEGATIVE_TTL,
+    ):
+        self._session_factory = session_factory
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # user id -> (user dict or None if unknown, expires at (monotonic))
+        self._entries: "OrderedDict[int, Tuple[Optional[Dict[str, Any]], float]]" = OrderedDict()
+
+    async def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Return a user as a dict (id, name, email, is_active), or None if there
+        is no such user.
+        """
+        if not self.enabled:
+            return await self._load(user_id)
+
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            user, expires_at = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(user_id)
+                CACHE_REQUESTS.inc(cache="users", result="hit")
+                return user
+            del self._entries[user_id]
+        CACHE_REQUESTS.inc(cache="users", result="miss")
+
+        user = await self._load(user_id)
+        ttl = self.ttl if user is not None else self.negative_ttl
+        self._entries[user_id] = (user, time.monotonic() + ttl)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id: int) -> None:
+        """Drop a user's entry (called when the row changes)."""
+        self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def _load(self, user_id: int) -> Optional[Dict[str, Any]]:
+        async with self._session_factory() as db:
+            user = await db.get(User, user_id)
+            return _user_to_dict(user) if user is not None else None
+
+
+# Process-wide cache used by the auth endpoints
+user_cache = UserCache()
+
+
+@event.listens_for(User, "after_insert")
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_user(mapper, connection, target: User) -> None:
+    # Inserts matter too: the new id may have been negatively cached
+    user_cache.invalidate(target.id)
+    # A lookup between this flush and the commit would cache the old row
+    # again, so invalidate once more after the commit
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_user_ids", set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session: Session) -> None:
+    for user_id in session.info.pop("changed_user_ids", ()):
+        user_cache.invalidate(user_id)
@@ -7,6 +7,7 @@ export interface StreamMessage {
   messageId?: string
   model?: string
   error?: string
+  snapshot?: string
 }
 
 export interface UseChatStreamOptions {
@@ -123,6 +124,10 @@ export function useChatStream({
 
       // Handle connection errors
       eventSource.onerror = (err) => {
+        // EventSource retries on its own and resumes with Last-Event-ID
+        if (eventSource.readyState === EventSource.CONNECTING) {
+          return
+        }
         console.error('EventSource error:', err)
         const errorMessage = 'Connection to server lost'
         errorRef.current = errorMessage
@@ -82,7 +82,20 @@ export default function Chat() {
         try {
           const data = JSON.parse(event.data)
 
-          if (data.content) {
+          if (data.snapshot !== undefined) {
+            // Reconnected after the missed chunks left the server's replay buffer
+            fullResponse = data.snapshot
+            setStreamingMessage({
+              ...tempMessage,
+              content: fullResponse,
+            })
+          } else if (data.queue_position !== undefined) {
+            // Waiting for an upstream slot on the server
+            setStreamingMessage({
+              ...tempMessage,
+              content: `Waiting in queue (position ${data.queue_position})...`,
+            })
+          } else if (data.content) {
             fullResponse += data.content
             setStreamingMessage({
               ...tempMessage,
@@ -115,6 +128,10 @@ export default function Chat() {
       }
 
       eventSource.onerror = () => {
+        // EventSource retries on its own and resumes with Last-Event-ID
+        if (eventSource.readyState === EventSource.CONNECTING) {
+          return
+        }
         setError('Connection to server lost')
         setStreamingMessage(null)
         setIsStreaming(false)
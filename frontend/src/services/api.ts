@@ -19,6 +19,15 @@ export interface Model {
   }
 }
 
+export interface ModelQuery {
+  provider?: string
+  modality?: string
+  min_context?: number
+  q?: string
+  sort?: 'id' | 'name' | 'context_length' | 'created'
+  order?: 'asc' | 'desc'
+}
+
 export interface Conversation {
   id: string
   default_model: string
@@ -31,9 +40,22 @@ export interface Message {
   role: 'user' | 'assistant'
   content: string
   model?: string
+  status?: 'partial' | 'complete'
   timestamp: string
 }
 
+// Listings are paginated; follow next_cursor until the last page
+async function fetchAllPages<T>(url: string, key: string): Promise<T[]> {
+  const items: T[] = []
+  let cursor: string | null = null
+  do {
+    const response: { data: any } = await api.get(url, { params: cursor ? { cursor } : {} })
+    items.push(...(response.data[key] || []))
+    cursor = response.data.next_cursor ?? null
+  } while (cursor)
+  return items
+}
+
 export interface CreateConversationRequest {
   default_model?: string
 }
@@ -51,9 +73,9 @@ export const apiService = {
     return response.data
   },
 
-  // Get available models
-  async getModels(): Promise<{ models: Model[]; cached: boolean }> {
-    const response = await api.get('/models')
+  // Get available models, optionally filtered/sorted on the server
+  async getModels(params?: ModelQuery): Promise<{ models: Model[]; cached: boolean }> {
+    const response = await api.get('/models', { params })
     return response.data
   },
 
@@ -69,10 +91,9 @@ export const apiService = {
     return response.data
   },
 
-  // List all conversations
+  // List all conversations (most recently updated first)
   async listConversations(): Promise<{ conversations: Conversation[] }> {
-    const response = await api.get('/conversations')
-    return response.data
+    return { conversations: await fetchAllPages<Conversation>('/conversations', 'conversations') }
   },
 
   // Update conversation
@@ -89,8 +110,7 @@ export const apiService = {
 
   // Get messages
   async getMessages(conversationId: string): Promise<{ messages: Message[] }> {
-    const response = await api.get(`/conversations/${conversationId}/messages`)
-    return response.data
+    return { messages: await fetchAllPages<Message>(`/conversations/${conversationId}/messages`, 'messages') }
   },
 
   // Stream response (returns EventSource-compatible URL)